@@ -0,0 +1,60 @@
+"""Time handing a library of 30k licenses (about 63k apps) to Galaxy through GamesCache.get_owned_games, and how long
+the event loop is kept from everything else meanwhile, as seen by a ticker that wakes up every millisecond.
+
+The library is the one benchmarks/games_cache_scaling.py imports.
+
+Run from the repository root: python benchmarks/games_cache_consume.py [--licenses N] [--rounds N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from games_cache_scaling import full_import, library, steam_licenses  # noqa: E402
+
+
+async def ticker(stalls: list):
+    last = time.perf_counter()
+    while True:
+        await asyncio.sleep(0.001)
+        now = time.perf_counter()
+        stalls.append(now - last)
+        last = now
+
+
+async def consume(cache):
+    stalls = []
+    ticker_task = asyncio.ensure_future(ticker(stalls))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    games = 0
+    async for _ in cache.get_owned_games():
+        games += 1
+    elapsed = time.perf_counter() - start
+    ticker_task.cancel()
+    return games, elapsed, max(stalls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--licenses", type=int, default=30000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    packages, apps = library(args.licenses)
+    cache = full_import(steam_licenses(args.licenses), packages, apps)
+
+    results = [loop.run_until_complete(consume(cache)) for _ in range(args.rounds)]
+    games, elapsed, stall = min(results, key=lambda result: result[1])
+    print(f"{args.licenses} licenses, {games} games")
+    print(f"  get_owned_games {elapsed * 1000:8.1f}ms, longest loop stall {stall * 1000:6.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Measure how much memory the games cache holds on to for a library of 30k licenses (about 63k apps) once imported
+and handed to Galaxy, as tracemalloc sees it: everything allocated while building it that is still alive afterwards.
+
+The library is the one benchmarks/games_cache_scaling.py imports.
+
+Run from the repository root: python benchmarks/games_cache_memory.py [--licenses N]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from games_cache_scaling import full_import, library, steam_licenses  # noqa: E402
+
+
+async def hand_to_galaxy(cache):
+    cache.add_game_lever = True
+    async for _ in cache.get_owned_games():
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--licenses", type=int, default=30000)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    tracemalloc.start()
+    #the PICS records go away once applied, but titles and such live on in the cache
+    packages, apps = library(args.licenses)
+    licenses = steam_licenses(args.licenses)
+    cache = full_import(licenses, packages, apps)
+    loop.run_until_complete(hand_to_galaxy(cache))
+    del packages, apps, licenses
+    gc.collect()
+    resident, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{args.licenses} licenses, {cache.apps_count} apps")
+    print(f"  resident {resident / 2 ** 20:6.2f}MB ({resident / cache.apps_count:.0f} bytes per app), peak {peak / 2 ** 20:6.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Time the games cache through a full license import and a follow up login with one new license, at 1k, 10k and 30k
+licenses, to show how its work grows with the size of the library.
+
+The import is fed the way the PICS requests bring it in: packages in batches of 500, then their apps in batches of
+500. Every package holds APPS_PER_PACKAGE apps, and every SHARED_EVERY-th app is also in the next package.
+
+Run from the repository root: python benchmarks/games_cache_scaling.py [--sizes 1000 10000 30000] [--rounds N]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import NamedTuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from steam_network.games_cache import GamesCache  # noqa: E402
+from steam_network.protocol.protobuf_client import SteamLicense  # noqa: E402
+
+
+BATCH_SIZE = 500
+APPS_PER_PACKAGE = 2
+SHARED_EVERY = 10
+
+
+class FakeLicense(NamedTuple):
+    package_id: int
+
+
+def library(licenses: int):
+    packages = []
+    for package_id in range(1, licenses + 1):
+        appids = tuple(package_id * APPS_PER_PACKAGE + i for i in range(APPS_PER_PACKAGE))
+        if package_id % SHARED_EVERY == 0:
+            appids += ((package_id + 1) * APPS_PER_PACKAGE,)
+        packages.append((package_id, appids, 1))
+    appids = sorted({appid for _, package_appids, _ in packages for appid in package_appids})
+    apps = [(appid, f"Game {appid}", "game", None, 1) for appid in appids]
+    return packages, apps
+
+
+def batches(items):
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+def steam_licenses(licenses: int):
+    return [SteamLicense(FakeLicense(package_id), False) for package_id in range(1, licenses + 1)]
+
+
+def full_import(licenses, packages, apps) -> GamesCache:
+    cache = GamesCache()
+    cache.reconcile_licenses(licenses)
+    for batch in batches(packages):
+        cache.update_product_info(batch, [])
+    for batch in batches(apps):
+        cache.update_product_info([], batch)
+    assert cache.ready and len(cache.get_resolved_packages()) == len(licenses)
+    return cache
+
+
+def one_license_more(cache: GamesCache, licenses):
+    package_id = len(licenses)
+    to_import, _ = cache.reconcile_licenses(licenses)
+    assert len(to_import) == 1
+    cache.update_product_info([(package_id, (package_id * APPS_PER_PACKAGE,), 2)], [])
+    cache.update_product_info([], [(package_id * APPS_PER_PACKAGE, "New game", "game", None, 2)])
+    assert cache.ready
+
+
+def best_of(rounds: int, function, *args):
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 30000])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    #GamesCache makes an asyncio.Event, which wants a loop on older pythons
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    print(f"{'licenses':>9} {'full import':>12} {'per license':>12} {'+1 license':>11}")
+    for size in args.sizes:
+        packages, apps = library(size)
+        licenses, licenses_and_one_more = steam_licenses(size), steam_licenses(size + 1)
+        import_time = best_of(args.rounds, full_import, licenses, packages, apps)
+        increment_time = min(
+            best_of(1, one_license_more, full_import(licenses, packages, apps), licenses_and_one_more) for _ in range(args.rounds)
+        )
+        print(f"{size:>9} {import_time * 1000:10.1f}ms {import_time / size * 1e6:10.2f}us {increment_time * 1000:9.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Decode a 16MB Multi (the biggest message websocket_client accepts) full of license lists and PICS replies, and report
+how long it took and how much memory it peaked at, with the old decoding (gzip.decompress everything, copy every slice)
+and with the current one (memoryviews, gzipped bodies inflated as a stream).
+
+Only splitting the Multi into its messages is timed, unless --parse is given: protobuf parsing of the messages takes
+nearly all the time otherwise, and it is the same for both. Time is measured in runs of its own, tracemalloc slows
+everything down.
+
+Run from the repository root: python benchmarks/multi_decode.py [--gzip] [--parse] [--rounds N]
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import struct
+import sys
+import time
+import tracemalloc
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from steam_network.protocol.consts import EMsg  # noqa: E402
+from steam_network.protocol.protobuf_client import ProtobufClient  # noqa: E402
+from steam_network.protocol.messages.steammessages_base_pb2 import CMsgMulti, CMsgProtoBufHeader  # noqa: E402
+from steam_network.protocol.messages.steammessages_clientserver_pb2 import CMsgClientLicenseList  # noqa: E402
+from steam_network.protocol.messages.steammessages_clientserver_appinfo_pb2 import CMsgClientPICSProductInfoResponse  # noqa: E402
+
+
+MULTI_SIZE = 2 ** 24
+LICENSES_PER_LIST = 500
+APPS_PER_RESPONSE = 50
+
+APP_VDF = """"appinfo"
+{{
+	"appid"		"{appid}"
+	"common"
+	{{
+		"name"		"Benchmark Game {appid}"
+		"type"		"Game"
+		"oslist"		"windows,macos,linux"
+		"icon"		"0123456789abcdef0123456789abcdef01234567"
+		"logo"		"0123456789abcdef0123456789abcdef01234567"
+	}}
+	"extended"
+	{{
+		"developer"		"Benchmark Studio"
+		"publisher"		"Benchmark Publisher"
+		"homepage"		"https://example.com/{appid}"
+	}}
+	"config"
+	{{
+		"installdir"		"Benchmark Game {appid}"
+		"launch"
+		{{
+			"0"
+			{{
+				"executable"		"game.exe"
+				"type"		"default"
+			}}
+		}}
+	}}
+}}
+"""
+
+
+def packet(emsg: int, body: bytes) -> bytes:
+    header = CMsgProtoBufHeader().SerializeToString()
+    return struct.pack("<2I", emsg | ProtobufClient._PROTO_MASK, len(header)) + header + body
+
+
+def license_list(first_package_id: int) -> bytes:
+    message = CMsgClientLicenseList()
+    message.eresult = 1
+    for package_id in range(first_package_id, first_package_id + LICENSES_PER_LIST):
+        message.licenses.add(package_id=package_id, access_token=package_id * 7919, time_created=1600000000)
+    return packet(EMsg.ClientLicenseList, message.SerializeToString())
+
+
+def product_info(first_appid: int) -> bytes:
+    message = CMsgClientPICSProductInfoResponse()
+    for appid in range(first_appid, first_appid + APPS_PER_RESPONSE):
+        buffer = APP_VDF.format(appid=appid).encode()
+        message.apps.add(appid=appid, change_number=appid, sha=os.urandom(20), buffer=buffer, size=len(buffer))
+    return packet(EMsg.ClientPICSProductInfoResponse, message.SerializeToString())
+
+
+def build_multi(compress: bool) -> bytes:
+    body = bytearray()
+    next_id = 0
+    while len(body) < MULTI_SIZE - 2 ** 18:
+        for message in (license_list(next_id), product_info(next_id)):
+            body += struct.pack("<I", len(message)) + message
+        next_id += LICENSES_PER_LIST
+    multi = CMsgMulti()
+    if compress:
+        multi.size_unzipped = len(body)
+        multi.message_body = gzip.compress(bytes(body))
+    else:
+        multi.message_body = bytes(body)
+    return packet(EMsg.Multi, multi.SerializeToString())
+
+
+class DecodingClient(ProtobufClient):
+    """Stops at decoding: messages are counted (or parsed into their protobuf type, with parse), nothing gets handled."""
+
+    _MESSAGE_TYPES = {
+        EMsg.ClientLicenseList: CMsgClientLicenseList,
+        EMsg.ClientPICSProductInfoResponse: CMsgClientPICSProductInfoResponse,
+    }
+
+    def __init__(self, parse: bool):
+        super().__init__(MagicMock())
+        self.parse = parse
+        self.decoded = 0
+        self.decoded_bytes = 0
+
+    async def _process_message(self, emsg: int, header, body):
+        if emsg == EMsg.Multi:
+            await self._process_multi(header, body)
+            return
+        if self.parse:
+            message = self._MESSAGE_TYPES[emsg]()
+            message.ParseFromString(body)
+        self.decoded += 1
+        self.decoded_bytes += len(body)
+
+
+class CopyingClient(DecodingClient):
+    """Decodes the way we did before, slicing bytes (and copying them) at every level."""
+
+    async def _process_packet(self, packet):
+        raw_emsg = struct.unpack("<I", packet[:4])[0]
+        header_len = struct.unpack("<I", packet[4:8])[0]
+        header = CMsgProtoBufHeader()
+        header.ParseFromString(packet[8:8 + header_len])
+        await self._process_message(raw_emsg & ~self._PROTO_MASK, header, packet[8 + header_len:])
+
+    async def _process_multi(self, header, body):
+        message = CMsgMulti()
+        message.ParseFromString(body)
+        if message.size_unzipped > 0:
+            data = gzip.decompress(message.message_body)
+        else:
+            data = message.message_body
+        offset = 0
+        while offset + 4 <= len(data):
+            size = struct.unpack("<I", data[offset:offset + 4])[0]
+            await self._process_packet(data[offset + 4:offset + 4 + size])
+            offset += 4 + size
+
+
+def measure(client_type, data: bytes, parse: bool):
+    client = client_type(parse)
+    start = time.perf_counter()
+    asyncio.run(client._process_packet(data))
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    asyncio.run(client_type(parse)._process_packet(data))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, client.decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gzip", action="store_true", help="compress the Multi body, like steam does for big bursts")
+    parser.add_argument("--parse", action="store_true", help="time protobuf parsing of every message too")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    data = build_multi(args.gzip)
+    print(f"Multi: {len(data) / 2 ** 20:.1f}MB on the wire{' (gzipped)' if args.gzip else ''}")
+    for name, client_type in (("copying", CopyingClient), ("current", DecodingClient)):
+        results = [measure(client_type, data, args.parse) for _ in range(args.rounds)]
+        best_time = min(elapsed for elapsed, _, _ in results)
+        peak = max(peak for _, peak, _ in results)
+        print(f"{name:>10}: {best_time * 1000:8.1f}ms best of {args.rounds}, peak {peak / 2 ** 20:6.1f}MB, {results[0][2]} messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Compare reading name, type and parent out of PICS app buffers with vdf.loads (the whole tree) and with the scanner
+pics_parser uses, reporting time and peak memory (tracemalloc) for each.
+
+By default this runs on generated appinfo shaped like what steam sends (common, extended, config with launch options,
+depots with manifests for several branches, localisation). Point --corpus at a directory of real buffers instead,
+one app per file, as they come in CMsgClientPICSProductInfoResponse.AppInfo.buffer (null terminator included).
+
+Run from the repository root: python benchmarks/pics_app_parse.py [--corpus DIR] [--apps N] [--rounds N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import List, Tuple
+
+import vdf
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from steam_network.protocol import pics_parser  # noqa: E402
+
+
+def generated_app(appid: int, rng: random.Random) -> bytes:
+    is_dlc = rng.random() < 0.4
+    common = {
+        "name": f"Generated App {appid}",
+        "type": "DLC" if is_dlc else "Game",
+        "oslist": "windows,macos",
+        "osarch": "64",
+        "icon": "%040x" % rng.getrandbits(160),
+        "logo": "%040x" % rng.getrandbits(160),
+        "clienttga": "%040x" % rng.getrandbits(160),
+        "metacritic_score": str(rng.randint(40, 100)),
+        "languages": {language: "1" for language in ("english", "german", "french", "italian", "spanish", "polish", "russian")},
+        "small_capsule": {language: f"capsule_{language}.jpg" for language in ("english", "german", "french")},
+        "associations": {str(i): {"type": "developer", "name": f"Studio {i}"} for i in range(3)},
+        "category": {f"category_{i}": "1" for i in range(12)},
+        "genres": {str(i): str(rng.randint(1, 30)) for i in range(4)},
+    }
+    extended = {"developer": "Studio", "publisher": "Publisher", "homepage": f"https://example.com/{appid}"}
+    if is_dlc:
+        extended["dlcforappid"] = str(appid - 1)
+    config = {
+        "installdir": f"Generated App {appid}",
+        "launch": {
+            str(i): {"executable": f"bin/game{i}.exe", "arguments": "-windowed", "type": "default",
+                     "config": {"oslist": "windows", "osarch": "64"}}
+            for i in range(4)
+        },
+    }
+    depots = {
+        str(appid * 10 + i): {
+            "config": {"oslist": "windows"},
+            "manifests": {branch: str(rng.getrandbits(63)) for branch in ("public", "beta", "experimental", "previous")},
+            "encryptedmanifests": {"beta": {"encrypted_gid_2": "%064x" % rng.getrandbits(256), "encrypted_size_2": "%016x" % rng.getrandbits(64)}},
+            "maxsize": str(rng.getrandbits(34)),
+        }
+        for i in range(rng.randint(2, 12))
+    }
+    depots["branches"] = {
+        branch: {"buildid": str(rng.getrandbits(24)), "timeupdated": str(rng.getrandbits(31)), "description": f"{branch} branch"}
+        for branch in ("public", "beta", "experimental", "previous")
+    }
+    ufs = {"quota": "1000000000", "maxnumfiles": "1000", "savefiles": {str(i): {"root": "WinMyDocuments", "path": f"Saves/{i}"} for i in range(3)}}
+    appinfo = {"appid": str(appid), "common": common, "extended": extended, "config": config, "depots": depots, "ufs": ufs}
+    return vdf.dumps({"appinfo": appinfo}, pretty=True).encode() + b"\x00"
+
+
+def load_corpus(directory: str) -> List[Tuple[int, int, bytes]]:
+    apps = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as f:
+            buffer = f.read()
+        appid = int(vdf.loads(buffer[:-1].decode("utf-8", "replace"))["appinfo"]["appid"])
+        apps.append((appid, 0, buffer))
+    return apps
+
+
+def parse_full_tree(apps):
+    return [pics_parser._parse_app(appid, buffer[:-1].decode("utf-8", "replace")) + (change_number,) for appid, change_number, buffer in apps]
+
+
+def measure(function, apps, rounds: int):
+    best = float("inf")
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function(apps)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    function(apps)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory with one raw app buffer per file")
+    parser.add_argument("--apps", type=int, default=2000, help="how many apps to generate when no corpus is given")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        apps = load_corpus(args.corpus)
+    else:
+        rng = random.Random(0)
+        apps = [(appid, 0, generated_app(appid, rng)) for appid in range(10, 10 + args.apps)]
+    size = sum(len(buffer) for _, _, buffer in apps)
+    print(f"{len(apps)} apps, {size / 2 ** 20:.1f}MB of vdf")
+
+    tree_time, tree_peak, tree_result = measure(parse_full_tree, apps, args.rounds)
+    scan_time, scan_peak, scan_result = measure(pics_parser.parse_apps, apps, args.rounds)
+    assert tree_result == scan_result, "scanner disagrees with vdf.loads"
+    print(f"  vdf.loads: {tree_time * 1000:8.1f}ms, peak {tree_peak / 2 ** 20:6.2f}MB")
+    print(f"    scanner: {scan_time * 1000:8.1f}ms, peak {scan_peak / 2 ** 20:6.2f}MB ({tree_time / scan_time:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
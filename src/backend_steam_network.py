@@ -2,7 +2,7 @@ import asyncio
 import logging
 import ssl
 from contextlib import suppress
-from typing import Callable, List, Any, Dict, Union, Coroutine, cast
+from typing import Awaitable, Callable, List, Any, Dict, Optional, Union, Coroutine, cast
 from urllib import parse
 from pprint import pformat
 
@@ -32,11 +32,14 @@ from galaxy.api.types import (
 from backend_interface import BackendInterface
 from http_client import HttpClient
 from persistent_cache_state import PersistentCacheState
+from steam_network.app_store import AppStore, default_app_store_path
 from steam_network.authentication_cache import AuthenticationCache
 from steam_network.friends_cache import FriendsCache
-from steam_network.games_cache import GamesCache
+from steam_network.games_cache import GamesCache, GAMES_CACHE_KEY, GAMES_JOURNAL_KEY
 from steam_network.local_machine_cache import LocalMachineCache
+from steam_network.notification_pacer import NotificationPacer
 from steam_network.presence import presence_from_user_info
+from steam_network.protocol.pics_parser import create_parser_pool
 from steam_network.protocol.steam_types import ProtoUserInfo  # TODO accessing inner module
 from steam_network.stats_cache import StatsCache
 from steam_network.steam_http_client import SteamHttpClient
@@ -58,6 +61,10 @@ logger = logging.getLogger(__name__)
 
 
 GAME_CACHE_IS_READY_TIMEOUT = 90
+#once the license import has run this long, get_owned_games answers with what is resolved and add_game brings the rest
+GAME_CACHE_IMPORT_DEADLINE = 20
+#answer get_owned_games from the games cache persisted last session, and tell Galaxy what changed once steam has answered
+OWNED_GAMES_FROM_PERSISTED_CACHE = True
 USER_INFO_CACHE_INITIALIZED_TIMEOUT = 30
 
 GAME_DOES_NOT_SUPPORT_LAST_PLAYED_VALUE = 86400
@@ -76,9 +83,12 @@ def avatar_url_from_avatar_hash(a_hash: str):
 class SteamNetworkBackend(BackendInterface):
     def __init__(self, http_client: HttpClient, ssl_context: ssl.SSLContext, 
                  persistent_storage_state: PersistentCacheState, persistent_cache: Dict[str, Any], update_user_presence: Callable[[UserPresence], None], 
-                 store_credentials: Callable[[Dict[str, Any]], None], add_game: Callable[[Game], None]):
+                 store_credentials: Callable[[Dict[str, Any]], None], add_game: Callable[[Game], None],
+                 remove_game: Optional[Callable[[str], None]] = None, drain_galaxy_connection: Optional[Callable[[], Awaitable[None]]] = None):
 
         self._add_game : Callable[[Game], None] = add_game
+        self._remove_game : Optional[Callable[[str], None]] = remove_game
+        self._galaxy_pacer : NotificationPacer = NotificationPacer(drain_galaxy_connection)
         self._persistent_cache : Dict[str, Any] = persistent_cache
         self._persistent_storage_state : PersistentCacheState = persistent_storage_state
 
@@ -86,9 +96,10 @@ class SteamNetworkBackend(BackendInterface):
         self._authentication_cache : AuthenticationCache = AuthenticationCache()
         self._user_info_cache : UserInfoCache = UserInfoCache()
 
-        self._games_cache : GamesCache = GamesCache()
+        self._app_store : AppStore = AppStore(default_app_store_path())
+        self._games_cache : GamesCache = GamesCache(self._app_store)
         self._translations_cache : Dict[int, str] = dict()
-        self._stats_cache :StatsCache = StatsCache()
+        self._stats_cache :StatsCache = StatsCache(self._app_store)
         self._times_cache : TimesCache = TimesCache()
         self._friends_cache : FriendsCache = FriendsCache()
 
@@ -103,6 +114,7 @@ class SteamNetworkBackend(BackendInterface):
         local_machine_cache : LocalMachineCache = LocalMachineCache(self._persistent_cache, self._persistent_storage_state)
 
         steam_http_client = SteamHttpClient(http_client)
+        self._pics_parser_pool = create_parser_pool()
         self._websocket_client = WebSocketClient(
             WebSocketList(steam_http_client),
             ssl_context,
@@ -114,23 +126,31 @@ class SteamNetworkBackend(BackendInterface):
             self._authentication_cache,
             self._user_info_cache,
             local_machine_cache,
+            self._pics_parser_pool,
+            steam_http_client.get_pics_app_info,
         )
 
         self._update_owned_games_task : Task[None] = asyncio.create_task(asyncio.sleep(0))
         self._owned_games_parsed : bool = False
+        self._revalidate_owned_games_task : Task[None] = asyncio.create_task(asyncio.sleep(0))
         
-        self._load_persistent_cache()
+        #big libraries take a while to parse, so that happens off the loop while the rest starts up
+        self._load_games_cache_task : Task[None] = asyncio.create_task(self._load_persistent_cache())
     
-    def _load_persistent_cache(self):
-        if "games" in self._persistent_cache:
-            self._games_cache.loads(self._persistent_cache["games"])
+    async def _load_persistent_cache(self):
+        if GAMES_CACHE_KEY in self._persistent_cache:
+            await self._games_cache.load(self._persistent_cache[GAMES_CACHE_KEY], self._persistent_cache.get(GAMES_JOURNAL_KEY, ""))
 
     async def shutdown(self):
         await self._websocket_client.close()
         await self._websocket_client.wait_closed()
 
+        await self._cancel_task(self._load_games_cache_task)
         await self._cancel_task(self._update_owned_games_task)
+        await self._cancel_task(self._revalidate_owned_games_task)
         await self._cancel_task(self._steam_run_task)
+        self._pics_parser_pool.shutdown(wait=False)
+        self._app_store.close()
 
     async def _cancel_task(self, task):
         with suppress(asyncio.CancelledError):
@@ -144,20 +164,18 @@ class SteamNetworkBackend(BackendInterface):
         if not new_games:
             return
 
-        self._persistent_cache["games"] = self._games_cache.dump()
-        self._persistent_storage_state.modified = True
+        if self._games_cache.persist(self._persistent_cache):
+            self._persistent_storage_state.modified = True
 
-        for i, game in enumerate(new_games):
-            self._add_game(
-                Game(
-                    game.appid,
-                    game.title,
-                    [],
-                    license_info=LicenseInfo(LicenseType.SinglePurchase),
-                )
-            )
-            if i % 50 == 49:
-                await asyncio.sleep(5)  # give Galaxy a breath in case of adding thousands games
+        await self._add_games([
+            Game(str(game.appid), game.title, [], license_info=LicenseInfo(LicenseType.SinglePurchase))
+            for game in new_games
+        ])
+
+    async def _add_games(self, games: List[Game]):
+        for game in games:
+            await self._galaxy_pacer.acquire()  # give Galaxy a breath in case of adding thousands games
+            self._add_game(game)
 
     def tick(self):
         if self._update_owned_games_task.done() and self._owned_games_parsed:
@@ -355,9 +373,33 @@ class SteamNetworkBackend(BackendInterface):
         if self._user_info_cache.steam_id is None:
             raise AuthenticationRequired()
 
-        await self._games_cache.wait_ready(GAME_CACHE_IS_READY_TIMEOUT)
+        await self._games_cache.wait_loaded()
+        if (OWNED_GAMES_FROM_PERSISTED_CACHE and self._remove_game is not None
+                and not self._games_cache.ready and self._games_cache.get_package_ids()):
+            owned_games = await self._collect_owned_games()
+            logger.info("Answering with %d owned games from the persisted cache until steam has answered", len(owned_games))
+            #Galaxy goes by this answer now, so a revalidation of an earlier one would send the wrong changes
+            self._revalidate_owned_games_task.cancel()
+            self._revalidate_owned_games_task = asyncio.create_task(self._revalidate_owned_games(owned_games))
+            #subscriptions can be answered from the same cache, and new games only come in once revalidation sets
+            #add_game_lever
+            self._owned_games_parsed = True
+            return owned_games
+
+        if not await self._games_cache.wait_resolved(GAME_CACHE_IS_READY_TIMEOUT, GAME_CACHE_IMPORT_DEADLINE):
+            logger.info("Games cache not ready yet (%s), the rest of the owned games will follow", self._games_cache.progress)
         self._games_cache.add_game_lever = True
+        try:
+            owned_games = await self._collect_owned_games()
+        finally:
+            self._owned_games_parsed = True
+
+        if self._games_cache.persist(self._persistent_cache):
+            self._persistent_storage_state.modified = True
 
+        return owned_games
+
+    async def _collect_owned_games(self) -> List[Game]:
         owned_games = []
         owned_witcher_3_dlcs = set()
 
@@ -371,8 +413,8 @@ class SteamNetworkBackend(BackendInterface):
                         LicenseInfo(LicenseType.SinglePurchase, None),
                     )
                 )
-                if app.appid in WITCHER_3_DLCS_APP_IDS:
-                    owned_witcher_3_dlcs.add(app.appid)
+                if str(app.appid) in WITCHER_3_DLCS_APP_IDS:
+                    owned_witcher_3_dlcs.add(str(app.appid))
 
             if does_witcher_3_dlcs_set_resolve_to_GOTY(owned_witcher_3_dlcs):
                 owned_games.append(
@@ -388,13 +430,35 @@ class SteamNetworkBackend(BackendInterface):
             logger.exception("Cannot parse backend response")
             raise UnknownBackendResponse()
 
-        finally:
-            self._owned_games_parsed = True
+        return owned_games
 
-        self._persistent_cache["games"] = self._games_cache.dump()
-        self._persistent_storage_state.modified = True
+    async def _revalidate_owned_games(self, reported_games: List[Game]):
+        """Once the games cache is up to date with steam, tells Galaxy about the games that came or went since
+        reported_games were sent, and hands new games over to _update_owned_games from then on.
+
+        If the cache doesn't get there in time, the games resolved by then are added, but none are removed: a game
+        missing from an incomplete cache may just not be in yet."""
+        #ready only counts once it holds, not when the event fires: the license import can set and clear it in one go
+        resolved = await self._games_cache.wait_resolved(GAME_CACHE_IS_READY_TIMEOUT, GAME_CACHE_IS_READY_TIMEOUT)
+        if not resolved:
+            logger.info("Games cache not ready yet (%s), revalidating only the games resolved so far", self._games_cache.progress)
+        #games imported from now on go through add_game_lever, the ones before are in owned_games
+        self._games_cache.add_game_lever = True
+        owned_games = await self._collect_owned_games()
 
-        return owned_games
+        reported_ids = {game.game_id for game in reported_games}
+        owned_ids = {game.game_id for game in owned_games}
+        removed_ids = [game.game_id for game in reported_games if game.game_id not in owned_ids] if resolved else []
+        added_games = [game for game in owned_games if game.game_id not in reported_ids]
+        logger.info("Owned games revalidated: %d added, %d removed", len(added_games), len(removed_ids))
+
+        if self._games_cache.persist(self._persistent_cache):
+            self._persistent_storage_state.modified = True
+
+        for game_id in removed_ids:
+            await self._galaxy_pacer.acquire()
+            self._remove_game(game_id)
+        await self._add_games(added_games)
 
     async def get_subscriptions(self) -> List[Subscription]:
         if not self._owned_games_parsed:
@@ -111,8 +111,18 @@ class SteamPlugin(Plugin):
         ssl_context=self._ssl_context
         update_user_presence=self.update_user_presence
         add_game=self.add_game
+        remove_game=self.remove_game
+        drain_galaxy_connection=self._drain_galaxy_connection
 
-        return SteamNetworkBackend(http_client, ssl_context, persistent_storage_state, persistent_cache, update_user_presence, store_credentials, add_game)
+        return SteamNetworkBackend(http_client, ssl_context, persistent_storage_state, persistent_cache, update_user_presence, store_credentials, add_game, remove_game, drain_galaxy_connection)
+
+    async def _drain_galaxy_connection(self):
+        """Returns once Galaxy has read enough of what was sent to it to take more.
+
+        The stream writer belongs to galaxy.api.plugin.Plugin, which has no public way to wait on it, so this is the one
+        place that reaches into it.
+        """
+        await self._writer.drain()
     
     async def pass_login_credentials(self, step, credentials, cookies):
         result = await self._backend.pass_login_credentials(step, credentials, cookies)
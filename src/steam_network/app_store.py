@@ -0,0 +1,197 @@
+"""App titles, types and dlc parents as PICS gives them, and the achievement names of games' stats schemas, kept on
+disk across sessions and accounts.
+
+They are the same for every steam user, so a re-login, an account switch or a reset of the games cache can take them
+from here instead of asking steam again. PICS change numbers are kept along, so GamesCache.reconcile_licenses can
+tell what is out of date. The store also keeps the PICS change number it is current to: apps stay hidden until
+expire drops the ones that changed since, once a session. Schemas are kept with their version and stats CRC, which
+stats requests send back to steam.
+
+SQLite calls block, so they all run on a thread of the store's own (the connection is made and used only there).
+"""
+import asyncio
+import json
+import logging
+import os
+import platform
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .protocol.pics_parser import AppRecord, UNKNOWN_TYPE
+
+
+logger = logging.getLogger(__name__)
+
+#sqlite versions before 3.32 take at most 999 parameters a statement
+LOOKUP_CHUNK_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS apps (
+    appid INTEGER PRIMARY KEY,
+    change_number INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    type TEXT NOT NULL,
+    parent INTEGER
+);
+CREATE TABLE IF NOT EXISTS achievement_schemas (
+    appid INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL,
+    crc_stats INTEGER NOT NULL,
+    achievements TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+#(appid, schema version, stats crc, {block id: {bit: achievement name}})
+SchemaRecord = Tuple[int, int, int, Dict[str, Dict[str, str]]]
+
+#an app is only replaced by a newer (or the same) change number of it. No upsert, the sqlite in Galaxy's python may
+#predate it.
+_INSERT = "INSERT OR IGNORE INTO apps (appid, change_number, title, type, parent) VALUES (?, ?, ?, ?, ?)"
+_UPDATE = "UPDATE apps SET change_number = ?, title = ?, type = ?, parent = ? WHERE appid = ? AND change_number <= ?"
+
+
+def default_app_store_path() -> str:
+    if platform.system() == "Windows":
+        data_dir = os.path.expandvars(r"%LOCALAPPDATA%")
+    else:
+        data_dir = os.path.expanduser("~/Library/Application Support")
+    return os.path.join(data_dir, "GOG.com", "Galaxy", "plugins", "data", "steam", "apps.sqlite3")
+
+
+class AppStore:
+    def __init__(self, path: str):
+        self._path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="app-store")
+        self._broken = False
+        #set on the store's thread once expire is done, see _lookup
+        self._expired = False
+
+    async def lookup(self, app_ids: Iterable[int]) -> List[AppRecord]:
+        """The records of the given apps this store has. A store that can't be read has none, and neither has one
+        that wasn't expired yet: its apps could be any age."""
+        return await self._read(self._lookup, list(app_ids))
+
+    async def change_number(self) -> int:
+        """The PICS change number the stored apps are current to, 0 if that isn't known."""
+        return await self._call(self._change_number, 0)
+
+    def expire(self, app_changes: Dict[int, int], change_number: int, everything: bool = False):
+        """Drops in the background the stored apps older than their change in app_changes (appid -> change number),
+        all of them if everything is set, and makes the store current to change_number. app_changes are the changes
+        since the store's change_number. Lookups queued after this see what is left."""
+        if self._broken:
+            return
+        self._executor.submit(self._expire, app_changes, change_number, everything).add_done_callback(self._saved)
+
+    def save(self, apps: Sequence[AppRecord]):
+        """Stores the apps in the background. Apps steam told us nothing about aren't stored."""
+        self._write(self._save, [app for app in apps if app[2] != UNKNOWN_TYPE])
+
+    async def lookup_schemas(self, app_ids: Iterable[int]) -> List[SchemaRecord]:
+        return await self._read(self._lookup_schemas, list(app_ids))
+
+    def save_schema(self, schema: SchemaRecord):
+        self._write(self._save_schemas, [schema])
+
+    async def _read(self, function: Callable[[List[int]], List[Any]], app_ids: List[int]) -> List[Any]:
+        if not app_ids:
+            return []
+        return await self._call(function, [], app_ids)
+
+    async def _call(self, function: Callable[..., Any], default: Any, *args) -> Any:
+        if self._broken:
+            return default
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        except (sqlite3.Error, OSError, ValueError):
+            logger.exception("Can't read from %s", self._path)
+            self._broken = True
+            return default
+
+    def _write(self, function: Callable[[List[Any]], None], records: List[Any]):
+        if not records or self._broken:
+            return
+        self._executor.submit(function, records).add_done_callback(self._saved)
+
+    def close(self):
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            connection = sqlite3.connect(self._path)
+            try:
+                connection.executescript(_SCHEMA)
+            except sqlite3.Error:
+                connection.close()
+                raise
+            self._connection = connection
+        return self._connection
+
+    def _select(self, query: str, app_ids: List[int]) -> Iterable[tuple]:
+        connection = self._connect()
+        for start in range(0, len(app_ids), LOOKUP_CHUNK_SIZE):
+            chunk = app_ids[start:start + LOOKUP_CHUNK_SIZE]
+            yield from connection.execute(query % ",".join("?" * len(chunk)), chunk)
+
+    def _lookup(self, app_ids: List[int]) -> List[AppRecord]:
+        if not self._expired:
+            return []
+        rows = self._select("SELECT appid, title, type, parent, change_number FROM apps WHERE appid IN (%s)", app_ids)
+        return [(appid, title, type_, None if parent is None else str(parent), change_number)
+            for appid, title, type_, parent, change_number in rows]
+
+    def _lookup_schemas(self, app_ids: List[int]) -> List[SchemaRecord]:
+        rows = self._select("SELECT appid, version, crc_stats, achievements FROM achievement_schemas WHERE appid IN (%s)", app_ids)
+        return [(appid, version, crc_stats, json.loads(achievements)) for appid, version, crc_stats, achievements in rows]
+
+    def _save(self, apps: List[AppRecord]):
+        connection = self._connect()
+        rows = [
+            (appid, change_number, title, type_, None if parent is None else int(parent))
+            for appid, title, type_, parent, change_number in apps
+        ]
+        with connection:
+            connection.executemany(_UPDATE, [(cn, title, type_, parent, appid, cn) for appid, cn, title, type_, parent in rows])
+            connection.executemany(_INSERT, rows)
+
+    def _change_number(self) -> int:
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'change_number'").fetchone()
+        return 0 if row is None else row[0]
+
+    def _expire(self, app_changes: Dict[int, int], change_number: int, everything: bool):
+        connection = self._connect()
+        with connection:
+            if everything:
+                connection.execute("DELETE FROM apps")
+            else:
+                connection.executemany("DELETE FROM apps WHERE appid = ? AND change_number < ?", app_changes.items())
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('change_number', ?)", (change_number,))
+        self._expired = True
+
+    def _save_schemas(self, schemas: List[SchemaRecord]):
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO achievement_schemas (appid, version, crc_stats, achievements) VALUES (?, ?, ?, ?)",
+                [(appid, version, crc_stats, json.dumps(achievements, separators=(",", ":")))
+                    for appid, version, crc_stats, achievements in schemas]
+            )
+
+    def _saved(self, future):
+        if future.cancelled() or future.exception() is None:
+            return
+        logger.error("Can't write to %s: %r", self._path, future.exception())
+        self._broken = True
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -1,122 +1,449 @@
 from dataclasses import dataclass, field
-from dataclasses_json import dataclass_json
-from typing import List, Dict, Optional, Set, AsyncGenerator
+from typing import Any, List, Dict, Iterable, NamedTuple, Optional, Sequence, Set, Tuple, AsyncGenerator
 import logging
 import json
-import copy
 import asyncio
+import sys
+import time
+from contextlib import suppress
 
+from .app_store import AppStore
 from .cache_proto import ProtoCache
 from .protocol.protobuf_client import SteamLicense
+from .protocol.pics_parser import AppRecord, PackageRecord
+from .utils import time_sliced
 from .w3_hack import WITCHER_3_DLCS_APP_IDS
 
 
 logger = logging.getLogger(__name__)
 
+#persistent cache keys: a snapshot of the whole cache, and what changed since it was written
+GAMES_CACHE_KEY = "games"
+GAMES_JOURNAL_KEY = "games_journal"
+#the journal is folded into a new snapshot once it outgrows this share of the snapshot (or this many characters)
+JOURNAL_COMPACT_RATIO = 0.5
+JOURNAL_COMPACT_MIN_SIZE = 2 ** 16
 
-@dataclass_json
-@dataclass
-class App:
-    appid: str
+
+class App(NamedTuple):
+    appid: int
     title: str
-    type: str
-    parent: Optional[str]
+    type: str #interned, there are only a handful of them
+    parent: Optional[int]
+    change_number: int = 0
 
 
-@dataclass_json
-@dataclass
 class License:
-    package_id: str
-    shared: bool
-    app_ids: Set[str] = field(default_factory=set)
+    """A package we own or have shared with us. There can be tens of thousands of these, hence the slots."""
+    __slots__ = ('package_id', 'shared', 'app_ids', 'change_number')
+
+    def __init__(self, package_id: int, shared: bool, app_ids: Tuple[int, ...] = (), change_number: int = 0):
+        self.package_id: int = package_id
+        self.shared: bool = shared
+        self.app_ids: Tuple[int, ...] = app_ids
+        self.change_number: int = change_number
+
+    def __eq__(self, other):
+        if not isinstance(other, License):
+            return NotImplemented
+        return (self.package_id, self.shared, self.app_ids, self.change_number) == \
+            (other.package_id, other.shared, other.app_ids, other.change_number)
+
+    def __repr__(self):
+        return f"License(package_id={self.package_id!r}, shared={self.shared!r}, app_ids={self.app_ids!r}, change_number={self.change_number!r})"
 
 
-@dataclass_json
 @dataclass
 class LicensesCache:
     licenses: List[License] = field(default_factory=list)
-    apps: Dict[str, App] = field(default_factory=dict)
+    apps: Dict[int, App] = field(default_factory=dict)
+    #PICS change number everything above is up to date with
+    change_number: int = 0
+
+    def to_records(self) -> Dict[str, Any]:
+        return {
+            'change_number': self.change_number,
+            'licenses': [_license_record(license) for license in self.licenses],
+            'apps': [_app_record(app) for app in self.apps.values()],
+        }
+
+    @classmethod
+    def from_records(cls, records: Dict[str, Any], journal: str = "") -> 'LicensesCache':
+        """Rebuilds the cache from a snapshot written by to_records, with the journal written since replayed over it."""
+        licenses = {record[0]: _license_from_record(record) for record in records['licenses']}
+        apps = {record[0]: _app_from_record(record) for record in records['apps']}
+        change_number = records['change_number']
+        for line in journal.splitlines():
+            entry = json.loads(line)
+            kind = entry[0]
+            if kind == _JOURNAL_LICENSE:
+                licenses[entry[1]] = _license_from_record(entry[1:])
+            elif kind == _JOURNAL_LICENSE_REMOVED:
+                licenses.pop(entry[1], None)
+            elif kind == _JOURNAL_APP:
+                apps[entry[1]] = _app_from_record(entry[1:])
+            elif kind == _JOURNAL_APP_REMOVED:
+                apps.pop(entry[1], None)
+            elif kind == _JOURNAL_CHANGE_NUMBER:
+                change_number = entry[1]
+        return cls(list(licenses.values()), apps, change_number)
+
+    @classmethod
+    def from_legacy_json(cls, cache_json: str) -> 'LicensesCache':
+        """Reads what version 1.0.0 wrote: dataclass_json dataclasses with string ids."""
+        cache = json.loads(cache_json)
+        licenses = [
+            License(int(license['package_id']), license['shared'], tuple(sorted(int(appid) for appid in license.get('app_ids', ()))),
+                    license.get('change_number', 0))
+            for license in cache.get('licenses', [])
+        ]
+        apps = {}
+        for app in cache.get('apps', {}).values():
+            parent = app.get('parent')
+            apps[int(app['appid'])] = App(int(app['appid']), app['title'], sys.intern(app['type']),
+                                          None if parent is None else int(parent), app.get('change_number', 0))
+        return cls(licenses, apps, cache.get('change_number', 0))
+
+
+#the snapshot and journal store records as plain json arrays, without field names
+def _license_record(license: License) -> list:
+    return [license.package_id, int(license.shared), license.change_number, list(license.app_ids)]
+
+
+def _license_from_record(record: list) -> License:
+    package_id, shared, change_number, app_ids = record
+    return License(package_id, bool(shared), tuple(app_ids), change_number)
+
+
+def _app_record(app: App) -> list:
+    return [app.appid, app.title, app.type, app.parent, app.change_number]
+
+
+def _app_from_record(record: list) -> App:
+    appid, title, type_, parent, change_number = record
+    return App(appid, title, sys.intern(type_), parent, change_number)
+
+
+#journal lines are json arrays starting with one of these, then the record or the id
+_JOURNAL_LICENSE = "L"
+_JOURNAL_LICENSE_REMOVED = "l"
+_JOURNAL_APP = "A"
+_JOURNAL_APP_REMOVED = "a"
+_JOURNAL_CHANGE_NUMBER = "C"
+
+
+def _journal_line(entry: list) -> str:
+    return json.dumps(entry, separators=(',', ':')) + "\n"
+
+
+class _Indexes(NamedTuple):
+    licenses: Dict[int, License]
+    packages_by_app: Dict[int, Tuple[int, ...]]
+    missing_apps: Dict[int, int]
+    missing_apps_total: int
+    resolved_packages: Set[int]
+
+
+def _index_licenses(storing_map: LicensesCache) -> _Indexes:
+    """Builds GamesCache's indexes over storing_map in one pass. Touches nothing but storing_map, so it can run off the loop."""
+    licenses: Dict[int, License] = {}
+    for license in storing_map.licenses:
+        #caches written before licenses were reconciled can have a package more than once
+        licenses.setdefault(license.package_id, license)
+    if len(licenses) != len(storing_map.licenses):
+        storing_map.licenses = list(licenses.values())
+
+    apps = storing_map.apps
+    packages_by_app: Dict[int, Tuple[int, ...]] = {}
+    missing_apps: Dict[int, int] = {}
+    missing_apps_total = 0
+    resolved_packages = set()
+    for package_id, license in licenses.items():
+        missing = 0
+        for appid in license.app_ids:
+            packages_by_app[appid] = packages_by_app.get(appid, ()) + (package_id,)
+            if appid not in apps:
+                missing += 1
+        missing_apps[package_id] = missing
+        missing_apps_total += missing
+        if license.app_ids and not missing:
+            resolved_packages.add(package_id)
+    return _Indexes(licenses, packages_by_app, missing_apps, missing_apps_total, resolved_packages)
+
+
+def _load_cache(persistent_cache: str, journal: str, version: str, legacy_version: str) -> Optional[Tuple[LicensesCache, _Indexes, bool]]:
+    """Parses and indexes a persisted cache: (storing map, its indexes, whether it needs writing in the current format).
+    None if it's from a version we can't read."""
+    cache = json.loads(persistent_cache)
+
+    cache_version = cache.get('version')
+    if cache_version == legacy_version:
+        storing_map = LicensesCache.from_legacy_json(cache['licenses'])
+        #written over in the new format on the first persist
+        needs_snapshot = True
+    elif cache_version == version:
+        storing_map = LicensesCache.from_records(cache, journal)
+        needs_snapshot = False
+    else:
+        return None
+    return storing_map, _index_licenses(storing_map), needs_snapshot
 
 
 @dataclass
 class ParsingStatus:
-    packages_to_parse: Optional[int] = None
-    apps_to_parse: Optional[int] = None
+    #packages asked for that didn't come yet. None until the first import starts.
+    packages: Optional[Set[int]] = None
+    #cached apps asked for again, see GamesCache.reconcile_licenses
+    apps: Set[int] = field(default_factory=set)
+
+
+class ImportProgress(NamedTuple):
+    packages_resolved: int
+    packages_total: int #packages asked for since the import started
+    apps_resolved: int #app infos that came in
+    apps_total: int #the ones that came in and the ones known to be waited for, which grows as packages come in
+    bytes_received: int #of PICS product info responses
+    elapsed: float #seconds since the import started
 
 
 class GamesCache(ProtoCache):
 
-    _VERSION = "1.0.0"
+    _VERSION = "2.0.0"
+    _LEGACY_VERSION = "1.0.0"
 
-    def __init__(self):
+    def __init__(self, app_store: Optional[AppStore] = None):
         super(GamesCache, self).__init__()
         self._storing_map: LicensesCache = LicensesCache()
+        #apps from PICS outlive this cache there, see resolve_stored_apps
+        self._app_store = app_store
 
-        self._sent_apps = []
+        self._sent_appids: Set[int] = set()
 
         self._apps_added: List[App] = []
         self.add_game_lever: bool = False
 
         self._parsing_status = ParsingStatus()
+        self._change_number_when_ready: Optional[int] = None
+        #apps of cached packages steam failed to deliver in this import, see product_info_failed
+        self._failed_apps: Set[int] = set()
+        #something asked for since the change number last moved on never came, so it doesn't move on this time
+        self._import_incomplete: bool = False
+
+        #for progress, see _start_import
+        self._import_started_at: Optional[float] = None
+        self._packages_asked: int = 0
+        self._apps_received: int = 0
+        self._bytes_received: int = 0
+
+        #indexes over _storing_map, so updates don't have to scan every license
+        self._licenses: Dict[int, License] = {}
+        #almost every app is in a single package, and a tuple of one is a fraction of a set
+        self._packages_by_app: Dict[int, Tuple[int, ...]] = {}
+        self._missing_apps: Dict[int, int] = {} #package_id -> how many of its apps aren't in _storing_map.apps
+        self._missing_apps_total: int = 0
+        self._resolved_packages: Set[int] = set() #packages with apps, all of them known
+
+        #what changed since the cache was last persisted, see persist
+        self._changed_licenses: Set[int] = set()
+        self._changed_apps: Set[int] = set()
+        self._change_number_changed: bool = False
+        self._needs_snapshot: bool = True
+        self._index_storing_map()
+
+        #cleared while load is at work
+        self._loaded_event = asyncio.Event()
+        self._loaded_event.set()
 
     @property
     def version(self):
         return self._VERSION
 
+    @property
+    def change_number(self) -> int:
+        return self._storing_map.change_number
+
+    @property
+    def apps_count(self) -> int:
+        return len(self._storing_map.apps)
+
+    def set_change_number_when_ready(self, change_number: int):
+        """Remember change_number as the one the cache is up to date with, once everything being imported is in."""
+        self._change_number_when_ready = change_number
+        self._update_ready_state()
+
     def reset_storing_map(self):
         self._storing_map: LicensesCache = LicensesCache()
+        self._change_number_when_ready = None
+        self._failed_apps = set()
+        self._import_incomplete = False
+        self._index_storing_map()
+        self._needs_snapshot = True
+
+    def _index_storing_map(self):
+        self._use_indexes(_index_licenses(self._storing_map))
+
+    def _use_indexes(self, indexes: '_Indexes'):
+        self._licenses = indexes.licenses
+        self._packages_by_app = indexes.packages_by_app
+        self._missing_apps = indexes.missing_apps
+        self._missing_apps_total = indexes.missing_apps_total
+        self._resolved_packages = indexes.resolved_packages
+        self._forget_changes()
+
+    def _add_license(self, license: License):
+        self._storing_map.licenses.append(license)
+        self._licenses[license.package_id] = license
+        self._missing_apps[license.package_id] = 0
+        app_ids, license.app_ids = license.app_ids, ()
+        self._set_license_apps(license, app_ids)
+
+    def _forget_license(self, license: License):
+        """Drops license from the indexes only: _storing_map.licenses is up to the caller."""
+        self._set_license_apps(license, ())
+        self._changed_licenses.add(license.package_id)
+        del self._licenses[license.package_id]
+        del self._missing_apps[license.package_id]
+
+    def _set_license_apps(self, license: License, app_ids: Iterable[int]):
+        package_id = license.package_id
+        old_app_ids = set(license.app_ids)
+        new_app_ids = set(app_ids)
+        for appid in old_app_ids - new_app_ids:
+            packages = tuple(package for package in self._packages_by_app[appid] if package != package_id)
+            if packages:
+                self._packages_by_app[appid] = packages
+            else:
+                del self._packages_by_app[appid]
+        for appid in new_app_ids - old_app_ids:
+            self._packages_by_app[appid] = self._packages_by_app.get(appid, ()) + (package_id,)
+        app_ids = license.app_ids = tuple(sorted(new_app_ids))
+        self._changed_licenses.add(package_id)
+
+        missing = sum(1 for appid in app_ids if appid not in self._storing_map.apps)
+        self._missing_apps_total += missing - self._missing_apps[package_id]
+        self._missing_apps[package_id] = missing
+        if app_ids and not missing:
+            self._resolved_packages.add(package_id)
+        else:
+            self._resolved_packages.discard(package_id)
+
+    def _store_app(self, app: App):
+        if app.appid not in self._storing_map.apps:
+            for package_id in self._packages_by_app.get(app.appid, ()):
+                self._missing_apps[package_id] -= 1
+                self._missing_apps_total -= 1
+                if not self._missing_apps[package_id]:
+                    self._resolved_packages.add(package_id)
+            self._failed_apps.discard(app.appid)
+        self._storing_map.apps[app.appid] = app
+        self._changed_apps.add(app.appid)
+
+    def _start_import(self, package_ids: Set[int], app_ids: Iterable[int] = ()):
+        self._parsing_status.packages = package_ids
+        self._parsing_status.apps = set(app_ids)
+        self._failed_apps = set()
+        self._import_started_at = time.monotonic()
+        self._packages_asked = len(package_ids)
+        self._apps_received = 0
+        self._bytes_received = 0
+        self._update_ready_state()
 
     def start_packages_import(self, steam_licenses: List[SteamLicense]):
-        package_ids = self.get_package_ids()
-        self._parsing_status.packages_to_parse = 0
-        logger.debug('Licenses to parse: %d, cached package_ids: %d', len(steam_licenses), package_ids)
+        logger.debug('Licenses to parse: %d, cached package_ids: %d', len(steam_licenses), len(self._licenses))
+        package_ids = set()
         for steam_license in steam_licenses:
-            if steam_license.license.package_id in package_ids:
+            package_id = steam_license.license.package_id
+            if package_id in self._licenses:
                 continue
-            self._storing_map.licenses.append(License(package_id=str(steam_license.license.package_id),
-                                             shared=steam_license.shared))
-            self._parsing_status.packages_to_parse += 1
-        self._parsing_status.apps_to_parse = 0
-        self._update_ready_state()
+            self._add_license(License(package_id=package_id, shared=steam_license.shared))
+            package_ids.add(package_id)
+        self._start_import(package_ids)
+
+    def reconcile_licenses(self,
+        steam_licenses: List[SteamLicense],
+        package_changes: Optional[Dict[int, int]] = None,
+        app_changes: Optional[Dict[int, int]] = None,
+    ) -> Tuple[List[SteamLicense], Set[int]]:
+        """Bring the cached licenses in line with the ones steam sent: add new packages, drop the ones no longer owned
+        (with apps nothing else refers to) and keep everything already resolved.
+
+        package_changes and app_changes have the change numbers PICS reports for changed packages and apps. Resolved
+        packages and cached apps they are newer than are asked for again, and keep what the cache has until the new info
+        comes in. Apps come back whatever their packages are up to: once a package comes in, only the apps the cache
+        doesn't have are asked for.
+
+        Returns the licenses whose packages need to be asked for, one per package, and the appids to ask for again. The
+        cache gets ready once exactly those are in.
+        """
+        owned: Dict[int, SteamLicense] = {}
+        for steam_license in steam_licenses:
+            package_id = steam_license.license.package_id
+            #a package that is both owned and shared counts as owned
+            if package_id not in owned or not steam_license.shared:
+                owned[package_id] = steam_license
+
+        removed = [license for package_id, license in self._licenses.items() if package_id not in owned]
+        dropped_appids = set()
+        for license in removed:
+            dropped_appids.update(license.app_ids)
+            self._forget_license(license)
+        if removed:
+            self._storing_map.licenses = [license for license in self._storing_map.licenses if license.package_id in self._licenses]
+        for appid in dropped_appids:
+            if appid not in self._packages_by_app:
+                self._storing_map.apps.pop(appid, None)
+                self._changed_apps.add(appid)
+
+        added = 0
+        for package_id, steam_license in owned.items():
+            license = self._licenses.get(package_id)
+            if license is None:
+                self._add_license(License(package_id=package_id, shared=steam_license.shared))
+                added += 1
+            elif license.shared != steam_license.shared:
+                license.shared = steam_license.shared
+                self._changed_licenses.add(package_id)
+
+        refreshed = {
+            package_id for package_id, change_number in (package_changes or {}).items()
+            if package_id in self._resolved_packages and change_number > self._licenses[package_id].change_number
+        }
+        to_import = [
+            steam_license for package_id, steam_license in owned.items()
+            if package_id not in self._resolved_packages or package_id in refreshed
+        ]
+        app_ids = set()
+        for appid, change_number in (app_changes or {}).items():
+            app = self._storing_map.apps.get(appid)
+            if app is not None and change_number > app.change_number:
+                app_ids.add(appid)
+
+        logger.info("Licenses: %d added, %d removed, %d to import (%d of them to refresh), %d already resolved",
+            added, len(removed), len(to_import), len(refreshed), len(owned) - len(to_import))
+        self._start_import({steam_license.license.package_id for steam_license in to_import}, app_ids)
+        return to_import, app_ids
 
     def consume_added_games(self):
         apps = self._apps_added
         self._apps_added = []
         games = []
         for app in apps:
-            self._sent_apps.append(app)
+            #get_owned_games may have handed it out since
+            if app.appid in self._sent_appids:
+                continue
+            self._sent_appids.add(app.appid)
             if app.type == "game":
                 games.append(app)
         return games
 
-    def get_package_ids(self) -> Set[str]:
-        if not self._storing_map:
-            return set()
-        return set([license.package_id for license in copy.copy(self._storing_map).licenses])
-
-    def get_resolved_packages(self) -> Set[str]:
-        if not self._storing_map:
-            return set()
-        packages = set()
-        storing_map = copy.copy(self._storing_map)
-        for license in storing_map.licenses:
-            if license.app_ids:
-                resolved = True
-                for app in license.app_ids:
-                    if app not in storing_map.apps:
-                        resolved = False
-                if resolved:
-                    packages.add(license.package_id)
-        return packages
-
-    def update_packages(self):
-        self._parsing_status.packages_to_parse -= 1
-        self._update_ready_state()
+    def get_package_ids(self) -> Set[int]:
+        return set(self._licenses)
+
+    def get_resolved_packages(self) -> Set[int]:
+        return set(self._resolved_packages)
 
     async def __consume_resolved_apps(self, shared_licenses: bool, apptype: str):
-        storing_map = copy.copy(self._storing_map)
-        for license in storing_map.licenses:
-            await asyncio.sleep(0.0001)  # do not block event loop; waiting one frame (0) was not enough 78#issuecomment-687140437
+        async for license in time_sliced(list(self._storing_map.licenses)):
             if license.shared != shared_licenses:
                 continue
             for appid in license.app_ids:
@@ -125,10 +452,10 @@ class GamesCache(ProtoCache):
                     continue
                 app = self._storing_map.apps[appid]
                 if app.type == apptype:
-                    self._sent_apps.append(app)
+                    self._sent_appids.add(appid)
                     yield app
                 # Necessary for the Witcher 3 => Witcher 3 GOTY import hack
-                elif apptype == 'game' and app.type == 'dlc' and appid in WITCHER_3_DLCS_APP_IDS:
+                elif apptype == 'game' and app.type == 'dlc' and str(appid) in WITCHER_3_DLCS_APP_IDS:
                     yield app
 
     async def get_owned_games(self) -> AsyncGenerator[App, None]:
@@ -143,44 +470,212 @@ class GamesCache(ProtoCache):
         async for app in self.__consume_resolved_apps(True, 'game'):
             yield app
 
-    def update_license_apps(self, package_id, appid):
-        self._parsing_status.apps_to_parse += 1
-        for license in self._storing_map.licenses:
-            if license.package_id == package_id:
-                license.app_ids.add(appid)
-
-    def update_app_title(self, appid, title, type, parent):
-        for license in self._storing_map.licenses:
-            if appid in license.app_ids:
-                self._parsing_status.apps_to_parse -= 1
-        new_app = App(appid=appid, title=title, type=type, parent=parent)
-        self._storing_map.apps[appid] = new_app
-        if self.add_game_lever and new_app not in self._sent_apps:
-            self._apps_added.append(new_app)
+    def update_product_info(self, packages: Sequence[PackageRecord], apps: Sequence[AppRecord]):
+        """Applies a parsed PICS response in one go."""
+        self._apply_product_info(packages, apps)
+        if self._app_store is not None:
+            self._app_store.save(apps)
+
+    async def stored_apps_change_number(self) -> Optional[int]:
+        """The PICS change number the app store is current to (0 if it isn't known), None without a store."""
+        if self._app_store is None:
+            return None
+        return await self._app_store.change_number()
+
+    def expire_stored_apps(self, app_changes: Dict[int, int], change_number: int, everything: bool = False):
+        """Drops the stored apps that changed since stored_apps_change_number, see AppStore.expire. Until then
+        resolve_stored_apps resolves only what is already in the cache."""
+        if self._app_store is not None:
+            self._app_store.expire(app_changes, change_number, everything)
+
+    async def resolve_stored_apps(self, app_ids: List[int]) -> Set[int]:
+        """Returns the appids of app_ids there is no need to ask steam for: the ones already in the cache, and the ones
+        the app store has, which get applied."""
+        known = {appid for appid in app_ids if appid in self._storing_map.apps}
+        if self._app_store is None:
+            return known
+        records = await self._app_store.lookup(appid for appid in app_ids if appid not in known)
+        if records:
+            logger.info("Resolved %d of %d apps from the app store", len(records), len(app_ids))
+            self._apply_product_info((), records)
+        return known.union(record[0] for record in records)
+
+    def _apply_product_info(self, packages: Iterable[PackageRecord], apps: Iterable[AppRecord]):
+        for package_id, appids, change_number in packages:
+            if self._parsing_status.packages is not None:
+                self._parsing_status.packages.discard(package_id)
+            license = self._licenses.get(package_id)
+            if license is None:
+                continue
+            if not appids and license.app_ids:
+                #steam sent nothing on it, what we had stays until it does. So does the change number, or its change
+                #would never be asked for again.
+                self._import_incomplete = True
+                continue
+            license.change_number = change_number
+            self._set_license_apps(license, appids)
+
+        for appid, title, type_, parent, change_number in apps:
+            new_app = App(appid, title, sys.intern(type_), None if parent is None else int(parent), change_number)
+            self._parsing_status.apps.discard(appid)
+            self._apps_received += 1
+            self._store_app(new_app)
+            if self.add_game_lever and appid not in self._sent_appids:
+                self._apps_added.append(new_app)
+
+        self._update_ready_state()
 
+    def product_info_failed(self, package_ids: Iterable[int], app_ids: Iterable[int]):
+        """Stops waiting for packages and apps steam failed to deliver, as opposed to ones it says it doesn't know.
+        Nothing is stored for them: cached ones stay as they are, packages missing apps stay unresolved to be asked for
+        again, and the change number doesn't move on past them."""
+        status = self._parsing_status
+        for package_id in package_ids:
+            if status.packages is not None:
+                status.packages.discard(package_id)
+        for appid in app_ids:
+            status.apps.discard(appid)
+            if appid not in self._storing_map.apps:
+                self._failed_apps.add(appid)
+        self._import_incomplete = True
         self._update_ready_state()
 
+    def _missing_apps_pending(self) -> int:
+        """The missing apps of packages the import still waits for, which the failed ones aren't."""
+        return self._missing_apps_total - sum(len(self._packages_by_app.get(appid, ())) for appid in self._failed_apps)
+
+    def count_received_bytes(self, size: int):
+        self._bytes_received += size
+
+    @property
+    def progress(self) -> Optional[ImportProgress]:
+        """How far the running (or last) import got. None before the first one starts."""
+        if self._import_started_at is None:
+            return None
+        status = self._parsing_status
+        packages_pending = len(status.packages) if status.packages is not None else 0
+        apps_pending = len(status.apps) + self._missing_apps_pending()
+        return ImportProgress(
+            self._packages_asked - packages_pending,
+            self._packages_asked,
+            self._apps_received,
+            self._apps_received + apps_pending,
+            self._bytes_received,
+            time.monotonic() - self._import_started_at,
+        )
+
+    async def wait_resolved(self, timeout: float, import_deadline: float) -> bool:
+        """Waits for the cache to get ready, for at most timeout seconds, and no longer than import_deadline seconds
+        after the import started. Returns whether it got ready. If it didn't, what is resolved so far can be handed out,
+        and the rest comes in through add_game_lever."""
+        give_up_at = time.monotonic() + timeout
+        while not self.ready:
+            deadline = give_up_at
+            if self._import_started_at is not None:
+                deadline = min(deadline, self._import_started_at + import_deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            #the import may start meanwhile, which brings the deadline closer
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._ready_event.wait(), min(remaining, 1.0))
+        return True
+
     def _update_ready_state(self):
-        if self._parsing_status.packages_to_parse == 0 and self._parsing_status.apps_to_parse == 0:
+        status = self._parsing_status
+        if status.packages is not None and not status.packages and not status.apps and not self._missing_apps_pending():
+            if self._change_number_when_ready is not None:
+                if self._import_incomplete:
+                    logger.warning("Some product info didn't come, staying at PICS change %d", self._storing_map.change_number)
+                else:
+                    self._storing_map.change_number = self._change_number_when_ready
+                    self._change_number_changed = True
+                self._change_number_when_ready = None
+                self._import_incomplete = False
             if self._ready_event.is_set():
                 return
-            logger.info("Setting state to ready")
+            logger.info("Setting state to ready: %s", self.progress)
             self._ready_event.set()
         else:
             self._ready_event.clear()
 
-    def dump(self):
-        cache_json = {}
-        cache_json['licenses'] = self._storing_map.to_json()
+    def dump(self) -> str:
+        cache_json = self._storing_map.to_records()
         cache_json['version'] = self.version
-        return json.dumps(cache_json)
-
-    def loads(self, persistent_cache):
-        cache = json.loads(persistent_cache)
-
-        if 'version' not in cache or cache['version'] != self.version:
+        return json.dumps(cache_json, separators=(',', ':'))
+
+    def _dump_changes(self) -> str:
+        lines = []
+        if self._change_number_changed:
+            lines.append(_journal_line([_JOURNAL_CHANGE_NUMBER, self._storing_map.change_number]))
+        for package_id in self._changed_licenses:
+            license = self._licenses.get(package_id)
+            if license is None:
+                lines.append(_journal_line([_JOURNAL_LICENSE_REMOVED, package_id]))
+            else:
+                lines.append(_journal_line([_JOURNAL_LICENSE] + _license_record(license)))
+        for appid in self._changed_apps:
+            app = self._storing_map.apps.get(appid)
+            if app is None:
+                lines.append(_journal_line([_JOURNAL_APP_REMOVED, appid]))
+            else:
+                lines.append(_journal_line([_JOURNAL_APP] + _app_record(app)))
+        self._forget_changes()
+        return "".join(lines)
+
+    def _forget_changes(self):
+        self._changed_licenses = set()
+        self._changed_apps = set()
+        self._change_number_changed = False
+
+    def persist(self, persistent_cache: Dict[str, str]) -> bool:
+        """Write what changed since the last call into persistent_cache, appended to the journal. Every so often (and the
+        first time) a new snapshot is written instead. Returns False when there was nothing to write."""
+        snapshot = persistent_cache.get(GAMES_CACHE_KEY)
+        if self._needs_snapshot or snapshot is None:
+            self._write_snapshot(persistent_cache)
+            return True
+        changes = self._dump_changes()
+        if not changes:
+            return False
+        journal = persistent_cache.get(GAMES_JOURNAL_KEY, "") + changes
+        if len(journal) > max(JOURNAL_COMPACT_MIN_SIZE, len(snapshot) * JOURNAL_COMPACT_RATIO):
+            self._write_snapshot(persistent_cache)
+        else:
+            persistent_cache[GAMES_JOURNAL_KEY] = journal
+        return True
+
+    def _write_snapshot(self, persistent_cache: Dict[str, str]):
+        logger.info("Writing a games cache snapshot")
+        persistent_cache[GAMES_CACHE_KEY] = self.dump()
+        persistent_cache[GAMES_JOURNAL_KEY] = ""
+        self._forget_changes()
+        self._needs_snapshot = False
+
+    def loads(self, persistent_cache, journal: str = ""):
+        self._use_loaded_cache(_load_cache(persistent_cache, journal, self.version, self._LEGACY_VERSION))
+
+    async def load(self, persistent_cache: str, journal: str = ""):
+        """loads, with the parsing and indexing done on an executor thread. Until it's done the cache looks empty,
+        and wait_loaded waits for it."""
+        self._loaded_event.clear()
+        try:
+            loaded = await asyncio.get_running_loop().run_in_executor(
+                None, _load_cache, persistent_cache, journal, self.version, self._LEGACY_VERSION
+            )
+            self._use_loaded_cache(loaded)
+        except Exception:
+            logger.exception("Failed to load games cache, starting from scratch")
+        finally:
+            self._loaded_event.set()
+
+    async def wait_loaded(self):
+        await self._loaded_event.wait()
+
+    def _use_loaded_cache(self, loaded: Optional[Tuple[LicensesCache, _Indexes, bool]]):
+        if loaded is None:
             logging.error("New plugin version, refreshing cache")
             return
-
-        self._storing_map = LicensesCache.from_json(cache['licenses'])
-        logging.info(f"Loaded games from cache {self._storing_map}")
+        self._storing_map, indexes, self._needs_snapshot = loaded
+        self._use_indexes(indexes)
+        logging.info("Loaded %d licenses and %d apps from cache", len(self._licenses), len(self._storing_map.apps))
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+
+DEFAULT_RATE = 200.0 #notifications per second, once the burst is spent
+DEFAULT_BURST = 100
+
+
+class NotificationPacer:
+    """Paces notifications to Galaxy (add_game and the like) with a token bucket, and holds them back whenever the
+    connection to Galaxy is backed up.
+
+    The bucket holds up to `burst` tokens and refills at `rate` tokens a second; every notification takes one.
+    Once a notification has a token, `drain` is awaited. For the plugin's stream writer, that returns at once
+    unless Galaxy has stopped reading and the write buffer has grown past its high-water mark. Only one caller drains at
+    a time: on python 3.7 a second drain of a paused StreamWriter fails an assertion.
+    """
+
+    def __init__(self,
+        drain: Optional[Callable[[], Awaitable[None]]] = None,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+    ):
+        self._drain = drain
+        self._rate = rate
+        self._burst = burst
+        self._tokens: float = float(burst)
+        self._refilled_at: Optional[float] = None
+        self._drain_lock = asyncio.Lock()
+
+    def _refill(self):
+        now = asyncio.get_running_loop().time()
+        if self._refilled_at is not None:
+            self._tokens = min(self._tokens + (now - self._refilled_at) * self._rate, self._burst)
+        self._refilled_at = now
+
+    async def acquire(self):
+        """Waits until another notification may be sent."""
+        self._refill()
+        if self._tokens < 1:
+            #timers can fire late (about 15ms on Windows), the next refill makes up for it
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+            self._refill()
+        self._tokens -= 1
+        if self._drain is not None:
+            async with self._drain_lock:
+                await self._drain()
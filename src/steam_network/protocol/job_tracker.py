@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Any, Dict
+
+
+logger = logging.getLogger(__name__)
+
+#jobid_source and jobid_target default to this (uint64 max) in CMsgProtoBufHeader when a message isn't part of a job.
+NO_JOB_ID = 0xFFFFFFFFFFFFFFFF
+DEFAULT_JOB_TIMEOUT = 30
+
+
+class JobTracker:
+    """Keeps track of the requests we've sent to steam that are still waiting on a reply.
+
+    Every request we send as a job gets a unique jobid_source. Steam echoes that id back as the jobid_target of the reply,
+    so we can hand the reply to whoever is waiting on it, no matter how many other calls are in flight at the same time.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, asyncio.Future] = {}
+
+    def register(self, job_id: int) -> asyncio.Future:
+        """Create the future the reply for job_id will be delivered to."""
+        if job_id in self._pending:
+            raise ValueError(f"Job {job_id} is already pending")
+        future = asyncio.get_running_loop().create_future()
+        self._pending[job_id] = future
+        return future
+
+    def resolve(self, job_id: int, *reply: Any) -> bool:
+        """Deliver a reply to the job waiting on it. Returns False if nobody is waiting for job_id (or it already timed out)."""
+        if job_id == NO_JOB_ID:
+            return False
+        future = self._pending.pop(job_id, None)
+        if future is None:
+            return False
+        if future.done():
+            #the caller gave up (timed out or got cancelled) but hasn't cleaned up yet. nothing to deliver to.
+            logger.debug("Reply for job %d arrived after the caller gave up", job_id)
+            return True
+        future.set_result(reply)
+        return True
+
+    def discard(self, job_id: int):
+        """Stop waiting for job_id. Any reply that arrives later is treated as unsolicited."""
+        future = self._pending.pop(job_id, None)
+        if future is not None and not future.done():
+            future.cancel()
+
+    def cancel_all(self):
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    def __contains__(self, job_id: int) -> bool:
+        return job_id in self._pending
+
+    def __len__(self) -> int:
+        return len(self._pending)
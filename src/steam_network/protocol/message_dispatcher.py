@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional
+
+from .message_registry import emsg_name
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HANDLER_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 256 #messages waiting per queue before the reader stops reading from the socket.
+
+MessageHandler = Callable[[int, Any, Any], Awaitable[None]]
+
+
+class MessageDispatcher:
+    """Runs message handlers on worker tasks, so whoever reads the socket only has to queue what it received.
+
+    Messages whose emsg is in ordering are handled one at a time, in the order they were queued, together with every other
+    message of the same ordering class (each class has its own queue and worker). Everything else goes to a shared queue
+    drained by a pool of workers, and may be handled concurrently and out of order.
+
+    Queues are bounded: put waits while the queue is full, which in turn stops the reader from reading more.
+    If a handler raises, the exception is set on failure, so the owner can stop (and reconnect) like it did when
+    handlers ran inline. Later messages keep being handled until the dispatcher is closed, and their failures are only logged.
+    """
+
+    def __init__(self,
+        handler: MessageHandler,
+        ordering: Mapping[int, str],
+        workers: int = DEFAULT_HANDLER_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self._handler = handler
+        self._ordering = ordering
+        self._workers = workers
+        self._queue_size = queue_size
+
+        self._ordered_queues: Dict[str, asyncio.Queue] = {}
+        self._shared_queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._failure: Optional[asyncio.Future] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def failure(self) -> asyncio.Future:
+        """Completes with the exception of the first handler that failed since start."""
+        assert self._failure is not None, "dispatcher is not running"
+        return self._failure
+
+    @property
+    def queue_depth(self) -> int:
+        queues = list(self._ordered_queues.values())
+        if self._shared_queue is not None:
+            queues.append(self._shared_queue)
+        return sum(queue.qsize() for queue in queues)
+
+    def start(self):
+        if self.running:
+            return
+        self._failure = asyncio.get_running_loop().create_future()
+        self._shared_queue = asyncio.Queue(self._queue_size)
+        self._ordered_queues = {ordering_class: asyncio.Queue(self._queue_size) for ordering_class in set(self._ordering.values())}
+        for queue in self._ordered_queues.values():
+            self._tasks.append(asyncio.create_task(self._worker(queue)))
+        for _ in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._worker(self._shared_queue)))
+
+    async def put(self, emsg: int, header, body):
+        ordering_class = self._ordering.get(emsg)
+        queue = self._ordered_queues[ordering_class] if ordering_class is not None else self._shared_queue
+        await queue.put((emsg, header, body))
+
+    async def join(self):
+        """Wait until every queued message was handled."""
+        for queue in [*self._ordered_queues.values(), self._shared_queue]:
+            if queue is not None:
+                await queue.join()
+
+    async def close(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._ordered_queues = {}
+        self._shared_queue = None
+        if self._failure is not None and not self._failure.done():
+            self._failure.cancel()
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            emsg, header, body = await queue.get()
+            try:
+                await self._handler(emsg, header, body)
+            except Exception as e:
+                if not self._failure.done():
+                    self._failure.set_exception(e)
+                else:
+                    logger.exception("Handling EMsg.%s failed", emsg_name(emsg))
+            finally:
+                queue.task_done()
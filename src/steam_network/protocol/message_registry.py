@@ -0,0 +1,51 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .consts import EMsg
+
+
+logger = logging.getLogger(__name__)
+
+#built once so logging an incoming message doesn't construct an enum member (or blow up on values we don't know) for every packet.
+EMSG_NAMES: Dict[int, str] = {emsg.value: emsg.name for emsg in EMsg}
+
+#handlers are unbound methods, called as handler(client, header, body)
+MessageHandler = Callable[[Any, Any, bytes], Awaitable[None]]
+
+
+def emsg_name(emsg: int) -> str:
+    return EMSG_NAMES.get(emsg, f"Unknown{emsg}")
+
+
+class MessageRegistry:
+    """Maps EMsg values and service method names to the handler that processes them.
+
+    Handlers register themselves with the message and service_method decorators when their class is defined,
+    so the table is complete at import time and dispatching a message is a single dict lookup.
+    """
+
+    def __init__(self):
+        self._message_handlers: Dict[int, MessageHandler] = {}
+        self._service_method_handlers: Dict[str, MessageHandler] = {}
+
+    def message(self, emsg: int) -> Callable[[MessageHandler], MessageHandler]:
+        def decorator(handler: MessageHandler) -> MessageHandler:
+            if emsg in self._message_handlers:
+                raise ValueError(f"EMsg.{emsg_name(emsg)} already has a handler")
+            self._message_handlers[emsg] = handler
+            return handler
+        return decorator
+
+    def service_method(self, target_job_name: str) -> Callable[[MessageHandler], MessageHandler]:
+        def decorator(handler: MessageHandler) -> MessageHandler:
+            if target_job_name in self._service_method_handlers:
+                raise ValueError(f"{target_job_name} already has a handler")
+            self._service_method_handlers[target_job_name] = handler
+            return handler
+        return decorator
+
+    def message_handler(self, emsg: int) -> Optional[MessageHandler]:
+        return self._message_handlers.get(emsg)
+
+    def service_method_handler(self, target_job_name: str) -> Optional[MessageHandler]:
+        return self._service_method_handlers.get(target_job_name)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import struct
+import zlib
+from typing import AsyncIterator, Iterator, Union
+
+
+logger = logging.getLogger(__name__)
+
+#gzip header and trailer, not a raw zlib stream.
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+#how much compressed data is inflated at once. Steam compresses Multis roughly 8:1, so this keeps every step well under a megabyte.
+COMPRESSED_CHUNK_SIZE = 2 ** 16
+
+_SIZE = struct.Struct("<I")
+
+
+async def iter_multi_packets(message_body: bytes, size_unzipped: int = 0) -> AsyncIterator[Union[bytes, memoryview]]:
+    """Yields the length-prefixed packets inside a CMsgMulti body, in order.
+
+    Uncompressed bodies yield views into message_body. Gzipped ones (size_unzipped > 0) are inflated a chunk at a time,
+    and each packet is yielded as soon as all of it has been inflated, so the caller can process the first packets while the
+    rest are still compressed, and we never hold more than one chunk plus one packet of unzipped data.
+    Between chunks the loop gets a turn, so inflating a big Multi doesn't hold up heartbeats.
+    """
+    if size_unzipped > 0:
+        async for packet in _iter_gzip_packets(message_body, size_unzipped):
+            yield packet
+    else:
+        for packet in _iter_packets(memoryview(message_body)):
+            yield packet
+
+
+def _iter_packets(data: memoryview) -> Iterator[memoryview]:
+    data_size = len(data)
+    offset = 0
+    while offset + _SIZE.size <= data_size:
+        size = _SIZE.unpack_from(data, offset)[0]
+        offset += _SIZE.size
+        yield data[offset:offset + size]
+        offset += size
+
+
+async def _iter_gzip_packets(message_body: bytes, size_unzipped: int) -> AsyncIterator[bytes]:
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    compressed = memoryview(message_body)
+    buffer = bytearray()
+    unzipped = 0
+
+    for start in range(0, len(compressed), COMPRESSED_CHUNK_SIZE):
+        if start:
+            await asyncio.sleep(0)
+        chunk = decompressor.decompress(compressed[start:start + COMPRESSED_CHUNK_SIZE])
+        unzipped += len(chunk)
+        buffer += chunk
+        for packet in _pop_packets(buffer):
+            yield packet
+        if decompressor.eof:
+            break
+
+    if not decompressor.eof:
+        logger.warning("Multi body ended before the end of its gzip stream, %d of %d bytes unzipped", unzipped, size_unzipped)
+    elif unzipped != size_unzipped:
+        logger.warning("Multi unzipped to %d bytes, expected %d", unzipped, size_unzipped)
+    if buffer:
+        logger.warning("Ignoring %d trailing bytes of an incomplete packet in Multi", len(buffer))
+
+
+def _pop_packets(buffer: bytearray) -> Iterator[bytes]:
+    #packets are copied out (instead of yielding views) so the consumed part of the buffer can be dropped once we're done with it.
+    offset = 0
+    buffer_size = len(buffer)
+    with memoryview(buffer) as view:
+        while offset + _SIZE.size <= buffer_size:
+            size = _SIZE.unpack_from(view, offset)[0]
+            end = offset + _SIZE.size + size
+            if end > buffer_size:
+                break
+            yield bytes(view[offset + _SIZE.size:end])
+            offset = end
+    del buffer[:offset]
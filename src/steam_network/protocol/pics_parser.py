@@ -0,0 +1,153 @@
+"""Turns the VDF buffers in PICS product info responses into small tuples.
+
+Everything here is a plain module level function on picklable arguments, so it can run in a process pool as well as
+in a thread pool. Nothing here touches the caches: results are applied by whoever awaited them, on the event loop.
+"""
+import logging
+import os
+import re
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import vdf
+
+
+logger = logging.getLogger(__name__)
+
+#(package_id, appids in the package, change number)
+PackageRecord = Tuple[int, Tuple[int, ...], int]
+#(appid, title, type, parent appid for dlcs, change number)
+AppRecord = Tuple[int, str, str, Optional[str], int]
+
+#type given to apps whose info we couldn't make sense of. Their title is unknown too.
+UNKNOWN_TYPE = "unknown"
+
+#how many packages or apps are sent to the executor at once. Big responses are split so every core gets a share.
+PARSE_CHUNK_SIZE = 64
+#responses smaller than this (in items and in buffer bytes) are parsed on the default executor. Sending them to another
+#process costs more than it saves, and a session that only looks up an app now and then never starts the pool's workers.
+POOL_MIN_ITEMS = PARSE_CHUNK_SIZE
+POOL_MIN_BYTES = 256 * 1024
+
+
+def create_parser_pool(max_workers: Optional[int] = None) -> Executor:
+    """A process pool for parsing big PICS responses on all cores. Workers are only started once something big is parsed."""
+    return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count())
+
+
+def parse_packages(packages: Sequence[Tuple[int, int, bytes]]) -> List[PackageRecord]:
+    """Parses (package_id, change_number, buffer) triples. Packages steam sent no info for come back without apps."""
+    records = []
+    for package_id, change_number, buffer in packages:
+        #binary vdf, after a 4 byte header
+        package = vdf.binary_loads(buffer[4:]).get(str(package_id))
+        if package is None:
+            records.append((package_id, (), change_number))
+            continue
+        records.append((package_id, tuple(int(appid) for appid in package.get('appids', {}).values()), change_number))
+    return records
+
+
+def parse_apps(apps: Sequence[Tuple[int, int, bytes]]) -> List[AppRecord]:
+    """Parses (appid, change_number, buffer) triples. Apps without a name or type come back with UNKNOWN_TYPE for both."""
+    records = []
+    for appid, change_number, buffer in apps:
+        #text vdf, null terminated
+        text = buffer[:-1].decode('utf-8', 'replace')
+        try:
+            records.append(_scan_app(appid, text) + (change_number,))
+        except _UnexpectedVdf:
+            records.append(_parse_app(appid, text) + (change_number,))
+    return records
+
+
+def _parse_app(appid: int, text: str) -> Tuple[int, str, str, Optional[str]]:
+    app_content = vdf.loads(text)
+    try:
+        appinfo = app_content['appinfo']
+        type_ = appinfo['common']['type'].lower()
+        title = appinfo['common']['name']
+        parent = None
+        if 'extended' in appinfo and type_ == 'dlc':
+            parent = appinfo['extended']['dlcforappid']
+        return appid, title, type_, parent
+    except KeyError:
+        return appid, UNKNOWN_TYPE, UNKNOWN_TYPE, None
+
+
+class _UnexpectedVdf(Exception):
+    pass
+
+
+#a quoted string, a brace, a comment, or anything else (which steam doesn't send in appinfo, so we leave it to vdf.loads)
+_VDF_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|([{}])|//[^\n]*|(\S)', re.DOTALL)
+_VDF_ESCAPES = {'n': '\n', 't': '\t', 'v': '\v', 'b': '\b', 'r': '\r', 'f': '\f', 'a': '\a', '\\': '\\', '?': '?', '"': '"', "'": "'"}
+_VDF_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+
+_WANTED_VALUES = {('common', 'name'), ('common', 'type'), ('extended', 'dlcforappid')}
+
+
+def _unescape(value: str) -> str:
+    if '\\' not in value:
+        return value
+    return _VDF_ESCAPE.sub(lambda match: _VDF_ESCAPES.get(match.group(1), match.group(0)), value)
+
+
+def _scan_app(appid: int, text: str) -> Tuple[int, str, str, Optional[str]]:
+    """Reads common.name, common.type and extended.dlcforappid straight out of appinfo text, without building the tree
+    vdf.loads would (depots, launch options, localisation and all). Gives the same result _parse_app does.
+
+    Stops as soon as it has seen what it needs, which for most apps is right after the common section.
+    Raises _UnexpectedVdf for anything it isn't sure it reads the same way vdf.loads would.
+    """
+    path: List[str] = []
+    key: Optional[str] = None
+    values = {}
+    common_done = extended_seen = extended_done = False
+
+    for match in _VDF_TOKEN.finditer(text):
+        string, brace, other = match.groups()
+        if other is not None:
+            raise _UnexpectedVdf()
+        if string is not None:
+            if key is None:
+                key = string
+                continue
+            if len(path) == 2 and path[0] == 'appinfo' and (path[1], key) in _WANTED_VALUES:
+                values[(path[1], key)] = _unescape(string)
+            key = None
+        elif brace == '{':
+            if key is None:
+                raise _UnexpectedVdf()
+            path.append(key)
+            key = None
+            if path == ['appinfo', 'extended']:
+                extended_seen = True
+        elif brace == '}':
+            if key is not None or not path:
+                raise _UnexpectedVdf()
+            if path == ['appinfo', 'common']:
+                common_done = True
+            elif path == ['appinfo', 'extended']:
+                extended_done = True
+            path.pop()
+            if common_done and len(path) == 1:
+                type_ = values.get(('common', 'type'))
+                #a dlc needs its parent from extended, which can come after common
+                if type_ is None or type_.lower() != 'dlc' or extended_done:
+                    break
+    else:
+        if path or key is not None:
+            raise _UnexpectedVdf()
+
+    title = values.get(('common', 'name'))
+    type_ = values.get(('common', 'type'))
+    if title is None or type_ is None:
+        return appid, UNKNOWN_TYPE, UNKNOWN_TYPE, None
+    type_ = type_.lower()
+    parent = None
+    if type_ == 'dlc' and extended_seen:
+        parent = values.get(('extended', 'dlcforappid'))
+        if parent is None:
+            return appid, UNKNOWN_TYPE, UNKNOWN_TYPE, None
+    return appid, title, type_, parent
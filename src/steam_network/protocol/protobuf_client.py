@@ -1,12 +1,13 @@
 import asyncio
-import gzip
 import json
 import logging
 import socket as sock
 import struct
 import ipaddress
+from concurrent.futures import Executor
+from concurrent.futures.process import BrokenProcessPool
 from itertools import count
-from typing import Awaitable, Callable, Coroutine, Dict, Optional, Any, List, NamedTuple, Iterator
+from typing import Awaitable, Callable, Dict, Optional, Any, List, NamedTuple, Iterator, Set, Tuple, Type
 
 import base64
 
@@ -65,6 +66,10 @@ from .messages.steammessages_clientserver_userstats_pb2 import (
     CMsgClientGetUserStatsResponse,
 )
 from .messages.steammessages_clientserver_appinfo_pb2 import (
+    CMsgClientPICSAccessTokenRequest,
+    CMsgClientPICSAccessTokenResponse,
+    CMsgClientPICSChangesSinceRequest,
+    CMsgClientPICSChangesSinceResponse,
     CMsgClientPICSProductInfoRequest,
     CMsgClientPICSProductInfoResponse,
 )
@@ -79,6 +84,12 @@ from .messages.steammessages_webui_friends_pb2 import (
 )
 
 from .steam_types import SteamId, ProtoUserInfo
+from .job_tracker import JobTracker, DEFAULT_JOB_TIMEOUT
+from .request_window import RequestWindow, CONGESTION_RESULTS
+from .multi_reader import iter_multi_packets
+from .message_registry import MessageRegistry, emsg_name
+from .pics_parser import AppRecord, PackageRecord, PARSE_CHUNK_SIZE, POOL_MIN_BYTES, POOL_MIN_ITEMS, UNKNOWN_TYPE, parse_apps, parse_packages
+from .message_dispatcher import MessageDispatcher, DEFAULT_HANDLER_WORKERS, DEFAULT_QUEUE_SIZE
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -93,6 +104,47 @@ LOGIN_CREDENTIALS = "Authentication.BeginAuthSessionViaCredentials#1"
 UPDATE_TWO_FACTOR = "Authentication.UpdateAuthSessionWithSteamGuardCode#1"
 CHECK_AUTHENTICATION_STATUS = "Authentication.PollAuthSessionStatus#1"
 
+#handlers for incoming messages register themselves here, see ProtobufClient._handle_message
+_messages = MessageRegistry()
+
+#subscribers get (emsg, header, body) for every message they subscribed to, after its handler ran.
+MessageSubscriber = Callable[[int, CMsgProtoBufHeader, bytes], Awaitable[None]]
+
+#messages of the same class are handled one after another, in the order steam sent them. Everything else can be handled concurrently.
+#licenses need the steam id from the logon response, and packages need to be known before the apps they contain arrive.
+#PICS responses only come after the license import asked for them, so they just keep their own order: parsing them
+#mustn't hold up a log off, nor fill the session queue (which would stop the reader, and job replies with it).
+MESSAGE_ORDERING: Dict[int, str] = {
+    EMsg.ClientLogOnResponse: "session",
+    EMsg.ClientLoggedOff: "session",
+    EMsg.ClientAccountInfo: "session",
+    EMsg.ClientLicenseList: "session",
+    EMsg.ClientPICSProductInfoResponse: "pics",
+    EMsg.ClientFriendsList: "friends",
+    EMsg.ClientPersonaState: "friends",
+    EMsg.ClientPlayerNicknameList: "friends",
+}
+
+PICS_BATCH_SIZE = 500
+PICS_REQUESTS_IN_FLIGHT = 4
+PICS_REQUEST_TIMEOUT = 60
+PICS_REQUEST_MAX_RETRIES = 3
+#steam may leave big app infos out of a response, for us to download from the http_host it names instead
+PICS_HTTP_DOWNLOADS = 8
+
+GAME_STATS_TIMEOUT = 30
+GAME_STATS_MAX_RETRIES = 3
+
+#big license lists come in several ClientLicenseList packs, and nothing says which one is the last.
+#Packs are collected until none came for this long, then imported as one list.
+LICENSE_PACK_QUIET_PERIOD = 1.0
+
+
+class PicsBatch(NamedTuple):
+    done: asyncio.Future #completes once every response to the request was handled
+    package_ids: Set[int] #ids we asked for that no response mentioned yet
+    app_ids: Set[int]
+
 
 class SteamLicense(NamedTuple):
     license: CMsgClientLicenseList.License  # type: ignore[name-defined]
@@ -106,13 +158,16 @@ class ProtobufClient:
     _MSG_PROTOCOL_VERSION = 65580
     _MSG_CLIENT_PACKAGE_VERSION = 1561159470
 
-    def __init__(self, set_socket : WebSocketClientProtocol):
+    def __init__(self,
+        set_socket : WebSocketClientProtocol,
+        handler_workers: int = DEFAULT_HANDLER_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        pics_executor: Optional[Executor] = None,
+        pics_batch_size: int = PICS_BATCH_SIZE,
+        pics_requests_in_flight: int = PICS_REQUESTS_IN_FLIGHT,
+        pics_http_get: Optional[Callable[[str, int, bytes], Awaitable[bytes]]] = None,
+    ):
         self._socket :                      WebSocketClientProtocol = set_socket
-        #new auth flow
-        self.rsa_handler:                   Optional[Callable[[EResult, int, int, int], Awaitable[None]]] = None
-        self.login_handler:                 Optional[Callable[[EResult,CAuthentication_BeginAuthSessionViaCredentials_Response], Awaitable[None]]] = None
-        self.two_factor_update_handler:     Optional[Callable[[EResult, str], Awaitable[None]]] = None
-        self.poll_status_handler:           Optional[Callable[[EResult, CAuthentication_PollAuthSessionStatus_Response], Awaitable[None]]] = None
         #old auth flow. Used to confirm login and repeat logins using the refresh token.
         self.log_on_token_handler:          Optional[Callable[[EResult, Optional[int], Optional[int]], Awaitable[None]]] = None
         self._heartbeat_task:               Optional[asyncio.Task] = None #keeps our connection alive, essentially, by pinging the steam server.
@@ -122,23 +177,56 @@ class ProtobufClient:
         self.user_info_handler:             Optional[Callable[[int, ProtoUserInfo], Awaitable[None]]] = None
         self.user_nicknames_handler:        Optional[Callable[[dict], Awaitable[None]]] = None
         self.license_import_handler:        Optional[Callable[[int], Awaitable[None]]] = None
-        self.app_info_handler:              Optional[Callable] = None
-        self.package_info_handler:          Optional[Callable[[], None]] = None
+        self.product_info_handler:          Optional[Callable[[List[PackageRecord], List[AppRecord]], None]] = None
+        self.product_info_size_handler:     Optional[Callable[[int], None]] = None
+        self.product_info_failed_handler:   Optional[Callable[[List[int], List[int]], None]] = None
+        self.stored_apps_handler:           Optional[Callable[[List[int]], Awaitable[Set[int]]]] = None
         self.translations_handler:          Optional[Callable[[int, Any], Awaitable[None]]] = None
-        self.stats_handler:                 Optional[Callable[[int, Any, Any], Awaitable[None]]] = None
+        self.stats_handler:                 Optional[Callable[[str, Any, Any, Optional[dict], int], None]] = None
         self.confirmed_steam_id:            Optional[int] = None #this should only be set when the steam id is confirmed. this occurs when we actually complete the login. before then, it will cause errors.
-        self.times_handler:                 Optional[Callable[[int, int, int], Awaitable[None]]] = None
-        self.times_import_finished_handler: Optional[Callable[[bool], Awaitable[None]]] = None
         self._session_id:                   Optional[int] = None
         self._job_id_iterator:              Iterator[int] = count(1) #this is actually clever. A lazy iterator that increments every time you call next.
-        self.job_list : List[Dict[str,str]] = []
+        self._jobs:                         JobTracker = JobTracker() #replies to anything we sent as a job are routed back to the caller through this.
+        self._request_window:               RequestWindow = RequestWindow() #throttles bulk requests (game stats) to whatever steam can keep up with.
+        self._pics_executor:                Optional[Executor] = pics_executor #PICS vdf gets parsed here. None is the loop's default (thread pool) executor.
+        self._pics_batch_size:              int = pics_batch_size
+        #bounds the PICS requests in flight. Only timeouts shrink it: big responses are slow, and that's fine.
+        self._pics_window:                  RequestWindow = RequestWindow(pics_requests_in_flight, max_size=pics_requests_in_flight, target_latency=PICS_REQUEST_TIMEOUT)
+        self._pics_sequence_numbers:        Iterator[int] = count(1)
+        self._pics_batches:                 Dict[int, PicsBatch] = {} #job id -> what's still missing from that request
+        #ids we already asked for again with an access token. If steam still wants a token for them, we can't get them.
+        self._packages_with_token:          Set[int] = set()
+        self._apps_with_token:              Set[int] = set()
+        #apps asked for whose info hasn't been handed to product_info_handler yet. Asking for them again waits for that.
+        self._apps_in_flight:               Set[int] = set()
+        #(http_host, appid, sha) -> the app's buffer. Downloads run beside the handlers, so PICS responses keep coming.
+        self._pics_http_get:                Optional[Callable[[str, int, bytes], Awaitable[bytes]]] = pics_http_get
+        self._pics_http_slots:              asyncio.Semaphore = asyncio.Semaphore(PICS_HTTP_DOWNLOADS)
+        self._pics_downloads:               Set[asyncio.Task] = set()
+        self._license_packs:                List[SteamLicense] = [] #licenses from the packs received so far
+        self._license_packs_timer:          Optional[asyncio.TimerHandle] = None
+        self._license_import_task:          Optional[asyncio.Task] = None
+
+        self._subscribers:                  Dict[Optional[int], List[MessageSubscriber]] = {}
+        #handlers run here while run() is reading, so a slow one doesn't hold up reading (and resolving job replies).
+        self._dispatcher:                   MessageDispatcher = MessageDispatcher(self._handle_message, MESSAGE_ORDERING, handler_workers, queue_size)
+
+        self._recv_task:                    Optional[asyncio.Task] = None
 
-        self.collections = {'event': asyncio.Event(),
-                            'collections': dict()}
-        self._recv_task:                    Optional[Coroutine[Any, Any, Any]] = None
     async def close(self, send_log_off):
         if (self._recv_task is not None):
             self._recv_task.cancel()
+        self._request_window.close()
+        self._pics_window.close()
+        self._apps_in_flight.clear()
+        for task in self._pics_downloads:
+            task.cancel()
+        if self._license_packs_timer is not None:
+            self._license_packs_timer.cancel()
+        if self._license_import_task is not None:
+            self._license_import_task.cancel()
+        self._jobs.cancel_all()
+        await self._dispatcher.close()
         if send_log_off:
             await self.send_log_off_message()
         if self._heartbeat_task is not None:
@@ -147,43 +235,68 @@ class ProtobufClient:
     async def wait_closed(self):
         pass
 
+    @property
+    def request_window(self) -> RequestWindow:
+        return self._request_window
+
+    def subscribe(self, emsg: Optional[int], subscriber: MessageSubscriber):
+        """Let subscriber see every incoming message of type emsg, or every message at all if emsg is None."""
+        self._subscribers.setdefault(emsg, []).append(subscriber)
+
+    def unsubscribe(self, emsg: Optional[int], subscriber: MessageSubscriber):
+        subscribers = self._subscribers.get(emsg, [])
+        if subscriber in subscribers:
+            subscribers.remove(subscriber)
+
     async def run(self):
-        jobs_to_process = 0
+        self._dispatcher.start()
+        reader = self._recv_task = asyncio.create_task(self._read_packets())
+        try:
+            await asyncio.wait({reader, self._dispatcher.failure}, return_when=asyncio.FIRST_COMPLETED)
+            if self._dispatcher.failure.done() and not self._dispatcher.failure.cancelled():
+                self._dispatcher.failure.result() #a handler failed. Raise it like we did when handlers ran on this task.
+            if reader.done() and not reader.cancelled():
+                reader.result()
+        finally:
+            reader.cancel()
+            self._recv_task = None
+            await self._dispatcher.close()
+
+    async def _read_packets(self):
         while True:
-            if jobs_to_process < 2:
-                for job in self.job_list[:2].copy():
-                    logger.info(f"New job on list {job}")
-                    jobs_to_process += 1
-                    if job['job_name'] == "import_game_stats":
-                        await self._import_game_stats(job['game_id'])
-                        self.job_list.remove(job)
-                    elif job['job_name'] == "import_collections":
-                        await self._import_collections()
-                        self.job_list.remove(job)
-                    elif job['job_name'] == "import_game_times":
-                        await self._import_game_time()
-                        self.job_list.remove(job)
-                    else:
-                        self.job_list.remove(job)
-                        logger.warning(f'Unknown job {job}')
             try:
-                self._recv_task = asyncio.create_task(self._socket.recv())
-                packet = await asyncio.wait_for(self._recv_task, 10)
-                self._recv_task = None
-                await self._process_packet(packet)
-                if jobs_to_process > 0:
-                    jobs_to_process -= 1
-            except asyncio.TimeoutError:
-                pass
+                packet = await self._socket.recv()
             except asyncio.CancelledError: #occurs when we cancel the recv. only should occur if the socket is closing anyway.
                 break
-            finally:
-                self._recv_task = None
+            await self._process_packet(packet)
+
+    async def _send_job(self, emsg, message, target_job_name: Optional[str] = None, timeout: float = DEFAULT_JOB_TIMEOUT) -> Tuple[CMsgProtoBufHeader, bytes]:
+        """Send a message as a job and wait for the reply steam sends back for that job id.
 
-    async def _send_service_method_with_name(self, message, target_job_name: str):
-        emsg = EMsg.ServiceMethodCallFromClientNonAuthed if self.confirmed_steam_id is None else EMsg.ServiceMethodCallFromClient;
+        Raises asyncio.TimeoutError if no reply arrives in time. Cancelling the caller stops waiting for the reply.
+        """
         job_id = next(self._job_id_iterator)
-        await self._send(emsg, message, source_job_id=job_id, target_job_name= target_job_name)
+        reply = self._jobs.register(job_id)
+        try:
+            await self._send(emsg, message, source_job_id=job_id, target_job_name=target_job_name)
+            return await asyncio.wait_for(reply, timeout)
+        finally:
+            self._jobs.discard(job_id)
+
+    async def _call_service_method(self, message, response_type: Type, target_job_name: str, timeout: float = DEFAULT_JOB_TIMEOUT) -> Tuple[EResult, Any]:
+        """Call a unified service method and return (eresult, parsed response). 
+
+        A call that gets no reply in time is reported as EResult.Timeout with no response, so callers can handle it like any other failed result.
+        """
+        emsg = EMsg.ServiceMethodCallFromClientNonAuthed if self.confirmed_steam_id is None else EMsg.ServiceMethodCallFromClient
+        try:
+            header, body = await self._send_job(emsg, message, target_job_name, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out waiting %ds for a reply to %s", timeout, target_job_name)
+            return (EResult.Timeout, None)
+        response = response_type()
+        response.ParseFromString(body)
+        return (header.eresult, response)
 
     #new workflow:  say hello -> get rsa public key -> log on with password -> handle steam guard -> confirm login
     #unlike how websocket client does this (currently), these functions are written separately for clarity and sanity.
@@ -198,33 +311,21 @@ class ProtobufClient:
         await self._send(EMsg.ClientHello,message)
 
     #send the get rsa key request
-    async def get_rsa_public_key(self, account_name: str):
-        """ Send a request to steam's servers for them to generate a public key for the account name provided. 
+    async def get_rsa_public_key(self, account_name: str) -> Tuple[EResult, Optional[CAuthentication_GetPasswordRSAPublicKey_Response]]:
+        """ Ask steam's servers to generate a public key for the account name provided, and wait for it.
         
         Each request generates a unique key for each login attempt, so this cannot be cached. It's also not vulnerable to replay attacks. 
         """
         message = CAuthentication_GetPasswordRSAPublicKey_Request()
         message.account_name = account_name
-        await self._send_service_method_with_name(message, GET_RSA_KEY) #parsed from SteamKit's gobbledygook
-
-    #process the received the rsa key response. Because we will need all the information about this process, we send the entire message up the chain.
-    async def _process_rsa(self, result, body):
-        """ Receive the response to the RSA request sent in get_rsa_public_key
-        
-        parses the message and retrieves the data from it, then sends this along to the handler so it can further process it.
-        """
-        message = CAuthentication_GetPasswordRSAPublicKey_Response()
-        message.ParseFromString(body)
+        result = await self._call_service_method(message, CAuthentication_GetPasswordRSAPublicKey_Response, GET_RSA_KEY) #parsed from SteamKit's gobbledygook
         logger.info("Received RSA KEY")
-        if (self.rsa_handler is not None):
-            await self.rsa_handler(result, int(message.publickey_mod, 16), int(message.publickey_exp, 16), message.timestamp)
-        else:
-            logger.warning("NO RSA HANDLER SET!")
-
-    async def log_on_password(self, account_name, enciphered_password: str, timestamp: int, os_value):
-        """Send a request to begin authentication using a user name and enciphered password. 
+        return result
 
+    async def log_on_password(self, account_name, enciphered_password: str, timestamp: int, os_value) -> Tuple[EResult, Optional[CAuthentication_BeginAuthSessionViaCredentials_Response]]:
+        """Begin authentication using a user name and enciphered password, and wait for steam's response.
 
+        The response tells us the client id, steam id and request id needed for polling, as well as what 2FA methods are allowed.
         """
         friendly_name: str = sock.gethostname() + " (GOG Galaxy)"
 
@@ -246,35 +347,11 @@ class ProtobufClient:
         
         logger.info("Sending log on message using credentials in new authorization workflow")
 
-        await self._send_service_method_with_name(message, LOGIN_CREDENTIALS)
-
-    async def _process_login(self, result, body):
-        message = CAuthentication_BeginAuthSessionViaCredentials_Response()
-        message.ParseFromString(body)
+        result = await self._call_service_method(message, CAuthentication_BeginAuthSessionViaCredentials_Response, LOGIN_CREDENTIALS)
         logger.info("Processing Login Response!")
-        """
-        client_id : int #the id assigned to us.
-        steamid : int #the id of the user that signed in
-        request_id : bytes #unique request id. needed for the polling function.
-        interval : float #interval to poll on.
-        allowed_confirmations : List[CAuthentication_AllowedConfirmation] #possible ways to authenticate for 2FA if needed.
-        #    Note: Possible values:
-        #       k_EAuthSessionGuardType_Unknown, k_EAuthSessionGuardType_None, k_EAuthSessionGuardType_EmailCode = 2, k_EAuthSessionGuardType_DeviceCode = 3,
-        #       k_EAuthSessionGuardType_DeviceConfirmation = 4, k_EAuthSessionGuardType_EmailConfirmation = 5, k_EAuthSessionGuardType_MachineToken = 6,
-        #   For the sake of copypasta, we're only supporting EmailCode, DeviceCode, and None. Unknown is expected, somewhat, but it's an error.
-        weak_token : string #ignored
-        agreement_session_url: string #ignored?
-        extended_error_message : string #used for errors.
-        """
-        ##TODO: IF WE GET ERRORS UNSET THIS.
-        #if (self.steam_id is None and message.steamid is not None):
-        #    self.steam_id = message.steamidd
-        if (self.login_handler is not None):
-            await self.login_handler(result, message)
-        else:
-            logger.warning("NO LOGIN HANDLER SET!")
+        return result
 
-    async def update_steamguard_data(self, client_id: int, steam_id:int, code:str, code_type:EAuthSessionGuardType):
+    async def update_steamguard_data(self, client_id: int, steam_id:int, code:str, code_type:EAuthSessionGuardType) -> Tuple[EResult, Optional[CAuthentication_UpdateAuthSessionWithSteamGuardCode_Response]]:
         message = CAuthentication_UpdateAuthSessionWithSteamGuardCode_Request()
 
         message.client_id = client_id
@@ -282,34 +359,17 @@ class ProtobufClient:
         message.code = code
         message.code_type = code_type
 
-        await self._send_service_method_with_name(message, UPDATE_TWO_FACTOR)
-
-    async def _process_steamguard_update(self, result, body):
-        message = CAuthentication_UpdateAuthSessionWithSteamGuardCode_Response()
-        message.ParseFromString(body)
+        result = await self._call_service_method(message, CAuthentication_UpdateAuthSessionWithSteamGuardCode_Response, UPDATE_TWO_FACTOR)
         logger.info("Processing Two Factor Response!")
         #this gives us a confirm url, but as of this writing we can ignore it. so, just the result is necessary.
+        return result
 
-        if (self.two_factor_update_handler is not None):
-            await self.two_factor_update_handler(result, message.agreement_session_url)
-        else:
-            logger.warning("NO TWO-FACTOR HANDLER SET!")
-
-    async def poll_auth_status(self, client_id:int, request_id:bytes):
+    async def poll_auth_status(self, client_id:int, request_id:bytes) -> Tuple[EResult, Optional[CAuthentication_PollAuthSessionStatus_Response]]:
         message = CAuthentication_PollAuthSessionStatus_Request()
         message.client_id = client_id
         message.request_id = request_id
 
-        await self._send_service_method_with_name(message, CHECK_AUTHENTICATION_STATUS)
-
-    async def _process_auth_poll_status(self, result, body):
-        message = CAuthentication_PollAuthSessionStatus_Response()
-        message.ParseFromString(body)
-
-        if (self.poll_status_handler is not None):
-            await self.poll_status_handler(result, message)
-        else:
-            logger.warning("NO POLL STATUS HANDLER SET!")
+        return await self._call_service_method(message, CAuthentication_PollAuthSessionStatus_Response, CHECK_AUTHENTICATION_STATUS)
 
     #old auth flow. Still necessary for remaining logged in and confirming after doing the new auth flow. 
     async def _get_obfuscated_private_ip(self) -> int:
@@ -356,7 +416,8 @@ class ProtobufClient:
             await asyncio.sleep(interval)
             await self._send(EMsg.ClientHeartBeat, message)
 
-    async def _process_client_log_on_response(self, body):
+    @_messages.message(EMsg.ClientLogOnResponse)
+    async def _process_client_log_on_response(self, header, body):
         logger.debug("Processing message ClientLogOnResponse")
         message = CMsgClientLogonResponse()
         message.ParseFromString(body)
@@ -385,18 +446,53 @@ class ProtobufClient:
 
     #retrieve info
 
-    async def _import_game_stats(self, game_id):
+    def import_game_stats(self, game_ids: List[str], schema_versions: Optional[Dict[str, Tuple[int, int]]] = None):
+        """Queue a stats request for each game. They are sent as fast as the request window allows.
+
+        schema_versions has the (schema version, stats crc) of the schemas we have. Steam leaves those out if they are
+        still current, and the stats_handler gets None for the schema.
+        """
+        schema_versions = schema_versions or {}
+        for game_id in game_ids:
+            self._request_window.submit(
+                lambda game_id=game_id: self._import_game_stats(game_id, schema_version=schema_versions.get(game_id))
+            )
+        logger.info("Queued %d game stats requests (window: %d, queued: %d)", len(game_ids), self._request_window.window_size, self._request_window.queue_depth)
+
+    async def _import_game_stats(self, game_id, attempt: int = 1, schema_version: Optional[Tuple[int, int]] = None) -> EResult:
         logger.info(f"Importing game stats for {game_id}")
         message = CMsgClientGetUserStats()
         message.game_id = int(game_id)
-        await self._send(EMsg.ClientGetUserStats, message)
+        if schema_version is not None:
+            message.schema_local_version, message.crc_stats = schema_version
+        try:
+            header, body = await self._send_job(EMsg.ClientGetUserStats, message, timeout=GAME_STATS_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._retry_game_stats(game_id, attempt, "timed out", schema_version)
+            raise
+
+        response = CMsgClientGetUserStatsResponse()
+        response.ParseFromString(body)
+        if response.eresult in CONGESTION_RESULTS:
+            self._retry_game_stats(game_id, attempt, f"rate limited ({response.eresult})", schema_version)
+        else:
+            await self._process_user_stats_response(header, body)
+        return response.eresult
+
+    def _retry_game_stats(self, game_id, attempt: int, reason: str, schema_version: Optional[Tuple[int, int]] = None):
+        if attempt >= GAME_STATS_MAX_RETRIES:
+            logger.warning("Giving up on game stats for %s after %d attempts, last one %s", game_id, attempt, reason)
+            #report it as a game without stats, so the import doesn't hang waiting for it
+            self.stats_handler(str(game_id), [], [], {}, 0)
+            return
+        logger.info("Game stats request for %s %s, retrying", game_id, reason)
+        self._request_window.submit(lambda: self._import_game_stats(game_id, attempt + 1, schema_version))
 
-    async def _import_game_time(self):
+    async def get_last_played_times(self) -> Tuple[EResult, Optional[CPlayer_GetLastPlayedTimes_Response]]:
         logger.info("Importing game times")
-        job_id = next(self._job_id_iterator)
         message = CPlayer_GetLastPlayedTimes_Request()
         message.min_last_played = 0
-        await self._send(EMsg.ServiceMethodCallFromClient, message, job_id, None, GET_LAST_PLAYED_TIMES)
+        return await self._call_service_method(message, CPlayer_GetLastPlayedTimes_Response, GET_LAST_PLAYED_TIMES)
 
     async def set_persona_state(self, state):
         message = CMsgClientChangeStatus()
@@ -414,34 +510,201 @@ class ProtobufClient:
         message.persona_state_requested = flags
         await self._send(EMsg.ClientRequestFriendData, message)
 
-    async def _import_collections(self):
-        job_id = next(self._job_id_iterator)
+    async def get_collections(self) -> Dict[str, List[int]]:
         message = CCloudConfigStore_Download_Request()
         message_inside = CCloudConfigStore_NamespaceVersion()
         message_inside.enamespace = 1
         message.versions.append(message_inside)
-        await self._send(EMsg.ServiceMethodCallFromClient, message, job_id, None, CLOUD_CONFIG_DOWNLOAD)
+        result, response = await self._call_service_method(message, CCloudConfigStore_Download_Response, CLOUD_CONFIG_DOWNLOAD)
+        if result != EResult.OK:
+            logger.warning("Failed to retrieve collections, result: %d", result)
+            return {}
 
-    async def get_packages_info(self, steam_licenses: List[SteamLicense]):
-        logger.info("Sending call %s with %d package_ids", repr(EMsg.ClientPICSProductInfoRequest), len(steam_licenses))
-        message = CMsgClientPICSProductInfoRequest()
+        collections = {}
+        for data in response.data:
+            for entry in data.entries:
+                try:
+                    loaded_val = json.loads(entry.value)
+                    collections[loaded_val['name']] = loaded_val['added']
+                except:
+                    pass
+        return collections
 
-        for steam_license in steam_licenses:
-            info = message.packages.add()
-            info.packageid = steam_license.license.package_id
-            info.access_token = steam_license.license.access_token
+    async def get_product_changes(self, since_change_number: int, num_packages_cached: int = 0, num_apps_cached: int = 0) -> Tuple[EResult, Optional[CMsgClientPICSChangesSinceResponse]]:
+        """Ask which packages and apps changed since the given PICS change number.
 
-        await self._send(EMsg.ClientPICSProductInfoRequest, message)
+        When steam no longer has that far back (or the number is 0) the response has force_full_update set and no changes.
+        """
+        logger.info("Requesting PICS changes since %d", since_change_number)
+        message = CMsgClientPICSChangesSinceRequest()
+        message.since_change_number = since_change_number
+        message.send_package_info_changes = True
+        message.send_app_info_changes = True
+        message.num_package_info_cached = num_packages_cached
+        message.num_app_info_cached = num_apps_cached
+        try:
+            header, body = await self._send_job(EMsg.ClientPICSChangesSinceRequest, message, timeout=PICS_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out waiting %ds for PICS changes", PICS_REQUEST_TIMEOUT)
+            return EResult.Timeout, None
+        #the header only carries a result when something went wrong
+        if header.HasField("eresult") and header.eresult != EResult.OK:
+            return header.eresult, None
+        response = CMsgClientPICSChangesSinceResponse()
+        response.ParseFromString(body)
+        return EResult.OK, response
 
-    async def get_apps_info(self, app_ids):
-        logger.info("Sending call %s with %d app_ids", repr(EMsg.ClientPICSProductInfoRequest), len(app_ids))
+    async def get_packages_info(self, steam_licenses: List[SteamLicense]):
+        packages = [(steam_license.license.package_id, steam_license.license.access_token) for steam_license in steam_licenses]
+        self._request_product_info(packages, [])
+
+    async def get_apps_info(self, app_ids, refresh: bool = False):
+        """Asks for each app once: apps already asked for share the reply that is on its way.
+        Unless refresh is set, apps the stored_apps_handler resolves from what it has aren't asked for either."""
+        app_ids = [app_id for app_id in dict.fromkeys(app_ids) if app_id not in self._apps_in_flight]
+        if not app_ids:
+            return
+        self._apps_in_flight.update(app_ids)
+        if not refresh and self.stored_apps_handler is not None:
+            try:
+                stored = await self.stored_apps_handler(app_ids)
+            except BaseException:
+                self._apps_in_flight.difference_update(app_ids)
+                raise
+            self._apps_in_flight.difference_update(stored)
+            app_ids = [app_id for app_id in app_ids if app_id not in stored]
+        self._request_product_info([], [(app_id, 0) for app_id in app_ids])
+
+    def _product_info_received(self, packages: List[PackageRecord], apps: List[AppRecord]):
+        self._apps_in_flight.difference_update(app[0] for app in apps)
+        self.product_info_handler(packages, apps)
+
+    def _request_product_info(self, packages: List[Tuple[int, int]], apps: List[Tuple[int, int]]):
+        """Queue PICS requests for packages and apps, given as (id, access token), in batches of at most pics_batch_size.
+
+        Batches go out as fast as the PICS request window allows, and each one is retried if steam doesn't answer it in time.
+        """
+        batch_size = self._pics_batch_size
+        for start in range(0, len(packages), batch_size):
+            batch = packages[start:start + batch_size]
+            self._pics_window.submit(lambda batch=batch: self._send_product_info_request(batch, []))
+        for start in range(0, len(apps), batch_size):
+            batch = apps[start:start + batch_size]
+            self._pics_window.submit(lambda batch=batch: self._send_product_info_request([], batch))
+        logger.info("Queued PICS requests for %d packages and %d apps (window: %d, queued: %d)",
+            len(packages), len(apps), self._pics_window.window_size, self._pics_window.queue_depth)
+
+    async def _send_product_info_request(self, packages: List[Tuple[int, int]], apps: List[Tuple[int, int]], attempt: int = 1) -> EResult:
         message = CMsgClientPICSProductInfoRequest()
-
-        for app_id in app_ids:
+        message.sequence_number = next(self._pics_sequence_numbers)
+        for package_id, access_token in packages:
+            info = message.packages.add()
+            info.packageid = package_id
+            info.access_token = access_token
+        for app_id, access_token in apps:
             info = message.apps.add()
             info.appid = app_id
+            info.access_token = access_token
 
-        await self._send(EMsg.ClientPICSProductInfoRequest, message)
+        #steam answers with the job id we send, possibly over several responses. The last one completes the batch.
+        job_id = next(self._job_id_iterator)
+        batch = self._pics_batches[job_id] = PicsBatch(
+            asyncio.get_running_loop().create_future(),
+            {package_id for package_id, _ in packages},
+            {app_id for app_id, _ in apps},
+        )
+        logger.info("Sending PICS request #%d with %d packages and %d apps", message.sequence_number, len(packages), len(apps))
+        try:
+            await self._send(EMsg.ClientPICSProductInfoRequest, message, source_job_id=job_id)
+            await asyncio.wait_for(batch.done, PICS_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._retry_product_info(batch, packages, apps, attempt, message.sequence_number)
+            raise
+        finally:
+            del self._pics_batches[job_id]
+        return EResult.OK
+
+    def _retry_product_info(self, batch: PicsBatch, packages: List[Tuple[int, int]], apps: List[Tuple[int, int]], attempt: int, sequence_number: int):
+        #only ask again for what none of the responses (if any came) had
+        packages = [package for package in packages if package[0] in batch.package_ids]
+        apps = [app for app in apps if app[0] in batch.app_ids]
+        if attempt >= PICS_REQUEST_MAX_RETRIES:
+            logger.warning("Giving up on PICS request #%d after %d attempts", sequence_number, attempt)
+            self._product_info_failed([package_id for package_id, _ in packages], [app_id for app_id, _ in apps])
+            return
+        logger.info("PICS request #%d timed out, retrying", sequence_number)
+        self._pics_window.submit(lambda: self._send_product_info_request(packages, apps, attempt + 1))
+
+    def _product_info_unavailable(self, package_ids: List[int], app_ids: List[int]):
+        """Report packages and apps steam says it won't give us as empty packages and apps we know nothing about, so the
+        import doesn't wait for them. Packages without apps aren't resolved, so they get asked for again next time."""
+        if package_ids or app_ids:
+            logger.info("No product info available for %d packages and %d apps", len(package_ids), len(app_ids))
+            self._product_info_received(
+                [(package_id, (), 0) for package_id in package_ids],
+                [(app_id, UNKNOWN_TYPE, UNKNOWN_TYPE, None, 0) for app_id in app_ids]
+            )
+
+    def _product_info_failed(self, package_ids: List[int], app_ids: List[int]):
+        """Report packages and apps we gave up asking for (timeouts, failed downloads), so the import doesn't wait for
+        them. Steam didn't say anything about them, so unlike _product_info_unavailable there is nothing to apply."""
+        if package_ids or app_ids:
+            logger.warning("Gave up on product info of %d packages and %d apps", len(package_ids), len(app_ids))
+            self._apps_in_flight.difference_update(app_ids)
+            if self.product_info_failed_handler is not None:
+                self.product_info_failed_handler(package_ids, app_ids)
+
+    def _download_apps_info(self, http_host: str, app_infos: List[CMsgClientPICSProductInfoResponse.AppInfo]):
+        apps = [(info.appid, info.change_number, info.sha) for info in app_infos]
+        logger.info("Downloading info of %d apps from %s", len(apps), http_host)
+        task = asyncio.create_task(self._download_and_parse_apps_info(http_host, apps))
+        self._pics_downloads.add(task)
+        task.add_done_callback(self._pics_downloads.discard)
+
+    async def _download_and_parse_apps_info(self, http_host: str, apps: List[Tuple[int, int, bytes]]):
+        async def download(appid: int, sha: bytes) -> Optional[bytes]:
+            if self._pics_http_get is None:
+                return None
+            async with self._pics_http_slots:
+                try:
+                    return await self._pics_http_get(http_host, appid, sha)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Can't download info of app %d from %s: %r", appid, http_host, e)
+                    return None
+
+        buffers = await asyncio.gather(*[download(appid, sha) for appid, _, sha in apps])
+        downloaded = [(appid, change_number, buffer) for (appid, change_number, _), buffer in zip(apps, buffers) if buffer is not None]
+        parsed = await self._parse_product_info(parse_apps, downloaded)
+        if parsed:
+            self._product_info_received([], parsed)
+        self._product_info_failed([], [appid for (appid, _, _), buffer in zip(apps, buffers) if buffer is None])
+
+    async def _request_access_tokens(self, package_ids: List[int], app_ids: List[int]) -> EResult:
+        logger.info("Requesting access tokens for %d packages and %d apps", len(package_ids), len(app_ids))
+        message = CMsgClientPICSAccessTokenRequest()
+        message.packageids.extend(package_ids)
+        message.appids.extend(app_ids)
+        try:
+            header, body = await self._send_job(EMsg.ClientPICSAccessTokenRequest, message, timeout=PICS_REQUEST_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._product_info_failed(package_ids, app_ids)
+            raise
+        response = CMsgClientPICSAccessTokenResponse()
+        response.ParseFromString(body)
+
+        packages = [(token.packageid, token.access_token) for token in response.package_access_tokens]
+        apps = [(token.appid, token.access_token) for token in response.app_access_tokens]
+        self._packages_with_token.update(package_id for package_id, _ in packages)
+        self._apps_with_token.update(app_id for app_id, _ in apps)
+        #denied, or not mentioned at all
+        self._product_info_unavailable(
+            list(set(package_ids).difference(package_id for package_id, _ in packages)),
+            list(set(app_ids).difference(app_id for app_id, _ in apps)),
+        )
+        self._request_product_info(packages, apps)
+        return EResult.OK
 
     async def get_presence_localization(self, appid, language='english'):
         logger.info(f"Sending call for rich presence localization with {appid}, {language}")
@@ -500,14 +763,18 @@ class ProtobufClient:
         await self._socket.send(data)
 
     async def _process_packet(self, packet):
+        #everything below works on views into the packet we received, so the header and body (and every message nested in a Multi)
+        #get handed to protobuf without being copied first. Handlers receive the body as a memoryview.
+        packet = memoryview(packet)
         package_size = len(packet)
         logger.debug("Processing packet of %d bytes", package_size)
         if package_size < 8:
             logger.warning("Package too small, ignoring...")
-        raw_emsg = struct.unpack("<I", packet[:4])[0]
+            return
+        raw_emsg = struct.unpack_from("<I", packet)[0]
         emsg: int = raw_emsg & ~self._PROTO_MASK
         if raw_emsg & self._PROTO_MASK != 0:
-            header_len = struct.unpack("<I", packet[4:8])[0]
+            header_len = struct.unpack_from("<I", packet, 4)[0]
             header = CMsgProtoBufHeader()
             header.ParseFromString(packet[8:8 + header_len])
             if header.client_sessionid != 0:
@@ -515,66 +782,54 @@ class ProtobufClient:
                     logger.info("New session id: %d", header.client_sessionid)
                     self._session_id = header.client_sessionid
                 if self._session_id != header.client_sessionid:
-                    logger.warning('Received session_id %s while client one is %s', header.client_sessionId, self._session_id)
+                    logger.warning('Received session_id %s while client one is %s', header.client_sessionid, self._session_id)
             await self._process_message(emsg, header, packet[8 + header_len:])
         else:
-            logger.warning("Packet for %d -> EMsg.%s with extended header - ignoring", emsg, EMsg(emsg).name)
+            logger.warning("Packet for %d -> EMsg.%s with extended header - ignoring", emsg, emsg_name(emsg))
 
     async def _process_message(self, emsg: int, header, body):
-        logger.info("[In] %d -> EMsg.%s", emsg, EMsg(emsg).name)
+        logger.info("[In] %d -> EMsg.%s", emsg, emsg_name(emsg))
+        #replies to jobs are resolved right here, so whoever waits for them doesn't wait for unrelated handlers too.
+        if self._jobs.resolve(header.jobid_target, header, body):
+            return
+        #and a Multi is unpacked here, so the messages inside it get queued in the order they were sent.
         if emsg == EMsg.Multi:
-            await self._process_multi(body)
-        elif emsg == EMsg.ClientLogOnResponse:
-            await self._process_client_log_on_response(body)
-        elif emsg == EMsg.ClientLoggedOff:
-            await self._process_client_logged_off(body)
-        elif emsg == EMsg.ClientFriendsList:
-            await self._process_client_friend_list(body)
-        elif emsg == EMsg.ClientPersonaState:
-            await self._process_client_persona_state(body)
-        elif emsg == EMsg.ClientLicenseList:
-            await self._process_license_list(body)
-        elif emsg == EMsg.ClientPICSProductInfoResponse:
-            await self._process_product_info_response(body)
-        elif emsg == EMsg.ClientGetUserStatsResponse:
-            await self._process_user_stats_response(body)
-        elif emsg == EMsg.ClientAccountInfo:
-            await self._process_account_info(body)
-        elif emsg == EMsg.ClientPlayerNicknameList:
-            await self._process_user_nicknames(body)
-        elif emsg == EMsg.ServiceMethod:
-            await self._process_service_method_response(header.target_job_name, header.jobid_target, header.eresult, body)
-        elif emsg == EMsg.ServiceMethodResponse:
-            await self._process_service_method_response(header.target_job_name, header.jobid_target, header.eresult, body)
+            await self._process_multi(header, body)
+        elif self._dispatcher.running:
+            await self._dispatcher.put(emsg, header, body)
         else:
+            await self._handle_message(emsg, header, body)
+
+    async def _handle_message(self, emsg: int, header, body):
+        handler = _messages.message_handler(emsg)
+        if handler is not None:
+            await handler(self, header, body)
+        elif emsg not in self._subscribers:
             logger.warning("Ignored message %d", emsg)
 
-    async def _process_multi(self, body):
+        for subscriber in self._subscribers.get(emsg, []) + self._subscribers.get(None, []):
+            try:
+                await subscriber(emsg, header, body)
+            except Exception:
+                logger.exception("Subscriber for EMsg.%s failed", emsg_name(emsg))
+
+    async def _process_multi(self, header, body):
         logger.debug("Processing message Multi")
         message = CMsgMulti()
         message.ParseFromString(body)
-        if message.size_unzipped > 0:
-            loop = asyncio.get_running_loop()
-            data = await loop.run_in_executor(None, gzip.decompress, message.message_body)
-        else:
-            data = message.message_body
-
-        data_size = len(data)
-        offset = 0
-        size_bytes = 4
-        while offset + size_bytes <= data_size:
-            size = struct.unpack("<I", data[offset:offset + size_bytes])[0]
-            await self._process_packet(data[offset + size_bytes:offset + size_bytes + size])
-            offset += size_bytes + size
+        async for packet in iter_multi_packets(message.message_body, message.size_unzipped):
+            await self._process_packet(packet)
         logger.debug("Finished processing message Multi")
 
-    async def _process_account_info(self, body):
+    @_messages.message(EMsg.ClientAccountInfo)
+    async def _process_account_info(self, header, body):
         logger.debug("Processing message ClientAccountInfo")
         #message = CMsgClientAccountInfo()
         #message.ParseFromString(body)
         logger.info("Client Account Info Message currently unused. It it redundant")
 
-    async def _process_client_logged_off(self, body):
+    @_messages.message(EMsg.ClientLoggedOff)
+    async def _process_client_logged_off(self, header, body):
         logger.debug("Processing message ClientLoggedOff")
         message = CMsgClientLoggedOff()
         message.ParseFromString(body)
@@ -586,7 +841,8 @@ class ProtobufClient:
         if self.log_off_handler is not None:
             await self.log_off_handler(result)
 
-    async def _process_user_nicknames(self, body):
+    @_messages.message(EMsg.ClientPlayerNicknameList)
+    async def _process_user_nicknames(self, header, body):
         logger.debug("Processing message ClientPlayerNicknameList")
         message = CMsgClientPlayerNicknameList()
         message.ParseFromString(body)
@@ -596,7 +852,8 @@ class ProtobufClient:
 
         await self.user_nicknames_handler(nicknames)
 
-    async def _process_client_friend_list(self, body):
+    @_messages.message(EMsg.ClientFriendsList)
+    async def _process_client_friend_list(self, header, body):
         logger.debug("Processing message ClientFriendsList")
         if self.relationship_handler is None:
             return
@@ -612,7 +869,8 @@ class ProtobufClient:
 
         await self.relationship_handler(message.bincremental, friends)
 
-    async def _process_client_persona_state(self, body):
+    @_messages.message(EMsg.ClientPersonaState)
+    async def _process_client_persona_state(self, header, body):
         logger.debug("Processing message ClientPersonaState")
         if self.user_info_handler is None:
             return
@@ -652,7 +910,8 @@ class ProtobufClient:
 
             await self.user_info_handler(user_id, user_info)
 
-    async def _process_license_list(self, body):
+    @_messages.message(EMsg.ClientLicenseList)
+    async def _process_license_list(self, header, body):
         logger.debug("Processing message ClientLicenseList")
         if self.license_import_handler is None:
             return
@@ -676,58 +935,105 @@ class ProtobufClient:
             if int(license.owner_id) == int(self.confirmed_steam_id - self._ACCOUNT_ID_MASK):
                 licenses_to_check.append(SteamLicense(license=license, shared=False))
             else:
-                if license.package_id in licenses_to_check:
-                    continue
                 licenses_to_check.append(SteamLicense(license=license, shared=True))
 
-        await self.license_import_handler(licenses_to_check)
+        self._license_packs.extend(licenses_to_check)
+        logger.info("Got a pack of %d licenses, %d so far", len(licenses_to_check), len(self._license_packs))
+        if self._license_packs_timer is not None:
+            self._license_packs_timer.cancel()
+        self._license_packs_timer = asyncio.get_running_loop().call_later(LICENSE_PACK_QUIET_PERIOD, self._import_license_packs)
+
+    def _import_license_packs(self):
+        self._license_packs_timer = None
+        steam_licenses, self._license_packs = self._license_packs, []
+        self._license_import_task = asyncio.create_task(self._import_licenses(steam_licenses, self._license_import_task))
+
+    async def _import_licenses(self, steam_licenses: List[SteamLicense], previous_import: Optional[asyncio.Task]):
+        #one import at a time, in the order the lists came
+        if previous_import is not None:
+            await asyncio.wait([previous_import])
+        logger.info("Importing %d licenses", len(steam_licenses))
+        try:
+            await self.license_import_handler(steam_licenses)
+        except Exception:
+            logger.exception("License import failed")
 
-    async def _process_product_info_response(self, body):
+    @_messages.message(EMsg.ClientPICSProductInfoResponse)
+    async def _process_product_info_response(self, header, body):
         logger.debug("Processing message ClientPICSProductInfoResponse")
+        if self.product_info_size_handler is not None:
+            self.product_info_size_handler(len(body))
         message = CMsgClientPICSProductInfoResponse()
         message.ParseFromString(body)
-        apps_to_parse = []
-
-        def product_info_handler(packages, apps):
-            for info in packages:
-                self.package_info_handler()
-
-                package_id = str(info.packageid)
-                package_content = vdf.binary_loads(info.buffer[4:])
-                package = package_content.get(package_id)
-                if package is None:
-                    continue
-
-                for app in package['appids'].values():
-                    appid = str(app)
-                    self.app_info_handler(package_id=package_id, appid=appid)
-                    apps_to_parse.append(app)
-
-            for info in apps:
-                app_content = vdf.loads(info.buffer[:-1].decode('utf-8', 'replace'))
-                appid = str(app_content['appinfo']['appid'])
-                try:
-                    type_ = app_content['appinfo']['common']['type'].lower()
-                    title = app_content['appinfo']['common']['name']
-                    parent = None
-                    if 'extended' in app_content['appinfo'] and type_ == 'dlc':
-                        parent = app_content['appinfo']['extended']['dlcforappid']
-                        logger.debug(f"Retrieved dlc {title} for {parent}")
-                    if type == 'game':
-                        logger.debug(f"Retrieved game {title}")
-                    self.app_info_handler(appid=appid, title=title, type=type_, parent=parent)
-                except KeyError:
-                    logger.warning(f"Unrecognized app structure {app_content}")
-                    self.app_info_handler(appid=appid, title='unknown', type='unknown', parent=None)
-
-        loop = asyncio.get_running_loop()
-        await loop.run_in_executor(None, product_info_handler, message.packages, message.apps)
 
+        #without a token steam only tells us it has the info. Ask for a token, unless we already used one.
+        package_infos = [info for info in message.packages if not (info.missing_token and not info.buffer)]
+        app_infos = [info for info in message.apps if not (info.missing_token and not info.buffer)]
+        #the ones too big to send along are downloaded
+        apps_over_http = [info for info in app_infos if not info.buffer and info.sha and message.http_host]
+        if apps_over_http:
+            app_infos = [info for info in app_infos if info.buffer or not info.sha or not message.http_host]
+            self._download_apps_info(message.http_host, apps_over_http)
+        packages_without_token = [info.packageid for info in message.packages if info.missing_token and not info.buffer]
+        apps_without_token = [info.appid for info in message.apps if info.missing_token and not info.buffer]
+        unavailable_packages = list(message.unknown_packageids) + [i for i in packages_without_token if i in self._packages_with_token]
+        unavailable_apps = list(message.unknown_appids) + [i for i in apps_without_token if i in self._apps_with_token]
+        packages_without_token = [i for i in packages_without_token if i not in self._packages_with_token]
+        apps_without_token = [i for i in apps_without_token if i not in self._apps_with_token]
+
+        batch = self._pics_batches.get(header.jobid_target)
+        if batch is not None:
+            batch.package_ids.difference_update(info.packageid for info in message.packages)
+            batch.package_ids.difference_update(message.unknown_packageids)
+            batch.app_ids.difference_update(info.appid for info in message.apps)
+            batch.app_ids.difference_update(message.unknown_appids)
+            if not message.response_pending:
+                #that was the last part, so whatever no part had isn't coming
+                unavailable_packages.extend(batch.package_ids)
+                unavailable_apps.extend(batch.app_ids)
+                batch.package_ids.clear()
+                batch.app_ids.clear()
+
+        packages = await self._parse_product_info(parse_packages, [(info.packageid, info.change_number, info.buffer) for info in package_infos])
+        apps = await self._parse_product_info(parse_apps, [(info.appid, info.change_number, info.buffer) for info in app_infos])
+        for appid, _, type_, _, _ in apps:
+            if type_ == UNKNOWN_TYPE:
+                logger.warning("Unrecognized app structure for %d", appid)
+
+        #everything parsed above is applied in one go, here on the loop.
+        if packages or apps:
+            self._product_info_received(packages, apps)
+        self._product_info_unavailable(unavailable_packages, unavailable_apps)
+
+        #packages share apps, get_apps_info asks for those once
+        apps_to_parse = [appid for _, appids, _ in packages for appid in appids]
         if len(apps_to_parse) > 0:
             logger.debug("Apps to parse: %s", str(apps_to_parse))
             await self.get_apps_info(apps_to_parse)
+        if packages_without_token or apps_without_token:
+            self._pics_window.submit(lambda: self._request_access_tokens(packages_without_token, apps_without_token))
 
-    async def _process_rich_presence_translations(self, body):
+        if batch is not None and not batch.done.done() and not message.response_pending:
+            batch.done.set_result(None)
+
+    async def _parse_product_info(self, parser: Callable[[list], list], items: list) -> list:
+        if not items:
+            return []
+        loop = asyncio.get_running_loop()
+        if self._pics_executor is None or (len(items) < POOL_MIN_ITEMS and sum(len(item[2]) for item in items) < POOL_MIN_BYTES):
+            return await loop.run_in_executor(None, parser, items)
+        chunks = [items[start:start + PARSE_CHUNK_SIZE] for start in range(0, len(items), PARSE_CHUNK_SIZE)]
+        try:
+            results = await asyncio.gather(*[loop.run_in_executor(self._pics_executor, parser, chunk) for chunk in chunks])
+        except BrokenProcessPool:
+            #the pool couldn't start its workers (or lost one). The default executor always works, so stick to that.
+            logger.exception("PICS parser pool broke, parsing on the default executor from now on")
+            self._pics_executor = None
+            results = await asyncio.gather(*[loop.run_in_executor(None, parser, chunk) for chunk in chunks])
+        return [record for result in results for record in result]
+
+    @_messages.service_method(GET_APP_RICH_PRESENCE)
+    async def _process_rich_presence_translations(self, header, body):
         message = CCommunity_GetAppRichPresenceLocalization_Response()
         message.ParseFromString(body)
 
@@ -735,7 +1041,8 @@ class ProtobufClient:
         logger.info(f"Received information about rich presence translations for {message.appid}")
         await self.translations_handler(message.appid, message.token_lists)
 
-    async def _process_user_stats_response(self, body):
+    @_messages.message(EMsg.ClientGetUserStatsResponse)
+    async def _process_user_stats_response(self, header, body):
         logger.debug("Processing message ClientGetUserStatsResponse")
         message = CMsgClientGetUserStatsResponse()
         message.ParseFromString(body)
@@ -743,49 +1050,20 @@ class ProtobufClient:
         game_id = str(message.game_id)
         stats = message.stats
         achievement_blocks = message.achievement_blocks
-        achievements_schema = vdf.binary_loads(message.schema, merge_duplicate_keys=False)
-
-        self.stats_handler(game_id, stats, achievement_blocks, achievements_schema)
-
-    async def _process_user_time_response(self, body):
-        message = CPlayer_GetLastPlayedTimes_Response()
-        message.ParseFromString(body)
-        for game in message.games:
-            logger.debug(f"Processing game times for game {game.appid}, playtime: {game.playtime_forever} last time played: {game.last_playtime}")
-            await self.times_handler(game.appid, game.playtime_forever, game.last_playtime)
-        await self.times_import_finished_handler(True)
-
-    async def _process_collections_response(self, body):
-        message = CCloudConfigStore_Download_Response()
-        message.ParseFromString(body)
+        #left out when the one we have is current
+        achievements_schema = vdf.binary_loads(message.schema, merge_duplicate_keys=False) if message.schema else None
 
-        for data in message.data:
-            for entry in data.entries:
-                try:
-                    loaded_val = json.loads(entry.value)
-                    self.collections['collections'][loaded_val['name']] = loaded_val['added']
-                except:
-                    pass
-        self.collections['event'].set()
+        self.stats_handler(game_id, stats, achievement_blocks, achievements_schema, message.crc_stats)
 
-    async def _process_service_method_response(self, target_job_name, target_job_id, eresult, body):
+    @_messages.message(EMsg.ServiceMethod)
+    @_messages.message(EMsg.ServiceMethodResponse)
+    async def _process_service_method_response(self, header, body):
+        target_job_name = header.target_job_name
         logger.info("Processing message ServiceMethodResponse %s", target_job_name)
-        if target_job_name == GET_APP_RICH_PRESENCE:
-            await self._process_rich_presence_translations(body)
-        elif target_job_name == GET_LAST_PLAYED_TIMES:
-            await self._process_user_time_response(body)
-        elif target_job_name == CLOUD_CONFIG_DOWNLOAD:
-            await self._process_collections_response(body)
-        #elif target_job_name == REQUEST_FRIEND_PERSONA_STATES:
-            #pass #no idea what to do here. for now, having it error will let me know when it's called so i can see wtf to do with it.
-        elif target_job_name == GET_RSA_KEY:
-            await self._process_rsa(eresult, body)
-        elif target_job_name == LOGIN_CREDENTIALS:
-            await self._process_login(eresult, body)
-        elif target_job_name == UPDATE_TWO_FACTOR:
-            await self._process_steamguard_update(eresult, body)
-        elif target_job_name == CHECK_AUTHENTICATION_STATUS:
-            await self._process_auth_poll_status(eresult, body)
+        #replies to everything we send with _call_service_method are routed straight back to the caller by job id, so they never get here.
+        handler = _messages.service_method_handler(target_job_name)
+        if handler is not None:
+            await handler(self, header, body)
         else:
             logger.warning("Unparsed message, no idea what it is. Tell me")
             logger.warning("job name: \"" + target_job_name + "\"")
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Set
+
+from .consts import EResult
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INITIAL_WINDOW = 4
+DEFAULT_MIN_WINDOW = 1
+DEFAULT_MAX_WINDOW = 64
+DEFAULT_TARGET_LATENCY = 2.0 #seconds. Replies slower than this mean steam (or our connection) is struggling to keep up.
+DEFAULT_DECREASE_FACTOR = 0.5
+
+CONGESTION_RESULTS = (EResult.RateLimitExceeded, EResult.LimitExceeded)
+
+
+class RequestWindow:
+    """Keeps a window of requests in flight, and grows or shrinks it based on how steam copes (AIMD).
+
+    Every request that comes back fast and OK grows the window by 1/window (so roughly one extra slot per window's worth of replies).
+    A reply that is slower than the target latency, times out, or is rate limited halves the window.
+    Only requests sent after the last decrease can shrink it again, so one slow burst doesn't collapse it to the minimum.
+
+    Requests are callables returning an awaitable that resolves to the EResult of the reply.
+    """
+
+    def __init__(self,
+        initial_size: int = DEFAULT_INITIAL_WINDOW,
+        min_size: int = DEFAULT_MIN_WINDOW,
+        max_size: int = DEFAULT_MAX_WINDOW,
+        target_latency: float = DEFAULT_TARGET_LATENCY,
+        decrease_factor: float = DEFAULT_DECREASE_FACTOR,
+    ):
+        self._min_size = min_size
+        self._max_size = max_size
+        self._size: float = float(min(max(initial_size, min_size), max_size))
+        self._target_latency = target_latency
+        self._decrease_factor = decrease_factor
+        self._last_decrease: float = float("-inf")
+
+        self._queue: Deque[Callable[[], Awaitable[Any]]] = deque()
+        self._in_flight: Set[asyncio.Task] = set()
+
+    @property
+    def window_size(self) -> int:
+        return int(self._size)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def submit(self, request: Callable[[], Awaitable[Any]]):
+        self._queue.append(request)
+        self._fill()
+
+    def close(self):
+        self._queue.clear()
+        for task in self._in_flight:
+            task.cancel()
+        self._in_flight.clear()
+
+    def _fill(self):
+        while self._queue and len(self._in_flight) < self.window_size:
+            request = self._queue.popleft()
+            task = asyncio.create_task(self._run(request))
+            self._in_flight.add(task)
+            task.add_done_callback(self._request_done)
+
+    def _request_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Request in window failed: %s", repr(task.exception()))
+        self._fill()
+
+    async def _run(self, request: Callable[[], Awaitable[Any]]):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            result = await request()
+        except asyncio.TimeoutError:
+            self._decrease(start, "timed out")
+            return
+        latency = loop.time() - start
+        if result in CONGESTION_RESULTS:
+            self._decrease(start, f"result {EResult(result).name}")
+        elif latency > self._target_latency:
+            self._decrease(start, f"latency {latency:.2f}s")
+        else:
+            self._size = min(self._size + 1 / self._size, self._max_size)
+
+    def _decrease(self, request_start: float, reason: str):
+        if request_start <= self._last_decrease:
+            return
+        self._last_decrease = asyncio.get_running_loop().time()
+        self._size = max(self._size * self._decrease_factor, self._min_size)
+        logger.info("Shrinking request window to %d (%s), %d requests queued", self.window_size, reason, self.queue_depth)
@@ -1,7 +1,7 @@
 import asyncio
 import logging
 import secrets
-from typing import Callable, List, TYPE_CHECKING, Optional, Tuple, Dict
+from typing import Awaitable, Callable, List, TYPE_CHECKING, Optional, Tuple, Dict
 
 from .steam_public_key import SteamPublicKey
 from .steam_auth_polling_data import SteamPollingData
@@ -9,12 +9,14 @@ from .steam_auth_polling_data import SteamPollingData
 from .utils import get_os, translate_error
 
 from asyncio import Future
+from concurrent.futures import Executor
 from .local_machine_cache import LocalMachineCache
 from .protocol.protobuf_client import ProtobufClient, SteamLicense
+from .protocol.pics_parser import AppRecord, PackageRecord
 from .protocol.consts import EResult, EFriendRelationship, EPersonaState
 from .friends_cache import FriendsCache
 from .games_cache import GamesCache
-from .stats_cache import StatsCache
+from .stats_cache import AchievementSchema, StatsCache
 from .user_info_cache import UserInfoCache
 from .times_cache import TimesCache
 from .authentication_cache import AuthenticationCache
@@ -25,7 +27,6 @@ from .utils import get_os, translate_error
 from rsa import PublicKey
 
 from .protocol.messages.steammessages_auth_pb2 import (
-    CAuthentication_BeginAuthSessionViaCredentials_Response,
     CAuthentication_AllowedConfirmation,
     CAuthentication_PollAuthSessionStatus_Response,
 )
@@ -33,6 +34,9 @@ from .protocol.messages.steammessages_auth_pb2 import (
 from .protocol.messages.steammessages_clientserver_userstats_pb2 import (
     CMsgClientGetUserStatsResponse,
 )
+from .protocol.messages.steammessages_clientserver_appinfo_pb2 import (
+    CMsgClientPICSChangesSinceResponse,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -51,14 +55,11 @@ class ProtocolClient:
         user_info_cache: UserInfoCache,
         local_machine_cache: LocalMachineCache,
         used_server_cell_id : int,
+        pics_executor: Optional[Executor] = None,
+        pics_http_get: Optional[Callable[[str, int, bytes], Awaitable[bytes]]] = None,
     ):
         #all of this is being refactored away (eventually), so i'm not bothering type hinting this shit. 
-        self._protobuf_client = ProtobufClient(socket)
-        #new auth
-        self._protobuf_client.rsa_handler = self._rsa_handler
-        self._protobuf_client.login_handler = self._login_handler
-        self._protobuf_client.two_factor_update_handler = self._two_factor_update_handler
-        self._protobuf_client.poll_status_handler = self._poll_handler
+        self._protobuf_client = ProtobufClient(socket, pics_executor=pics_executor, pics_http_get=pics_http_get)
         #old auth
         self._protobuf_client.log_on_token_handler = self._login_token_handler
         self._protobuf_client.log_off_handler = self._log_off_handler
@@ -66,14 +67,14 @@ class ProtocolClient:
         self._protobuf_client.relationship_handler = self._relationship_handler
         self._protobuf_client.user_info_handler = self._user_info_handler
         self._protobuf_client.user_nicknames_handler = self._user_nicknames_handler
-        self._protobuf_client.app_info_handler = self._app_info_handler
-        self._protobuf_client.package_info_handler = self._package_info_handler
+        self._protobuf_client.product_info_handler = self._product_info_handler
+        self._protobuf_client.product_info_size_handler = games_cache.count_received_bytes
+        self._protobuf_client.product_info_failed_handler = games_cache.product_info_failed
+        self._protobuf_client.stored_apps_handler = games_cache.resolve_stored_apps
         self._protobuf_client.license_import_handler = self._license_import_handler
         self._protobuf_client.translations_handler = self._translations_handler
         self._protobuf_client.stats_handler = self._stats_handler
-        self._protobuf_client.times_handler = self._times_handler
         self._protobuf_client.user_authentication_handler = self._user_authentication_handler
-        self._protobuf_client.times_import_finished_handler = self._times_import_finished_handler
 
         self._friends_cache : FriendsCache = friends_cache
         self._games_cache : GamesCache = games_cache
@@ -83,10 +84,6 @@ class ProtocolClient:
         self._user_info_cache : UserInfoCache = user_info_cache
         self._times_cache : TimesCache = times_cache
         self._auth_lost_handler = None
-        self._rsa_future: Optional[Future] = None
-        self._login_future: Optional[Future] = None
-        self._two_factor_future: Optional[Future] = None
-        self._poll_future: Optional[Future] = None
         self._token_login_future: Optional[Future] = None
 
         self._used_server_cell_id : int = used_server_cell_id
@@ -115,17 +112,14 @@ class ProtocolClient:
         await self._protobuf_client.say_hello()
 
     async def get_rsa_public_key(self, username:str, auth_lost_handler) -> Tuple[bool, SteamPublicKey]:
-        loop = asyncio.get_running_loop()
-        self._rsa_future = loop.create_future()
-        await self._protobuf_client.get_rsa_public_key(username)
-
-        key:Optional[SteamPublicKey]
         result: EResult
-        (result, key) = await self._rsa_future
-        self._rsa_future = None
+        (result, message) = await self._protobuf_client.get_rsa_public_key(username)
+
+        key: Optional[SteamPublicKey] = None
         logger.info ("GOT RSA KEY IN PROTOCOL_CLIENT")
         #If you provide a bad username, it still returns "OK" and gives you rsa key data. i have no idea why. it just does. so we have no way to determine bad login. 
         if (result == EResult.OK):
+            key = SteamPublicKey(PublicKey(int(message.publickey_mod, 16), int(message.publickey_exp, 16)), message.timestamp)
             self._auth_lost_handler = auth_lost_handler
             return (True, key)
         #the only way we get here afaik is if steam is down or busy or something network related. 
@@ -135,27 +129,18 @@ class ProtocolClient:
             #at this point, hopefully key would be null, so the bool part of the tuple would be redundant. but i can't seem to reach this state so idk. 
             return (False, key)
 
-    async def _rsa_handler(self, result: EResult, mod: int, exp: int, timestamp: int) -> Tuple[EResult, SteamPublicKey]:
-        logger.info("In Protocol_Client RSA Handler")
-        spk = None
-        if (result == EResult.OK):
-            spk = SteamPublicKey(PublicKey(mod, exp), timestamp)
-        else:
-            pass #probably should get the EResult for bad username separetely from the else, but for now this will work. 
-        if self._rsa_future is not None:
-            self._rsa_future.set_result((result, spk))
-        else:
-            logger.warning("NO RSA FUTURE SET")
-
     async def authenticate_password(self, account_name :str, enciphered_password : bytes, timestamp: int, auth_lost_handler:Callable) ->  Optional[SteamPollingData]:
-        loop = asyncio.get_running_loop()
-        self._login_future = loop.create_future()
         os_value = get_os()
 
-        await self._protobuf_client.log_on_password(account_name, enciphered_password, timestamp, os_value)
-        (result, data) = await self._login_future
-        self._login_future = None
+        (result, message) = await self._protobuf_client.log_on_password(account_name, enciphered_password, timestamp, os_value)
+        data : Optional[SteamPollingData] = None
         if result == EResult.OK:
+            if self._user_info_cache.steam_id != message.steamid:
+                self._user_info_cache.steam_id = message.steamid;
+
+            allowables_with_message : dict[TwoFactorMethod, str]= dict(map(to_TwoFactorWithMessage, message.allowed_confirmations))
+
+            data = SteamPollingData(message.client_id, message.steamid, message.request_id, message.interval, allowables_with_message, message.extended_error_message)
             self._auth_lost_handler = auth_lost_handler
         elif result in (EResult.InvalidPassword,
                         EResult.InvalidParam,
@@ -171,28 +156,9 @@ class ProtocolClient:
 
         return data
 
-    async def _login_handler(self, result: EResult, message : CAuthentication_BeginAuthSessionViaCredentials_Response):
-        data : Optional[SteamPollingData] = None
-        if (result == EResult.OK):
-            if self._user_info_cache.steam_id != message.steamid:
-                self._user_info_cache.steam_id = message.steamid;
-
-            allowables_with_message : dict[TwoFactorMethod, str]= dict(map(to_TwoFactorWithMessage, message.allowed_confirmations))
-
-            data = SteamPollingData(message.client_id, message.steamid, message.request_id, message.interval, allowables_with_message, message.extended_error_message)
-
-        if self._login_future is not None:
-            self._login_future.set_result((result, data))
-        else:
-            logger.warning("NO LOGIN FUTURE SET")
-
     async def update_two_factor(self, client_id: int, steam_id:int, code: str, method: TwoFactorMethod, auth_lost_handler:Callable) -> UserActionRequired:
-        loop = asyncio.get_running_loop()
-        self._two_factor_future = loop.create_future()
         converted_meth = to_EAuthSessionGuardType(method)
-        await self._protobuf_client.update_steamguard_data(client_id, steam_id, code, converted_meth)
-        result = await self._two_factor_future
-        self._two_factor_future = None
+        (result, _) = await self._protobuf_client.update_steamguard_data(client_id, steam_id, code, converted_meth)
         logger.info ("GOT TWO FACTOR UPDATE RESULT IN PROTOCOL CLIENT")
         # Observed results can be OK, InvalidLoginAuthCode, TwoFactorCodeMismatch, Expired, DuplicateRequest.
         ret_code = UserActionRequired.InvalidAuthData
@@ -209,21 +175,10 @@ class ProtocolClient:
             raise translate_error(result)
         return ret_code
 
-    async def _two_factor_update_handler(self, result: EResult, agreement_session_url:str):
-        if self._two_factor_future is not None:
-            self._two_factor_future.set_result(result)
-        else:
-            logger.warning("NO TWO FACTOR FUTURE SET")
-
     async def check_auth_status(self, client_id:int, request_id:bytes, two_factor_is_confirm: bool, auth_lost_handler:Callable) -> Tuple[UserActionRequired, Optional[int]]:
-        loop = asyncio.get_running_loop()
-        self._poll_future = loop.create_future()
-
-        await self._protobuf_client.poll_auth_status(client_id, request_id)
         result:EResult
         data:CAuthentication_PollAuthSessionStatus_Response
-        (result, data) = await self._poll_future
-        self._poll_future = None #we may have to redo the poll so reset this value to null. 
+        (result, data) = await self._protobuf_client.poll_auth_status(client_id, request_id)
         # eresult can be OK, Expired, FileNotFound, Fail
         if result == EResult.OK:
             #ok just means the poll was successful. it doesn't tell us if we logged in. The only way i know of to check that is the refresh token having data. 
@@ -260,12 +215,6 @@ class ProtocolClient:
         else:
             raise translate_error(result)
 
-    async def _poll_handler(self, result: EResult, message : CAuthentication_PollAuthSessionStatus_Response):
-        if self._poll_future is not None:
-            self._poll_future.set_result((result, message))
-        else:
-            logger.warning("NO FUTURE SET")
-
     #async def finalize_login(self, username:str, refresh_token:str, auth_lost_handler : Callable) -> UserActionRequired:
     async def finalize_login(self, username:str, steam_id:int, refresh_token:str, auth_lost_handler : Callable) -> UserActionRequired:
         loop = asyncio.get_running_loop()
@@ -300,22 +249,27 @@ class ProtocolClient:
             raise translate_error(result)
 
     async def import_game_stats(self, game_ids):
-        for game_id in game_ids:
-            self._protobuf_client.job_list.append({"job_name": "import_game_stats", "game_id": game_id})
-        #pass
+        schemas = await self._stats_cache.load_schemas(game_ids)
+        logger.info("Achievement schemas known for %d of %d games", len(schemas), len(game_ids))
+        self._protobuf_client.import_game_stats(
+            game_ids, {game_id: (schema.version, schema.crc_stats) for game_id, schema in schemas.items()}
+        )
 
     async def import_game_times(self):
-        self._protobuf_client.job_list.append({"job_name": "import_game_times"})
-        #pass
+        try:
+            (result, message) = await self._protobuf_client.get_last_played_times()
+            if result != EResult.OK:
+                logger.warning(f"Failed to import game times, code: {result}")
+                return
+            for game in message.games:
+                logger.debug(f"Processing game times for game {game.appid}, playtime: {game.playtime_forever} last time played: {game.last_playtime}")
+                self._times_cache.update_time(str(game.appid), game.playtime_forever, game.last_playtime)
+        finally:
+            #even if steam never answered, don't leave anyone waiting on the times cache for something that isn't coming.
+            self._times_cache.times_import_finished(True)
 
     async def retrieve_collections(self):
-        self._protobuf_client.job_list.append({"job_name": "import_collections"})
-        await self._protobuf_client.collections['event'].wait()
-        collections = self._protobuf_client.collections['collections'].copy()
-        self._protobuf_client.collections['event'].clear()
-        self._protobuf_client.collections['collections'] = dict()
-        return collections
-        #return {}
+        return await self._protobuf_client.get_collections()
 
 
 
@@ -360,43 +314,63 @@ class ProtocolClient:
 
     async def _license_import_handler(self, steam_licenses: List[SteamLicense]):
         logger.info('Handling %d user licenses', len(steam_licenses))
-        not_resolved_licenses = []
-
-        resolved_packages = self._games_cache.get_resolved_packages()
-        package_ids = set([str(steam_license.license.package_id) for steam_license in steam_licenses])
-
-        for steam_license in steam_licenses:
-            if str(steam_license.license.package_id) not in resolved_packages:
-                not_resolved_licenses.append(steam_license)
-
-        if len(package_ids) < 12000:
-            # TODO rework cache invalidation for bigger libraries (steam sends licenses in packs of >12k licenses)
-            if package_ids != self._games_cache.get_package_ids():
-                logger.info(
-                    "Licenses list different than last time (cached packages: %d, new packages: %d). Reseting cache.",
-                    len(self._games_cache.get_package_ids()),
-                    len(package_ids)
-                )
-                self._games_cache.reset_storing_map()
-                self._games_cache.start_packages_import(steam_licenses)
-                return await self._protobuf_client.get_packages_info(steam_licenses)
-
-        # This path will only attempt import on packages which aren't resolved (dont have any apps assigned)
-        logger.info("Starting license import for %d packages, skipping %d already resolved.",
-            len(package_ids - resolved_packages),
-            len(resolved_packages)
+        #licenses are reconciled against the persisted cache, which may still be loading
+        await self._games_cache.wait_loaded()
+
+        since_change_number = self._games_cache.change_number
+        changes = await self._get_product_changes(since_change_number)
+        if since_change_number != 0 and changes is not None and \
+            (changes.force_full_update or changes.force_full_package_update or changes.force_full_app_update):
+            logger.info("Cache too old to update from PICS change %d. Reseting cache.", since_change_number)
+            self._games_cache.reset_storing_map()
+        #before any app is asked for, so none is resolved from what the store has from before a change
+        await self._expire_stored_apps(since_change_number, changes)
+
+        #only packages that aren't resolved yet (dont have all their apps), or changed since, are asked for. The changes
+        #go in the same call, so the cache never looks ready while a refresh is still to come.
+        package_changes, app_changes = {}, {}
+        if changes is not None:
+            package_changes = {change.packageid: change.change_number for change in changes.package_changes}
+            app_changes = {change.appid: change.change_number for change in changes.app_changes}
+        licenses_to_import, apps_to_refresh = self._games_cache.reconcile_licenses(steam_licenses, package_changes, app_changes)
+        if changes is not None:
+            logger.info("PICS changes since %d: %d packages and %d apps changed, refreshing %d apps",
+                changes.since_change_number, len(package_changes), len(app_changes), len(apps_to_refresh))
+        await self._protobuf_client.get_packages_info(licenses_to_import)
+        if apps_to_refresh:
+            await self._protobuf_client.get_apps_info(sorted(apps_to_refresh), refresh=True)
+        if changes is not None:
+            self._games_cache.set_change_number_when_ready(changes.current_change_number)
+
+    async def _expire_stored_apps(self, since_change_number: int, changes: Optional[CMsgClientPICSChangesSinceResponse]):
+        store_change_number = await self._games_cache.stored_apps_change_number()
+        if store_change_number is None:
+            return
+        #the store is shared by all accounts, so it can be current to another change than this account's cache
+        if store_change_number != 0 and store_change_number != since_change_number:
+            changes = await self._get_product_changes(store_change_number)
+        if changes is None:
+            logger.warning("Can't tell which stored apps changed since PICS change %d, not using them", store_change_number)
+            return
+        everything = store_change_number == 0 or changes.force_full_update or changes.force_full_app_update
+        app_changes = {change.appid: change.change_number for change in changes.app_changes}
+        logger.info("Expiring %s stored apps changed since PICS change %d", "all" if everything else len(app_changes),
+            store_change_number)
+        self._games_cache.expire_stored_apps(app_changes, changes.current_change_number, everything)
+
+    async def _get_product_changes(self, since_change_number: int) -> Optional[CMsgClientPICSChangesSinceResponse]:
+        result, changes = await self._protobuf_client.get_product_changes(
+            since_change_number,
+            len(self._games_cache.get_package_ids()),
+            self._games_cache.apps_count,
         )
-        self._games_cache.start_packages_import(not_resolved_licenses)
-        await self._protobuf_client.get_packages_info(not_resolved_licenses)
-
-    def _app_info_handler(self, appid, package_id=None, title=None, type=None, parent=None):
-        if package_id:
-            self._games_cache.update_license_apps(package_id, appid)
-        if title and type:
-            self._games_cache.update_app_title(appid, title, type, parent)
+        if result != EResult.OK:
+            logger.warning("Failed to get PICS changes since %d, result: %s", since_change_number, result)
+            return None
+        return changes
 
-    def _package_info_handler(self):
-        self._games_cache.update_packages()
+    def _product_info_handler(self, packages: List[PackageRecord], apps: List[AppRecord]):
+        self._games_cache.update_product_info(packages, apps)
 
     async def _translations_handler(self, appid, translations=None):
         if appid and translations:
@@ -409,34 +383,32 @@ class ProtocolClient:
         game_id: str,
         stats: "CMsgClientGetUserStatsResponse.Stats",
         achievement_blocks: "CMsgClientGetUserStatsResponse.AchievementBlocks",
-        schema: dict
+        schema: Optional[dict],
+        crc_stats: int = 0,
     ):
-        def get_achievement_name(achievements_block_schema: dict, bit_no: int) -> str:
-            name = achievements_block_schema['bits'][str(bit_no)]['display']['name']
-            try:
-                return name['english']
-            except TypeError:
-                return name
-
         logger.debug(f"Processing user stats response for {game_id}")
         achievements_unlocked = []
 
+        if schema is None:
+            #steam leaves the schema out when the one we sent the version of is current, or when the game has none
+            achievement_schema = self._stats_cache.get_schema(game_id) or AchievementSchema(0, 0, {})
+        else:
+            achievement_schema = AchievementSchema.from_vdf(game_id, schema, crc_stats)
+            if achievement_schema.version:
+                self._stats_cache.set_schema(game_id, achievement_schema)
+
         for achievement_block in achievement_blocks:
             block_id = str(achievement_block.achievement_id)
-            try:
-                stats_block_schema = schema[game_id]['stats'][block_id]
-            except KeyError:
-                logger.warning("No stat schema for block %s for game: %s", block_id, game_id)
+            block_names = achievement_schema.names.get(block_id)
+            if block_names is None:
+                logger.warning("No achievement schema for block %s for game: %s", block_id, game_id)
                 continue
 
             for i, unlock_time in enumerate(achievement_block.unlock_time):
                 if unlock_time > 0:
-                    try:
-                        display_name = get_achievement_name(stats_block_schema, i)
-                    except KeyError:
-                        logger.warning("Unexpected schema for achievement bit %d from block %s for game %s: %s",
-                            i, block_id, game_id, stats_block_schema
-                        )
+                    display_name = block_names.get(str(i))
+                    if display_name is None:
+                        logger.warning("Unexpected schema for achievement bit %d from block %s for game %s", i, block_id, game_id)
                         continue
 
                     achievements_unlocked.append({
@@ -466,9 +438,3 @@ class ProtocolClient:
 
     async def _get_sentry(self):
         return self._user_info_cache.sentry
-
-    async def _times_handler(self, game_id, time_played, last_played):
-        self._times_cache.update_time(str(game_id), time_played, last_played)
-
-    async def _times_import_finished_handler(self, finished):
-        self._times_cache.times_import_finished(finished)
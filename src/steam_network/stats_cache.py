@@ -1,14 +1,46 @@
 
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from .app_store import AppStore
 from .cache_proto import ProtoCache
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class AchievementSchema(NamedTuple):
+    version: int
+    crc_stats: int
+    names: Dict[str, Dict[str, str]] #achievement block id -> bit -> display name
+
+    @classmethod
+    def from_vdf(cls, game_id: str, schema: dict, crc_stats: int) -> 'AchievementSchema':
+        """Picks the achievement names (in english, where there is a choice) out of the stats schema steam sent.
+        A schema without a version gets version 0, which steam takes for having none."""
+        game_schema = schema.get(game_id)
+        if not isinstance(game_schema, dict):
+            game_schema = {}
+        names = {}
+        for block_id, block in game_schema.get('stats', {}).items():
+            if not isinstance(block, dict) or not isinstance(block.get('bits'), dict):
+                continue
+            block_names = names[block_id] = {}
+            for bit_no, bit in block['bits'].items():
+                try:
+                    name = bit['display']['name']
+                except (KeyError, TypeError):
+                    continue
+                block_names[bit_no] = name['english'] if isinstance(name, dict) and 'english' in name else name
+        return cls(int(game_schema.get('version', 0)), crc_stats, names)
+
+
 class StatsCache(ProtoCache):
-    def __init__(self):
+    def __init__(self, app_store: Optional[AppStore] = None):
         super(StatsCache, self).__init__()
         self._games_to_import = []
+        #schemas steam sent before, so it doesn't have to send them again. See load_schemas.
+        self._schemas: Dict[str, AchievementSchema] = {}
+        self._app_store = app_store
 
     def start_game_stats_import(self, game_ids):
         for game_id in game_ids:
@@ -46,3 +78,20 @@ class StatsCache(ProtoCache):
             self._ready_event.set()
         else:
             self._ready_event.clear()
+
+    async def load_schemas(self, game_ids: Iterable[str]) -> Dict[str, AchievementSchema]:
+        """The schemas known for the games, from this session or from the app store."""
+        game_ids = list(game_ids)
+        missing = [int(game_id) for game_id in game_ids if game_id not in self._schemas]
+        if missing and self._app_store is not None:
+            for appid, version, crc_stats, names in await self._app_store.lookup_schemas(missing):
+                self._schemas[str(appid)] = AchievementSchema(version, crc_stats, names)
+        return {game_id: self._schemas[game_id] for game_id in game_ids if game_id in self._schemas}
+
+    def get_schema(self, game_id: str) -> Optional[AchievementSchema]:
+        return self._schemas.get(game_id)
+
+    def set_schema(self, game_id: str, schema: AchievementSchema):
+        self._schemas[game_id] = schema
+        if self._app_store is not None:
+            self._app_store.save_schema((int(game_id), schema.version, schema.crc_stats, schema.names))
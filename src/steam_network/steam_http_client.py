@@ -1,3 +1,4 @@
+import gzip
 import logging
 from typing import List
 
@@ -22,3 +23,15 @@ class SteamHttpClient:
         except (ValueError, KeyError) :
             logger.exception("Can not parse backend response")
             raise UnknownBackendResponse()
+
+    async def get_pics_app_info(self, http_host: str, appid: int, sha: bytes) -> bytes:
+        """Downloads an app info a PICS response left out for being big, as the buffer the response would have held."""
+        url = f"http://{http_host}/appinfo/{appid}/sha/{sha.hex()}.txt.gz"
+        response = await self._http_client.get(url)
+        buffer = await response.read()
+        #served as a .gz file, unless the server had it sent with Content-Encoding, which aiohttp undoes
+        if buffer[:2] == b"\x1f\x8b":
+            buffer = gzip.decompress(buffer)
+        if not buffer.endswith(b"\x00"):
+            buffer += b"\x00"
+        return buffer
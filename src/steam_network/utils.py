@@ -3,7 +3,10 @@
 
 
 """
+import asyncio
 import platform
+import time
+from typing import AsyncGenerator, Iterable, TypeVar
 
 from galaxy.api.errors import (AccessDenied, BackendError, BackendNotAvailable,
                                BackendTimeout, Banned, InvalidCredentials,
@@ -17,6 +20,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+#how long a loop may keep the event loop to itself before giving way, see TimeSlice
+TIME_SLICE_BUDGET = 0.005
+
+T = TypeVar("T")
+
+
 def get_os() -> EOSType:
     system = platform.system()
     if system == 'Windows':
@@ -141,3 +150,32 @@ def next_step_response_simple(display: DisplayUriHelper, errored:bool = False, *
     next_step['end_uri_regex'] = display.GetEndUriRegex()
 
     return NextStep("web_session", next_step)
+
+
+class TimeSlice:
+    """Lets a long loop on the event loop give way to everything else once it has held the loop for `budget` seconds,
+    instead of after every item (sleeping for every one of 20k licenses adds up to seconds, and more on Windows).
+
+        time_slice = TimeSlice()
+        for item in items:
+            ...
+            await time_slice.pause()
+    """
+    def __init__(self, budget: float = TIME_SLICE_BUDGET):
+        self._budget = budget
+        self._deadline = time.perf_counter() + budget
+
+    async def pause(self):
+        if time.perf_counter() < self._deadline:
+            return
+        await asyncio.sleep(0)
+        self._deadline = time.perf_counter() + self._budget
+
+
+async def time_sliced(items: Iterable[T], budget: float = TIME_SLICE_BUDGET) -> AsyncGenerator[T, None]:
+    """Yields items, giving way to the event loop whenever it has been held for `budget` seconds, whether by the loop
+    over items or by whoever consumes them."""
+    time_slice = TimeSlice(budget)
+    for item in items:
+        yield item
+        await time_slice.pause()
@@ -2,8 +2,9 @@ import asyncio
 from asyncio.futures import Future
 import logging
 import ssl
+from concurrent.futures import Executor
 from contextlib import suppress
-from typing import Callable, Optional, Any, Dict
+from typing import Awaitable, Callable, Optional, Any, Dict
 
 import websockets
 from galaxy.api.errors import BackendNotAvailable, BackendTimeout, BackendError, InvalidCredentials, NetworkError, AccessDenied, AuthenticationRequired
@@ -60,6 +61,8 @@ class WebSocketClient:
         authentication_cache: AuthenticationCache,
         user_info_cache: UserInfoCache,
         local_machine_cache: LocalMachineCache,
+        pics_executor: Optional[Executor] = None,
+        pics_http_get: Optional[Callable[[str, int, bytes], Awaitable[bytes]]] = None,
     ):
         self._ssl_context : ssl.SSLContext = ssl_context
         self._websocket: Optional[websockets.client.WebSocketClientProtocol] = None
@@ -74,6 +77,8 @@ class WebSocketClient:
         self._user_info_cache : UserInfoCache = user_info_cache
         self._local_machine_cache : LocalMachineCache = local_machine_cache
         self._times_cache : TimesCache = times_cache
+        self._pics_executor : Optional[Executor] = pics_executor #outlives the connection, so reconnecting doesn't respawn parser processes.
+        self._pics_http_get : Optional[Callable[[str, int, bytes], Awaitable[bytes]]] = pics_http_get
 
         self.communication_queues : Dict[str, asyncio.Queue] = {'plugin': asyncio.Queue(), 'websocket': asyncio.Queue(),}
         self.used_server_cell_id: int = 0
@@ -220,7 +225,7 @@ class WebSocketClient:
                 self._current_ws_address = ws_address
                 try:
                     self._websocket = await asyncio.wait_for(websockets.client.connect(ws_address, ssl=self._ssl_context, max_size=MAX_INCOMING_MESSAGE_SIZE), 5)
-                    self._protocol_client = ProtocolClient(self._websocket, self._friends_cache, self._games_cache, self._translations_cache, self._stats_cache, self._times_cache, self._authentication_cache, self._user_info_cache, self._local_machine_cache, self.used_server_cell_id)
+                    self._protocol_client = ProtocolClient(self._websocket, self._friends_cache, self._games_cache, self._translations_cache, self._stats_cache, self._times_cache, self._authentication_cache, self._user_info_cache, self._local_machine_cache, self.used_server_cell_id, self._pics_executor, self._pics_http_get)
                     logger.info(f'Connected to Steam on CM {ws_address} on cell_id {self.used_server_cell_id}. Sending Hello')
                     await self._protocol_client.finish_handshake()
                     return
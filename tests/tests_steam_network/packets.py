@@ -0,0 +1,10 @@
+import struct
+
+from steam_network.protocol.protobuf_client import ProtobufClient
+from steam_network.protocol.messages.steammessages_base_pb2 import CMsgProtoBufHeader
+
+
+def packet(emsg: int, body: bytes = b"", **header_fields) -> bytes:
+    """A protobuf packet as steam sends it, with the given header fields (jobid_target, eresult, ...) set."""
+    header_data = CMsgProtoBufHeader(**header_fields).SerializeToString()
+    return struct.pack("<2I", emsg | ProtobufClient._PROTO_MASK, len(header_data)) + header_data + body
@@ -0,0 +1,96 @@
+import pytest
+
+from steam_network.app_store import AppStore
+from steam_network.protocol.pics_parser import UNKNOWN_TYPE
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "data" / "apps.sqlite3")
+
+
+def opened(store_path: str) -> AppStore:
+    store = AppStore(store_path)
+    store.expire({}, 5)
+    return store
+
+
+async def saved(store: AppStore, apps):
+    store.save(apps)
+    #lookups run after saves on the store's one thread
+    return await store.lookup([app[0] for app in apps])
+
+
+@pytest.mark.asyncio
+async def test_apps_outlive_the_store(store_path):
+    store = opened(store_path)
+    await saved(store, [(1, "One", "game", None, 5), (2, "Dlc", "dlc", "1", 5)])
+    store.close()
+
+    store = opened(store_path)
+    assert sorted(await store.lookup([1, 2, 3])) == [(1, "One", "game", None, 5), (2, "Dlc", "dlc", "1", 5)]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_only_newer_apps_replace_stored_ones(store_path):
+    store = opened(store_path)
+    await saved(store, [(1, "One", "game", None, 5)])
+    assert await saved(store, [(1, "Old", "game", None, 4)]) == [(1, "One", "game", None, 5)]
+    assert await saved(store, [(1, "New", "game", None, 6)]) == [(1, "New", "game", None, 6)]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_unknown_apps_are_not_stored(store_path):
+    store = opened(store_path)
+    assert await saved(store, [(1, UNKNOWN_TYPE, UNKNOWN_TYPE, None, 0)]) == []
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_achievement_schemas_outlive_the_store(store_path):
+    store = opened(store_path)
+    store.save_schema((10, 3, 1234, {"1": {"0": "Get Eaten"}}))
+    store.save_schema((10, 4, 5678, {"1": {"0": "Get Eaten", "1": "Eat"}}))
+    #lookups run after saves on the store's one thread, close doesn't wait for them
+    await store.lookup_schemas([10])
+    store.close()
+
+    store = opened(store_path)
+    assert await store.lookup_schemas([10, 11]) == [(10, 4, 5678, {"1": {"0": "Get Eaten", "1": "Eat"}})]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_apps_are_hidden_until_expired(store_path):
+    store = AppStore(store_path)
+    store.save([(1, "One", "game", None, 5)])
+    assert await store.lookup([1]) == []
+
+    store.expire({}, 5)
+    assert await store.lookup([1]) == [(1, "One", "game", None, 5)]
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_changed_apps_expire(store_path):
+    store = opened(store_path)
+    await saved(store, [(1, "One", "game", None, 5), (2, "Two", "game", None, 5), (3, "Three", "game", None, 8)])
+    store.expire({1: 7, 3: 7}, 9)
+    assert await store.lookup([1, 2, 3]) == [(2, "Two", "game", None, 5), (3, "Three", "game", None, 8)]
+    store.close()
+
+    store = AppStore(store_path)
+    assert await store.change_number() == 9
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_all_apps_expire_when_their_changes_are_unknown(store_path):
+    store = opened(store_path)
+    await saved(store, [(1, "One", "game", None, 5)])
+    store.expire({}, 9, everything=True)
+    assert await store.lookup([1]) == []
+    assert await store.change_number() == 9
+    store.close()
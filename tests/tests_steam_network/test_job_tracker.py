@@ -0,0 +1,112 @@
+import asyncio
+import struct
+from unittest.mock import MagicMock
+
+import pytest
+from galaxy.unittest.mock import AsyncMock
+
+from steam_network.protocol.consts import EMsg, EResult
+from steam_network.protocol.job_tracker import JobTracker, NO_JOB_ID
+from steam_network.protocol.protobuf_client import ProtobufClient, GET_RSA_KEY
+from steam_network.protocol.messages.steammessages_base_pb2 import CMsgProtoBufHeader
+from steam_network.protocol.messages.steammessages_auth_pb2 import CAuthentication_GetPasswordRSAPublicKey_Response
+from tests.tests_steam_network.packets import packet
+
+
+@pytest.fixture
+def websocket():
+    websocket_ = MagicMock()
+    websocket_.send = AsyncMock()
+    return websocket_
+
+
+@pytest.fixture
+def client(websocket):
+    return ProtobufClient(websocket)
+
+
+def sent_header(data: bytes) -> CMsgProtoBufHeader:
+    header_len = struct.unpack("<I", data[4:8])[0]
+    header = CMsgProtoBufHeader()
+    header.ParseFromString(data[8:8 + header_len])
+    return header
+
+
+def rsa_reply_body(timestamp: int) -> bytes:
+    response = CAuthentication_GetPasswordRSAPublicKey_Response()
+    response.publickey_mod = "ab"
+    response.publickey_exp = "11"
+    response.timestamp = timestamp
+    return response.SerializeToString()
+
+
+@pytest.mark.asyncio
+async def test_resolve_delivers_reply():
+    tracker = JobTracker()
+    future = tracker.register(5)
+    assert tracker.resolve(5, "header", b"body")
+    assert await future == ("header", b"body")
+    assert 5 not in tracker
+
+
+@pytest.mark.asyncio
+async def test_resolve_ignores_unknown_and_unset_job_ids():
+    tracker = JobTracker()
+    tracker.register(1)
+    assert not tracker.resolve(2, None, b"")
+    assert not tracker.resolve(NO_JOB_ID, None, b"")
+    assert len(tracker) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancel_all():
+    tracker = JobTracker()
+    futures = [tracker.register(i) for i in range(3)]
+    tracker.cancel_all()
+    assert all(future.cancelled() for future in futures)
+    assert len(tracker) == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_get_their_own_reply(client, websocket):
+    first = asyncio.create_task(client.get_rsa_public_key("first"))
+    second = asyncio.create_task(client.get_rsa_public_key("second"))
+    await asyncio.sleep(0)
+
+    first_header, second_header = [sent_header(call[0][0]) for call in websocket.send.call_args_list]
+    assert first_header.target_job_name == GET_RSA_KEY
+    assert first_header.jobid_source != second_header.jobid_source
+
+    # answer out of order
+    await client._process_packet(packet(EMsg.ServiceMethodResponse, rsa_reply_body(2), jobid_target=second_header.jobid_source, eresult=EResult.OK))
+    await client._process_packet(packet(EMsg.ServiceMethodResponse, rsa_reply_body(1), jobid_target=first_header.jobid_source, eresult=EResult.OK))
+
+    first_result, first_message = await first
+    second_result, second_message = await second
+    assert (first_result, first_message.timestamp) == (EResult.OK, 1)
+    assert (second_result, second_message.timestamp) == (EResult.OK, 2)
+    assert len(client._jobs) == 0
+
+
+@pytest.mark.asyncio
+async def test_call_timeout_is_reported_as_eresult(client):
+    result, message = await client._call_service_method(
+        MagicMock(SerializeToString=MagicMock(return_value=b"")),
+        CAuthentication_GetPasswordRSAPublicKey_Response,
+        GET_RSA_KEY,
+        timeout=0
+    )
+    assert result == EResult.Timeout
+    assert message is None
+    assert len(client._jobs) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_call_stops_waiting(client):
+    task = asyncio.create_task(client.get_rsa_public_key("john"))
+    await asyncio.sleep(0)
+    assert len(client._jobs) == 1
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert len(client._jobs) == 0
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+from galaxy.unittest.mock import AsyncMock
+
+from steam_network.protocol.consts import EMsg
+from steam_network.protocol.message_dispatcher import MessageDispatcher
+from steam_network.protocol.protobuf_client import MESSAGE_ORDERING, ProtobufClient
+from tests.tests_steam_network.packets import packet
+
+
+ORDERING = {1: "first", 2: "first", 3: "second"}
+
+
+class RecordingHandler:
+    def __init__(self, slow=()):
+        self.handled = []
+        self.release = asyncio.Event()
+        self._slow = slow
+
+    async def __call__(self, emsg, header, body):
+        if body in self._slow:
+            await self.release.wait()
+        self.handled.append(body)
+
+
+@pytest.mark.asyncio
+async def test_same_class_is_handled_in_order():
+    handler = RecordingHandler(slow={"a"})
+    dispatcher = MessageDispatcher(handler, ORDERING, workers=4)
+    dispatcher.start()
+    await dispatcher.put(1, None, "a")
+    await dispatcher.put(2, None, "b")
+    await dispatcher.put(3, None, "c")
+    await asyncio.sleep(0.01)
+    assert handler.handled == ["c"]
+
+    handler.release.set()
+    await dispatcher.join()
+    assert handler.handled == ["c", "a", "b"]
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_unordered_messages_do_not_wait_for_each_other():
+    handler = RecordingHandler(slow={"slow"})
+    dispatcher = MessageDispatcher(handler, ORDERING, workers=2)
+    dispatcher.start()
+    await dispatcher.put(10, None, "slow")
+    await dispatcher.put(11, None, "fast")
+    await asyncio.sleep(0.01)
+    assert handler.handled == ["fast"]
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_put_waits_while_queue_is_full():
+    handler = RecordingHandler(slow={"a"})
+    dispatcher = MessageDispatcher(handler, ORDERING, queue_size=1)
+    dispatcher.start()
+    await dispatcher.put(1, None, "a")
+    await asyncio.sleep(0)
+    await dispatcher.put(1, None, "b")
+    blocked = asyncio.create_task(dispatcher.put(1, None, "c"))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+    assert dispatcher.queue_depth == 1
+
+    handler.release.set()
+    await blocked
+    await dispatcher.join()
+    assert handler.handled == ["a", "b", "c"]
+    await dispatcher.close()
+
+
+@pytest.mark.asyncio
+async def test_first_failure_is_reported():
+    dispatcher = MessageDispatcher(AsyncMock(side_effect=[RuntimeError("first"), ValueError("second")]), ORDERING)
+    dispatcher.start()
+    await dispatcher.put(1, None, "a")
+    await dispatcher.put(1, None, "b")
+    await dispatcher.join()
+    with pytest.raises(RuntimeError):
+        dispatcher.failure.result()
+    await dispatcher.close()
+
+
+class FakeSocket:
+    def __init__(self):
+        self.packets = asyncio.Queue()
+        self.send = AsyncMock()
+
+    async def recv(self):
+        return await self.packets.get()
+
+
+@pytest.mark.asyncio
+async def test_slow_handler_does_not_hold_up_other_messages():
+    socket = FakeSocket()
+    client = ProtobufClient(socket)
+    translations_release = asyncio.Event()
+
+    async def slow_translations(*args):
+        await translations_release.wait()
+
+    client.translations_handler = slow_translations
+    client.user_nicknames_handler = AsyncMock()
+    run_task = asyncio.create_task(client.run())
+
+    socket.packets.put_nowait(packet(EMsg.ServiceMethodResponse, target_job_name="Community.GetAppRichPresenceLocalization#1"))
+    socket.packets.put_nowait(packet(EMsg.ClientPlayerNicknameList))
+    await asyncio.sleep(0.01)
+    client.user_nicknames_handler.assert_called_once_with({})
+
+    translations_release.set()
+    await client.close(send_log_off=False)
+    await run_task
+
+
+@pytest.mark.asyncio
+async def test_handler_failure_ends_run():
+    socket = FakeSocket()
+    client = ProtobufClient(socket)
+    client.user_nicknames_handler = AsyncMock(side_effect=RuntimeError)
+    run_task = asyncio.create_task(client.run())
+    socket.packets.put_nowait(packet(EMsg.ClientPlayerNicknameList))
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(run_task, 1)
+    assert not client._dispatcher.running
+
+
+@pytest.mark.asyncio
+async def test_close_stops_run():
+    client = ProtobufClient(FakeSocket())
+    run_task = asyncio.create_task(client.run())
+    await asyncio.sleep(0)
+    await client.close(send_log_off=False)
+    await asyncio.wait_for(run_task, 1)
+    assert not client._dispatcher.running
+
+
+@pytest.mark.asyncio
+async def test_log_off_does_not_wait_for_pics_responses():
+    handler = RecordingHandler(slow={"pics"})
+    dispatcher = MessageDispatcher(handler, MESSAGE_ORDERING)
+    dispatcher.start()
+    await dispatcher.put(EMsg.ClientPICSProductInfoResponse, None, "pics")
+    await dispatcher.put(EMsg.ClientLoggedOff, None, "log off")
+    await asyncio.sleep(0.01)
+    assert handler.handled == ["log off"]
+    await dispatcher.close()
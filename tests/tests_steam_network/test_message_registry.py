@@ -0,0 +1,81 @@
+from unittest.mock import MagicMock
+
+import pytest
+from galaxy.unittest.mock import AsyncMock
+
+from steam_network.protocol.consts import EMsg
+from steam_network.protocol.message_registry import MessageRegistry, emsg_name
+from steam_network.protocol.protobuf_client import ProtobufClient
+from tests.tests_steam_network.packets import packet
+
+
+@pytest.fixture
+def client():
+    websocket = MagicMock()
+    websocket.send = AsyncMock()
+    return ProtobufClient(websocket)
+
+
+def test_emsg_name():
+    assert emsg_name(EMsg.ClientLicenseList) == "ClientLicenseList"
+    assert emsg_name(0xFFFFFF) == "Unknown16777215"
+
+
+def test_registry_rejects_second_handler():
+    registry = MessageRegistry()
+
+    @registry.message(EMsg.Multi)
+    async def handler(client, header, body):
+        pass
+
+    with pytest.raises(ValueError):
+        registry.message(EMsg.Multi)(handler)
+    assert registry.message_handler(EMsg.Multi) is handler
+    assert registry.message_handler(EMsg.ClientLogOnResponse) is None
+
+
+@pytest.mark.asyncio
+async def test_dispatch_calls_registered_handler(client):
+    client.user_nicknames_handler = AsyncMock()
+    await client._process_packet(packet(EMsg.ClientPlayerNicknameList))
+    client.user_nicknames_handler.assert_called_once_with({})
+
+
+@pytest.mark.asyncio
+async def test_service_method_dispatch_by_name(client):
+    client.translations_handler = AsyncMock()
+    await client._process_packet(packet(EMsg.ServiceMethodResponse, target_job_name="Community.GetAppRichPresenceLocalization#1"))
+    client.translations_handler.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_subscribers_see_messages(client):
+    client.user_nicknames_handler = AsyncMock()
+    nicknames_subscriber = AsyncMock()
+    everything_subscriber = AsyncMock()
+    client.subscribe(EMsg.ClientPlayerNicknameList, nicknames_subscriber)
+    client.subscribe(None, everything_subscriber)
+
+    await client._process_packet(packet(EMsg.ClientPlayerNicknameList, b""))
+    await client._process_packet(packet(EMsg.ClientHeartBeat, b""))
+
+    nicknames_subscriber.assert_called_once()
+    assert nicknames_subscriber.call_args[0][0] == EMsg.ClientPlayerNicknameList
+    assert [call[0][0] for call in everything_subscriber.call_args_list] == [EMsg.ClientPlayerNicknameList, EMsg.ClientHeartBeat]
+
+    client.unsubscribe(None, everything_subscriber)
+    await client._process_packet(packet(EMsg.ClientHeartBeat, b""))
+    assert everything_subscriber.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_failing_subscriber_does_not_break_dispatch(client):
+    client.user_nicknames_handler = AsyncMock()
+    working_subscriber = AsyncMock()
+    client.subscribe(EMsg.ClientPlayerNicknameList, AsyncMock(side_effect=RuntimeError))
+    client.subscribe(EMsg.ClientPlayerNicknameList, working_subscriber)
+
+    await client._process_packet(packet(EMsg.ClientPlayerNicknameList))
+
+    client.user_nicknames_handler.assert_called_once()
+    working_subscriber.assert_called_once()
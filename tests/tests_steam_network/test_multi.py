@@ -0,0 +1,114 @@
+import asyncio
+import gzip
+import struct
+from unittest.mock import MagicMock
+
+import pytest
+from galaxy.unittest.mock import AsyncMock
+
+from steam_network.protocol import multi_reader
+from steam_network.protocol.consts import EMsg
+from steam_network.protocol.multi_reader import iter_multi_packets
+from steam_network.protocol.protobuf_client import ProtobufClient
+from steam_network.protocol.messages.steammessages_base_pb2 import CMsgMulti
+from steam_network.protocol.messages.steammessages_clientserver_friends_pb2 import CMsgClientPlayerNicknameList
+from tests.tests_steam_network.packets import packet
+
+
+@pytest.fixture
+def client():
+    websocket = MagicMock()
+    websocket.send = AsyncMock()
+    client_ = ProtobufClient(websocket)
+    client_.user_nicknames_handler = AsyncMock()
+    return client_
+
+
+def nickname_list(steam_id: int, nickname: str) -> bytes:
+    message = CMsgClientPlayerNicknameList()
+    message.nicknames.add(steamid=steam_id, nickname=nickname)
+    return packet(EMsg.ClientPlayerNicknameList, message.SerializeToString())
+
+
+def multi(*packets: bytes, compress: bool = False) -> bytes:
+    body = b"".join(struct.pack("<I", len(p)) + p for p in packets)
+    message = CMsgMulti()
+    if compress:
+        message.size_unzipped = len(body)
+        message.message_body = gzip.compress(body)
+    else:
+        message.message_body = body
+    return packet(EMsg.Multi, message.SerializeToString())
+
+
+def received_nicknames(client):
+    return [call[0][0] for call in client.user_nicknames_handler.call_args_list]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("compress", [False, True])
+async def test_multi_dispatches_every_message_in_order(client, compress):
+    await client._process_packet(multi(nickname_list(1, "a"), nickname_list(2, "b"), compress=compress))
+    assert received_nicknames(client) == [{"1": "a"}, {"2": "b"}]
+
+
+@pytest.mark.asyncio
+async def test_nested_multi(client):
+    await client._process_packet(multi(nickname_list(1, "a"), multi(nickname_list(2, "b"), compress=True), nickname_list(3, "c")))
+    assert received_nicknames(client) == [{"1": "a"}, {"2": "b"}, {"3": "c"}]
+
+
+@pytest.mark.asyncio
+async def test_handlers_get_a_view_into_the_packet(client):
+    subscriber = AsyncMock()
+    client.subscribe(EMsg.ClientPlayerNicknameList, subscriber)
+    await client._process_packet(multi(nickname_list(1, "a")))
+    body = subscriber.call_args[0][2]
+    assert isinstance(body, memoryview)
+    assert bytes(body) == nickname_list(1, "a")[-len(body):]
+
+
+@pytest.mark.asyncio
+async def test_too_small_packet_is_ignored(client):
+    await client._process_packet(b"\x01\x02")
+    client.user_nicknames_handler.assert_not_called()
+
+
+async def read_packets(message_body: bytes, size_unzipped: int = 0):
+    return [packet async for packet in iter_multi_packets(message_body, size_unzipped)]
+
+
+@pytest.mark.asyncio
+async def test_gzip_packets_straddling_chunks(monkeypatch):
+    monkeypatch.setattr(multi_reader, "COMPRESSED_CHUNK_SIZE", 7)
+    packets = [bytes([i]) * (i * 13) for i in range(1, 20)]
+    body = b"".join(struct.pack("<I", len(p)) + p for p in packets)
+    assert await read_packets(gzip.compress(body), len(body)) == packets
+
+
+@pytest.mark.asyncio
+async def test_truncated_gzip_stops_at_last_complete_packet():
+    packets = [b"x" * 100, b"y" * 100]
+    body = b"".join(struct.pack("<I", len(p)) + p for p in packets)
+    compressed = gzip.compress(body, compresslevel=0)
+    assert await read_packets(compressed[:len(compressed) - 60], len(body)) == packets[:1]
+
+
+@pytest.mark.asyncio
+async def test_gzip_inflation_gives_the_loop_turns(monkeypatch):
+    monkeypatch.setattr(multi_reader, "COMPRESSED_CHUNK_SIZE", 64)
+    body = b"".join(struct.pack("<I", 1000) + bytes([i]) * 1000 for i in range(50))
+    compressed = gzip.compress(body, compresslevel=0)
+    turns = 0
+
+    async def count_turns():
+        nonlocal turns
+        while True:
+            await asyncio.sleep(0)
+            turns += 1
+
+    counter = asyncio.ensure_future(count_turns())
+    await asyncio.sleep(0)
+    await read_packets(compressed, len(body))
+    counter.cancel()
+    assert turns >= len(compressed) // 64 - 1
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from steam_network.notification_pacer import NotificationPacer
+
+
+@pytest.mark.asyncio
+async def test_burst_goes_out_at_once_then_rate_applies():
+    pacer = NotificationPacer(rate=100, burst=10)
+    loop = asyncio.get_running_loop()
+
+    start = loop.time()
+    for _ in range(10):
+        await pacer.acquire()
+    assert loop.time() - start < 0.01
+
+    for _ in range(5):
+        await pacer.acquire()
+    assert loop.time() - start >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_waits_for_backed_up_connection():
+    drained = asyncio.Event()
+    drains = []
+
+    async def drain():
+        drains.append(None)
+        await drained.wait()
+
+    pacer = NotificationPacer(drain, rate=100, burst=10)
+    acquire = asyncio.ensure_future(pacer.acquire())
+    await asyncio.sleep(0)
+    assert drains and not acquire.done()
+
+    drained.set()
+    await acquire
+
+
+@pytest.mark.asyncio
+async def test_one_drain_at_a_time():
+    drained = asyncio.Event()
+    draining = []
+
+    async def drain():
+        assert not draining
+        draining.append(None)
+        await drained.wait()
+        draining.pop()
+
+    pacer = NotificationPacer(drain, rate=100, burst=10)
+    acquires = asyncio.gather(pacer.acquire(), pacer.acquire())
+    await asyncio.sleep(0)
+    assert len(draining) == 1
+
+    drained.set()
+    await acquires
@@ -18,8 +18,12 @@ async def async_gen(items: Iterable):
 @pytest.fixture
 def games_cache_mock():
     mock = MagicMock(spec=())
-    mock.dump = Mock()
+    mock.persist = Mock(return_value=False)
+    mock.wait_loaded = AsyncMock()
     mock.wait_ready = AsyncMock()
+    mock.wait_resolved = AsyncMock(return_value=True)
+    mock.ready = True
+    mock.get_package_ids = Mock(return_value=set())
     return mock
 
 
@@ -46,8 +50,8 @@ async def test_no_games(games_cache_mock, authenticated_plugin):
 @pytest.mark.asyncio
 async def test_multiple_games(games_cache_mock, authenticated_plugin):
     games_cache_mock.get_owned_games = MagicMock(return_value=async_gen([
-        App(appid="281990", title="Stellaris", type="game", parent=None),
-        App(appid="236850", title="Europa Universalis IV", type="game", parent=None),
+        App(appid=281990, title="Stellaris", type="game", parent=None),
+        App(appid=236850, title="Europa Universalis IV", type="game", parent=None),
     ]))
     result = await authenticated_plugin.get_owned_games()
     assert result == [
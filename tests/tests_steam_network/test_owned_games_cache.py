@@ -1,10 +1,13 @@
+import asyncio
 from unittest.mock import PropertyMock
 
 import pytest
 
 from typing import NamedTuple
 
-from steam_network.games_cache import GamesCache, License, App, LicensesCache
+from steam_network import games_cache
+from steam_network.app_store import AppStore
+from steam_network.games_cache import GamesCache, License, App, LicensesCache, GAMES_CACHE_KEY, GAMES_JOURNAL_KEY
 from steam_network.protocol.protobuf_client import SteamLicense
 
 
@@ -14,7 +17,7 @@ class ProtoResponse(NamedTuple):
 
 @pytest.fixture()
 def cache_version():
-    return "1.0.0"
+    return "2.0.0"
 
 
 @pytest.fixture
@@ -29,16 +32,16 @@ def test_packages_import_clean(cache):
                 SteamLicense(ProtoResponse(321), False)]
     cache.reset_storing_map()
     cache.start_packages_import(licenses)
-    exp_result = [License(package_id='123',shared=True), License(package_id='321', shared=False)]
+    exp_result = [License(package_id=123, shared=True), License(package_id=321, shared=False)]
     assert cache._storing_map.licenses == exp_result
 
 
 def test_packages_import_additive(cache):
-    cache._storing_map.licenses = [License(package_id='111', shared=True)]
+    cache._storing_map.licenses = [License(package_id=111, shared=True)]
     licenses = [SteamLicense(ProtoResponse(123), True),
                 SteamLicense(ProtoResponse(321), False)]
     cache.start_packages_import(licenses)
-    exp_result = [License(package_id='111', shared=True), License(package_id='123', shared=True), License(package_id='321', shared=False)]
+    exp_result = [License(package_id=111, shared=True), License(package_id=123, shared=True), License(package_id=321, shared=False)]
     assert cache._storing_map.licenses == exp_result
 
 
@@ -48,21 +51,233 @@ def test_cache_load_incompat_ver(cache):
     assert not cache._storing_map.licenses
 
 
-def test_cache_load_ok(cache):
-    cache_to_load = r"""{"licenses": "{\"licenses\": [{\"package_id\": \"39661\", \"shared\": false, \"app_ids\": [\"286000\"]}], \"apps\":{\"286000\": {\"appid\": \"286000\", \"title\": \"Tooth and Tail\", \"type\": \"game\", \"parent\": null}}}", "version": "%s"}""" % cache.version
+def test_cache_load_legacy(cache):
+    cache_to_load = r"""{"licenses": "{\"licenses\": [{\"package_id\": \"39661\", \"shared\": false, \"app_ids\": [\"286000\"]}], \"apps\":{\"286000\": {\"appid\": \"286000\", \"title\": \"Tooth and Tail\", \"type\": \"game\", \"parent\": null}}}", "version": "1.0.0"}"""
     cache.loads(cache_to_load)
 
-    exp_result_licenses = [License(package_id="39661", shared=False, app_ids={"286000"})]
-    exp_result_apps = {"286000": App(appid="286000", title="Tooth and Tail", type="game", parent=None)}
+    exp_result_licenses = [License(package_id=39661, shared=False, app_ids=(286000,))]
+    exp_result_apps = {286000: App(appid=286000, title="Tooth and Tail", type="game", parent=None)}
     assert cache._storing_map.licenses == exp_result_licenses
     assert cache._storing_map.apps == exp_result_apps
 
 
 def test_cache_dump(cache):
     cache_map = LicensesCache()
-    cache_map.licenses = [License(package_id="39661", shared=False, app_ids={"286000"})]
-    cache_map.apps = {"286000": App(appid="286000", title="Tooth and Tail", type="game", parent=None)}
+    cache_map.licenses = [License(package_id=39661, shared=False, app_ids=(286000,))]
+    cache_map.apps = {286000: App(appid=286000, title="Tooth and Tail", type="game", parent=None)}
     cache._storing_map = cache_map
-    exp_result = r"""{"licenses": "{\"licenses\": [{\"package_id\": \"39661\", \"shared\": false, \"app_ids\": [\"286000\"]}], \"apps\": {\"286000\": {\"appid\": \"286000\", \"title\": \"Tooth and Tail\", \"type\": \"game\", \"parent\": null}}}", "version": "%s"}""" % cache.version
+    exp_result = r"""{"change_number":0,"licenses":[[39661,0,0,[286000]]],"apps":[[286000,"Tooth and Tail","game",null,0]],"version":"%s"}""" % cache.version
     assert cache.dump() == exp_result
 
+
+
+def test_product_info_resolves_licenses(cache):
+    cache.start_packages_import([SteamLicense(ProtoResponse(123), False), SteamLicense(ProtoResponse(321), True)])
+    assert not cache._ready_event.is_set()
+
+    cache.update_product_info([(123, (286000, 286001), 1), (321, (), 1)], [])
+    assert cache._storing_map.licenses[0].app_ids == (286000, 286001)
+    assert not cache._ready_event.is_set()
+
+    cache.update_product_info([], [(286000, "Tooth and Tail", "game", None, 2), (286001, "Soundtrack", "dlc", "286000", 2)])
+    assert cache._storing_map.apps[286001] == App(appid=286001, title="Soundtrack", type="dlc", parent=286000, change_number=2)
+    assert cache.get_resolved_packages() == {123}
+    assert cache._ready_event.is_set()
+
+
+def test_products_refresh_waits_for_changed_items(cache):
+    cache.start_packages_import([SteamLicense(ProtoResponse(123), False), SteamLicense(ProtoResponse(321), False)])
+    cache.update_product_info([(123, (1, 2), 10), (321, (3,), 10)], [])
+    cache.update_product_info([], [(1, "One", "game", None, 10), (2, "Two", "game", None, 10), (3, "Three", "game", None, 10)])
+    cache.set_change_number_when_ready(20)
+    assert cache.change_number == 20
+
+    licenses = [SteamLicense(ProtoResponse(123), False), SteamLicense(ProtoResponse(321), False)]
+    to_import, app_ids = cache.reconcile_licenses(licenses, {123: 25, 321: 10}, {2: 25, 3: 30, 4: 30})
+    assert (to_import, app_ids) == (licenses[:1], {2, 3})
+    cache.set_change_number_when_ready(30)
+    assert not cache._ready_event.is_set()
+    assert cache.change_number == 20
+    #what the cache has stays until the new info comes in
+    assert cache._storing_map.licenses[0].app_ids == (1, 2)
+
+    cache.update_product_info([(123, (1,), 25)], [(3, "Three", "game", None, 30)])
+    assert cache._storing_map.licenses[0].app_ids == (1,)
+    assert not cache._ready_event.is_set()
+    cache.update_product_info([], [(2, "Two", "game", None, 25)])
+    assert cache._storing_map.licenses[0].app_ids == (1,)
+    assert cache._ready_event.is_set()
+    assert cache.change_number == 30
+
+
+def test_package_steam_sent_nothing_on_keeps_its_apps(cache):
+    licenses = [SteamLicense(ProtoResponse(123), False)]
+    cache.reconcile_licenses(licenses)
+    cache.update_product_info([(123, (1, 2), 10)], [(1, "One", "game", None, 10), (2, "Two", "game", None, 10)])
+
+    cache.set_change_number_when_ready(20)
+
+    cache.reconcile_licenses(licenses, {123: 25}, {})
+    cache.set_change_number_when_ready(30)
+    cache.update_product_info([(123, (), 0)], [])
+    assert cache._storing_map.licenses == [License(package_id=123, shared=False, app_ids=(1, 2), change_number=10)]
+    assert cache.ready
+    #so the package is refreshed again next time
+    assert cache.change_number == 20
+
+
+@pytest.mark.asyncio
+async def test_refresh_that_timed_out_keeps_the_app(cache):
+    licenses = [SteamLicense(ProtoResponse(123), False)]
+    cache.reconcile_licenses(licenses)
+    cache.update_product_info([(123, (10,), 5)], [(10, "Ten", "game", None, 5)])
+    cache.set_change_number_when_ready(5)
+
+    cache.reconcile_licenses(licenses, {}, {10: 6})
+    cache.set_change_number_when_ready(6)
+    assert not cache.ready
+    cache.product_info_failed([], [10])
+    assert cache.ready
+    assert [app async for app in cache.get_owned_games()] == [App(10, "Ten", "game", None, 5)]
+    assert cache.change_number == 5
+
+    assert cache.reconcile_licenses(licenses, {}, {10: 6}) == ([], {10})
+
+
+def test_apps_that_failed_to_come_dont_hold_up_the_import(cache):
+    licenses = [SteamLicense(ProtoResponse(123), False)]
+    cache.reconcile_licenses(licenses)
+    cache.set_change_number_when_ready(5)
+    cache.update_product_info([(123, (1, 2), 5)], [(1, "One", "game", None, 5)])
+    assert not cache.ready
+
+    cache.product_info_failed([], [2])
+    assert cache.ready
+    assert 2 not in cache._storing_map.apps
+    assert cache.change_number == 0
+    assert cache.reconcile_licenses(licenses) == (licenses, set())
+    assert not cache.ready
+
+    cache.update_product_info([(123, (1, 2), 5)], [(2, "Two", "game", None, 5)])
+    assert cache.ready
+
+
+def test_reconcile_licenses_keeps_resolved_packages(cache):
+    cache.start_packages_import([SteamLicense(ProtoResponse(123), False), SteamLicense(ProtoResponse(321), False)])
+    cache.update_product_info([(123, (1,), 1), (321, (2,), 1)], [(1, "One", "game", None, 1), (2, "Two", "game", None, 1)])
+    assert cache._ready_event.is_set()
+
+    to_import, app_ids = cache.reconcile_licenses([
+        SteamLicense(ProtoResponse(123), True),
+        SteamLicense(ProtoResponse(555), False),
+        SteamLicense(ProtoResponse(555), True),
+    ])
+    assert (to_import, app_ids) == ([SteamLicense(ProtoResponse(555), False)], set())
+    assert cache._storing_map.licenses == [
+        License(package_id=123, shared=True, app_ids=(1,), change_number=1),
+        License(package_id=555, shared=False),
+    ]
+    assert set(cache._storing_map.apps) == {1}
+    assert not cache._ready_event.is_set()
+
+    cache.update_product_info([(555, (), 2)], [])
+    assert cache._ready_event.is_set()
+
+
+def test_progress_counts_what_came_in(cache):
+    assert cache.progress is None
+    cache.reconcile_licenses([SteamLicense(ProtoResponse(123), False), SteamLicense(ProtoResponse(321), False)])
+    cache.count_received_bytes(100)
+    cache.update_product_info([(123, (1, 2), 1)], [(1, "One", "game", None, 1)])
+
+    progress = cache.progress
+    assert progress[:5] == (1, 2, 1, 2, 100)
+    assert progress.elapsed >= 0
+
+
+@pytest.mark.asyncio
+async def test_resolved_games_are_served_at_deadline_and_rest_is_added(cache):
+    cache.reconcile_licenses([SteamLicense(ProtoResponse(123), False), SteamLicense(ProtoResponse(321), False)])
+    cache.update_product_info([(123, (1,), 1), (321, (2,), 1)], [(1, "One", "game", None, 1)])
+
+    assert not await cache.wait_resolved(timeout=10, import_deadline=0.01)
+    cache.add_game_lever = True
+    assert [app.appid async for app in cache.get_owned_games()] == [1]
+
+    cache.update_product_info([], [(2, "Two", "game", None, 1)])
+    assert [app.appid for app in cache.consume_added_games()] == [2]
+    assert await cache.wait_resolved(timeout=10, import_deadline=0.01)
+
+
+@pytest.mark.asyncio
+async def test_stored_apps_resolve_without_steam(tmp_path):
+    store = AppStore(str(tmp_path / "apps.sqlite3"))
+    first = GamesCache(store)
+    first.reconcile_licenses([SteamLicense(ProtoResponse(123), False)])
+    first.update_product_info([(123, (1, 2), 1)], [(1, "One", "game", None, 1), (2, "Two", "game", None, 1)])
+
+    cache = GamesCache(store)
+    cache.reconcile_licenses([SteamLicense(ProtoResponse(123), False)])
+    cache.update_product_info([(123, (1, 2, 3), 1)], [])
+    assert await cache.resolve_stored_apps([1, 2, 3]) == set()
+    assert await cache.stored_apps_change_number() == 0
+
+    cache.expire_stored_apps({}, 1)
+    assert await cache.resolve_stored_apps([1, 2, 3]) == {1, 2}
+    assert cache._storing_map.apps[2] == App(2, "Two", "game", None, 1)
+    assert not cache.ready
+
+    cache.update_product_info([], [(3, "Three", "game", None, 1)])
+    assert cache.ready
+    store.close()
+
+
+def test_persist_appends_changes_to_journal(cache, mocker):
+    persistent_cache = {}
+    cache.start_packages_import([SteamLicense(ProtoResponse(123), False), SteamLicense(ProtoResponse(321), False)])
+    cache.update_product_info([(123, (1,), 1), (321, (2,), 1)], [(1, "One", "game", None, 1), (2, "Two", "game", None, 1)])
+    assert cache.persist(persistent_cache)
+    snapshot = persistent_cache[GAMES_CACHE_KEY]
+    assert persistent_cache[GAMES_JOURNAL_KEY] == ""
+    assert not cache.persist(persistent_cache)
+
+    cache.reconcile_licenses([SteamLicense(ProtoResponse(123), True), SteamLicense(ProtoResponse(555), False)])
+    cache.update_product_info([(555, (3,), 2)], [(3, "Three", "dlc", "1", 2)])
+    cache.set_change_number_when_ready(7)
+    assert cache.persist(persistent_cache)
+    assert persistent_cache[GAMES_CACHE_KEY] is snapshot
+    assert persistent_cache[GAMES_JOURNAL_KEY]
+
+    loaded = GamesCache()
+    loaded.loads(persistent_cache[GAMES_CACHE_KEY], persistent_cache[GAMES_JOURNAL_KEY])
+    assert loaded._storing_map == cache._storing_map
+    assert loaded.get_resolved_packages() == {123, 555}
+
+    mocker.patch.object(games_cache, "JOURNAL_COMPACT_MIN_SIZE", 0)
+    cache.update_product_info([], [(3, "Three", "dlc", "1", 3)])
+    assert cache.persist(persistent_cache)
+    assert persistent_cache[GAMES_JOURNAL_KEY] == ""
+    assert persistent_cache[GAMES_CACHE_KEY] == cache.dump()
+
+
+@pytest.mark.asyncio
+async def test_load_off_loop(cache):
+    persistent_cache = {}
+    cache.start_packages_import([SteamLicense(ProtoResponse(123), False)])
+    cache.update_product_info([(123, (1,), 1)], [(1, "One", "game", None, 1)])
+    cache.persist(persistent_cache)
+
+    loaded = GamesCache()
+    loading = asyncio.create_task(loaded.load(persistent_cache[GAMES_CACHE_KEY], persistent_cache[GAMES_JOURNAL_KEY]))
+    await asyncio.sleep(0)
+    assert not loaded.get_package_ids()
+    await asyncio.wait_for(loaded.wait_loaded(), 5)
+    await loading
+    assert loaded.get_resolved_packages() == {123}
+
+
+@pytest.mark.asyncio
+async def test_load_survives_broken_cache(cache):
+    await cache.load("{not json")
+    await asyncio.wait_for(cache.wait_loaded(), 1)
+    assert not cache.get_package_ids()
@@ -0,0 +1,98 @@
+import asyncio
+from typing import NamedTuple
+from unittest.mock import MagicMock
+
+import pytest
+from galaxy.api.consts import LicenseType
+from galaxy.api.types import Game, LicenseInfo
+from galaxy.unittest.mock import AsyncMock
+
+from backend_steam_network import SteamNetworkBackend
+from steam_network.games_cache import GamesCache
+from steam_network.protocol.protobuf_client import SteamLicense
+
+
+class ProtoResponse(NamedTuple):
+    package_id: int
+
+
+def game(appid: int, title: str) -> Game:
+    return Game(str(appid), title, [], LicenseInfo(LicenseType.SinglePurchase, None))
+
+
+def persisted_cache() -> dict:
+    cache = GamesCache()
+    cache.reconcile_licenses([SteamLicense(ProtoResponse(1), False), SteamLicense(ProtoResponse(2), False)])
+    cache.update_product_info([(1, (10,), 5), (2, (20,), 5)], [(10, "Ten", "game", None, 5), (20, "Twenty", "game", None, 5)])
+    persistent_cache = {}
+    cache.persist(persistent_cache)
+    return persistent_cache
+
+
+@pytest.fixture
+async def backend(mocker, tmp_path):
+    websocket_client = MagicMock()
+    websocket_client.close = AsyncMock()
+    websocket_client.wait_closed = AsyncMock()
+    mocker.patch("backend_steam_network.WebSocketClient", return_value=websocket_client)
+    mocker.patch("backend_steam_network.create_parser_pool", return_value=MagicMock())
+    mocker.patch("backend_steam_network.default_app_store_path", return_value=str(tmp_path / "apps.sqlite3"))
+    backend_ = SteamNetworkBackend(
+        MagicMock(), MagicMock(), MagicMock(), persisted_cache(), MagicMock(), MagicMock(),
+        add_game=MagicMock(), remove_game=MagicMock(),
+    )
+    backend_._user_info_cache.steam_id = 123
+    backend_._steam_run_task = asyncio.create_task(asyncio.sleep(0))
+    yield backend_
+    await backend_.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_games_from_persisted_cache_are_revalidated_once_refresh_is_in(backend):
+    games_cache = backend._games_cache
+    assert await backend.get_owned_games() == [game(10, "Ten"), game(20, "Twenty")]
+    await asyncio.sleep(0)
+
+    #package 2 is gone, and package 1 changed since the cache was persisted. Being ready for a moment in between
+    #doesn't count.
+    licenses = [SteamLicense(ProtoResponse(1), False)]
+    games_cache.reconcile_licenses(licenses)
+    assert games_cache.ready
+    games_cache.reconcile_licenses(licenses, {1: 6}, {})
+    await asyncio.sleep(0.01)
+    assert not backend._revalidate_owned_games_task.done()
+
+    games_cache.update_product_info([(1, (10, 30), 6)], [(30, "Thirty", "game", None, 6)])
+    await backend._revalidate_owned_games_task
+
+    backend._remove_game.assert_called_once_with("20")
+    backend._add_game.assert_called_once_with(game(30, "Thirty"))
+    assert games_cache.add_game_lever
+    assert games_cache.consume_added_games() == []
+
+
+@pytest.mark.asyncio
+async def test_revalidation_gives_up_waiting_without_removing_games(backend, mocker):
+    mocker.patch("backend_steam_network.GAME_CACHE_IS_READY_TIMEOUT", 0.05)
+    games_cache = backend._games_cache
+    assert await backend.get_owned_games() == [game(10, "Ten"), game(20, "Twenty")]
+
+    #package 3 never comes
+    games_cache.reconcile_licenses([SteamLicense(ProtoResponse(1), False), SteamLicense(ProtoResponse(3), False)])
+    await backend._revalidate_owned_games_task
+
+    assert not games_cache.ready
+    backend._remove_game.assert_not_called()
+    assert backend._owned_games_parsed
+
+
+@pytest.mark.asyncio
+async def test_only_the_latest_answer_is_revalidated(backend):
+    await backend.get_owned_games()
+    first_revalidation = backend._revalidate_owned_games_task
+    assert backend._owned_games_parsed
+
+    await backend.get_owned_games()
+    await asyncio.sleep(0)
+    assert first_revalidation.cancelled()
+    assert not backend._revalidate_owned_games_task.done()
@@ -0,0 +1,100 @@
+import asyncio
+import gzip
+import hashlib
+from unittest.mock import MagicMock
+
+import pytest
+import vdf
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from galaxy.unittest.mock import AsyncMock
+
+from http_client import HttpClient
+from steam_network.protocol.consts import EMsg
+from steam_network.protocol.protobuf_client import ProtobufClient
+from steam_network.protocol.messages.steammessages_clientserver_appinfo_pb2 import CMsgClientPICSProductInfoResponse
+from steam_network.steam_http_client import SteamHttpClient
+from tests.tests_steam_network.packets import packet
+
+
+def app_text(appid: int, name: str) -> bytes:
+    return vdf.dumps({"appinfo": {"appid": str(appid), "common": {"name": name, "type": "game"}}}).encode()
+
+
+class AppInfoServer:
+    """Stands in for the http_host of a PICS response: serves app infos as gzipped text vdf, by appid and sha."""
+
+    def __init__(self, apps):
+        self.files = {}
+        for appid, name in apps.items():
+            text = app_text(appid, name)
+            self.files[(appid, hashlib.sha1(text).hexdigest())] = gzip.compress(text)
+        self.requests = 0
+        self.in_flight = 0
+        self.most_in_flight = 0
+        app = web.Application()
+        app.router.add_get("/appinfo/{appid}/sha/{sha}.txt.gz", self.handle)
+        self.server = TestServer(app)
+
+    def sha(self, appid: int) -> bytes:
+        return bytes.fromhex(next(sha for file_appid, sha in self.files if file_appid == appid))
+
+    @property
+    def host(self) -> str:
+        return f"{self.server.host}:{self.server.port}"
+
+    async def handle(self, request):
+        self.requests += 1
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            body = self.files.get((int(request.match_info["appid"]), request.match_info["sha"]))
+            if body is None:
+                raise web.HTTPNotFound()
+            return web.Response(body=body)
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+async def http_client():
+    client = HttpClient()
+    yield client
+    await client.close()
+
+
+def product_info_packet(http_host: str, apps) -> bytes:
+    message = CMsgClientPICSProductInfoResponse(http_host=http_host, http_min_size=1024)
+    for appid, sha in apps:
+        message.apps.add(appid=appid, change_number=7, sha=sha, size=4096)
+    return packet(EMsg.ClientPICSProductInfoResponse, message.SerializeToString())
+
+
+async def wait_for_downloads(client: ProtobufClient):
+    while client._pics_downloads:
+        await asyncio.gather(*client._pics_downloads)
+
+
+@pytest.mark.asyncio
+async def test_big_app_infos_are_downloaded(http_client):
+    server = AppInfoServer({appid: f"Game {appid}" for appid in range(1, 21)})
+    await server.server.start_server()
+    try:
+        websocket = MagicMock()
+        websocket.send = AsyncMock()
+        client = ProtobufClient(websocket, pics_http_get=SteamHttpClient(http_client).get_pics_app_info)
+        client.product_info_handler = MagicMock()
+        client.product_info_failed_handler = MagicMock()
+
+        apps = [(appid, server.sha(appid)) for appid in range(1, 21)] + [(21, b"\x01" * 20)]
+        await client._process_packet(product_info_packet(server.host, apps))
+        await wait_for_downloads(client)
+    finally:
+        await server.server.close()
+
+    received = [app for call in client.product_info_handler.call_args_list for app in call[0][1]]
+    assert sorted(received) == [(appid, f"Game {appid}", "game", None, 7) for appid in range(1, 21)]
+    client.product_info_failed_handler.assert_called_once_with([], [21])
+    assert server.requests == 21
+    assert 1 < server.most_in_flight <= 8
@@ -0,0 +1,164 @@
+import asyncio
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import MagicMock
+
+import pytest
+import vdf
+from galaxy.unittest.mock import AsyncMock
+
+from steam_network.protocol.consts import EMsg
+from steam_network.protocol import pics_parser
+from steam_network.protocol.pics_parser import UNKNOWN_TYPE, create_parser_pool, parse_apps, parse_packages
+from steam_network.protocol.protobuf_client import ProtobufClient
+from steam_network.protocol.messages.steammessages_clientserver_appinfo_pb2 import CMsgClientPICSProductInfoResponse
+from tests.tests_steam_network.packets import packet
+
+
+def package_buffer(package_id: int, appids) -> bytes:
+    content = {str(package_id): {"packageid": package_id, "appids": {str(i): appid for i, appid in enumerate(appids)}}}
+    return b"\x00\x00\x00\x00" + vdf.binary_dumps(content)
+
+
+def app_buffer(appid: int, common: dict, extended: dict = None) -> bytes:
+    appinfo = {"appid": str(appid), "common": common}
+    if extended is not None:
+        appinfo["extended"] = extended
+    return vdf.dumps({"appinfo": appinfo}).encode() + b"\x00"
+
+
+def product_info_packet(packages=(), apps=()) -> bytes:
+    message = CMsgClientPICSProductInfoResponse()
+    for package_id, buffer in packages:
+        message.packages.add(packageid=package_id, change_number=5, buffer=buffer)
+    for appid, buffer in apps:
+        message.apps.add(appid=appid, change_number=6, buffer=buffer)
+    return packet(EMsg.ClientPICSProductInfoResponse, message.SerializeToString())
+
+
+def test_parse_packages():
+    assert parse_packages([
+        (10, 1, package_buffer(10, [100, 101])),
+        (11, 2, package_buffer(12, [102])),
+    ]) == [(10, (100, 101), 1), (11, (), 2)]
+
+
+def test_parse_apps():
+    assert parse_apps([
+        (100, 1, app_buffer(100, {"name": "Game", "type": "Game"})),
+        (101, 2, app_buffer(101, {"name": "Dlc", "type": "DLC"}, {"dlcforappid": "100"})),
+        (102, 3, app_buffer(102, {"name": "Nameless"}, {})),
+    ]) == [
+        (100, "Game", "game", None, 1),
+        (101, "Dlc", "dlc", "100", 2),
+        (102, UNKNOWN_TYPE, UNKNOWN_TYPE, None, 3),
+    ]
+
+
+def test_parse_in_process_pool():
+    pool = create_parser_pool(max_workers=1)
+    try:
+        assert pool.submit(parse_packages, [(10, 1, package_buffer(10, [100]))]).result(timeout=30) == [(10, (100,), 1)]
+    finally:
+        pool.shutdown()
+
+
+@pytest.fixture
+def client():
+    websocket = MagicMock()
+    websocket.send = AsyncMock()
+    client_ = ProtobufClient(websocket)
+    client_.product_info_handler = MagicMock()
+    return client_
+
+
+@pytest.mark.asyncio
+async def test_response_is_applied_at_once_on_loop(client):
+    loop_thread = []
+    client.product_info_handler.side_effect = lambda packages, apps: loop_thread.append(asyncio.get_running_loop())
+    client.get_apps_info = AsyncMock()
+
+    await client._process_packet(product_info_packet(
+        packages=[(10, package_buffer(10, [100, 101]))],
+        apps=[(100, app_buffer(100, {"name": "Game", "type": "game"}))],
+    ))
+
+    client.product_info_handler.assert_called_once_with([(10, (100, 101), 5)], [(100, "Game", "game", None, 6)])
+    assert loop_thread
+    client.get_apps_info.assert_called_once_with([100, 101])
+
+
+class BrokenPool(Executor):
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        return future
+
+
+def game_apps(count: int):
+    return [(appid, app_buffer(appid, {"name": f"Game {appid}", "type": "game"})) for appid in range(100, 100 + count)]
+
+
+@pytest.mark.asyncio
+async def test_broken_pool_falls_back_to_default_executor():
+    websocket = MagicMock()
+    websocket.send = AsyncMock()
+    client = ProtobufClient(websocket, pics_executor=BrokenPool())
+    client.product_info_handler = MagicMock()
+
+    await client._process_packet(product_info_packet(apps=game_apps(pics_parser.POOL_MIN_ITEMS)))
+
+    client.product_info_handler.assert_called_once_with(
+        [], [(appid, f"Game {appid}", "game", None, 6) for appid in range(100, 100 + pics_parser.POOL_MIN_ITEMS)]
+    )
+    assert client._pics_executor is None
+
+
+@pytest.mark.asyncio
+async def test_small_response_is_not_sent_to_pool():
+    websocket = MagicMock()
+    websocket.send = AsyncMock()
+    pool = BrokenPool()
+    client = ProtobufClient(websocket, pics_executor=pool)
+    client.product_info_handler = MagicMock()
+
+    await client._process_packet(product_info_packet(apps=game_apps(1)))
+
+    client.product_info_handler.assert_called_once_with([], [(100, "Game 100", "game", None, 6)])
+    assert pool.submitted == 0
+
+
+def vdf_text(*lines: str) -> str:
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("text", [
+    # nested keys with the same names don't count
+    vdf_text('"appinfo"', '{', '"config"', '{', '"name" "x"', '"type" "y"', '}', '"common"', '{', '"name" "Game"', '"type" "Game"', '}', '}'),
+    # extended before common, and a dlc without a parent
+    vdf_text('"appinfo"', '{', '"extended"', '{', '"developer" "x"', '}', '"common"', '{', '"name" "Dlc"', '"type" "DLC"', '}', '}'),
+    vdf_text('"appinfo"', '{', '"common"', '{', '"name" "Dlc"', '"type" "dlc"', '}', '}'),
+    vdf_text('"appinfo"', '{', '"common"', '{', '"name" "Dlc"', '"type" "dlc"', '}', '"config"', '{', '}', '"extended"', '{', '"dlcforappid" "5"', '}', '}'),
+    # later sections are never looked at once common is known
+    vdf_text('"appinfo"', '{', '"common"', '{', '"name" "Game"', '"type" "game"', '}', '"depots"', '{', '"1"', '{', '"maxsize" "1"', '}', '}', '}'),
+    vdf_text('"appinfo"', '{', '\t// comment "name" "no"', '\t"common"', '\t{', '\t\t"name"\t\t"Say \\"hi\\"\\\\\\n"', '\t\t"type"\t\t"game"', '\t}', '}'),
+    vdf_text('"appinfo"', '{', '"common"', '{', '"name" "Game"', '}', '}'),
+    # not something the scanner reads itself
+    vdf_text('"appinfo"', '{', '"common"', '{', '"name" "Game"', '"type" "game" [$WIN32]', '}', '}'),
+    vdf_text('appinfo', '{', 'common', '{', 'name Game', 'type game', '}', '}'),
+])
+def test_scanner_agrees_with_vdf(text):
+    buffer = text.encode() + b"\x00"
+    assert parse_apps([(7, 1, buffer)]) == [pics_parser._parse_app(7, text) + (1,)]
+
+
+def test_scanner_falls_back_for_unquoted_tokens(mocker):
+    parse_app = mocker.spy(pics_parser, "_parse_app")
+    parse_apps([(7, 1, vdf_text('"appinfo"', '{', '"common"', '{', '"name" "Game"', '"type" "game"', '}', '}').encode() + b"\x00")])
+    parse_app.assert_not_called()
+    parse_apps([(7, 1, vdf_text('appinfo', '{', 'common', '{', 'name Game', 'type game', '}', '}').encode() + b"\x00")])
+    parse_app.assert_called_once()
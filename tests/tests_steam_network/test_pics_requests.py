@@ -0,0 +1,176 @@
+import asyncio
+import struct
+from unittest.mock import MagicMock
+
+import pytest
+from galaxy.unittest.mock import AsyncMock
+
+from steam_network.protocol import protobuf_client
+from steam_network.protocol.consts import EMsg
+from steam_network.protocol.pics_parser import UNKNOWN_TYPE
+from steam_network.protocol.protobuf_client import ProtobufClient
+from steam_network.protocol.messages.steammessages_base_pb2 import CMsgProtoBufHeader
+from steam_network.protocol.messages.steammessages_clientserver_appinfo_pb2 import (
+    CMsgClientPICSAccessTokenRequest,
+    CMsgClientPICSAccessTokenResponse,
+    CMsgClientPICSProductInfoRequest,
+    CMsgClientPICSProductInfoResponse,
+)
+from tests.tests_steam_network.packets import packet
+
+
+@pytest.fixture
+def websocket():
+    websocket_ = MagicMock()
+    websocket_.send = AsyncMock()
+    return websocket_
+
+
+@pytest.fixture
+def client(websocket):
+    client_ = ProtobufClient(websocket, pics_batch_size=2, pics_requests_in_flight=2)
+    client_.product_info_handler = MagicMock()
+    client_.product_info_failed_handler = MagicMock()
+    return client_
+
+
+def sent_requests(websocket, emsg=EMsg.ClientPICSProductInfoRequest, message_type=CMsgClientPICSProductInfoRequest):
+    requests = []
+    for call in websocket.send.call_args_list:
+        data = call[0][0]
+        if struct.unpack("<I", data[:4])[0] & ~ProtobufClient._PROTO_MASK != emsg:
+            continue
+        header_len = struct.unpack("<I", data[4:8])[0]
+        header = CMsgProtoBufHeader()
+        header.ParseFromString(data[8:8 + header_len])
+        request = message_type()
+        request.ParseFromString(data[8 + header_len:])
+        requests.append((header.jobid_source, request))
+    return requests
+
+
+def reply(emsg: int, job_id: int, message) -> bytes:
+    return packet(emsg, message.SerializeToString(), jobid_target=job_id)
+
+
+def response(job_id: int, response_pending: bool = False, **fields) -> bytes:
+    return reply(EMsg.ClientPICSProductInfoResponse, job_id, CMsgClientPICSProductInfoResponse(response_pending=response_pending, **fields))
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_requests_are_batched_and_bounded(client, websocket):
+    await client.get_apps_info([1, 2, 3, 4, 5])
+    await settle()
+
+    requests = sent_requests(websocket)
+    assert [[app.appid for app in request.apps] for _, request in requests] == [[1, 2], [3, 4]]
+    assert requests[0][1].sequence_number != requests[1][1].sequence_number
+
+    await client._process_packet(response(requests[0][0]))
+    await settle()
+    requests = sent_requests(websocket)
+    assert [[app.appid for app in request.apps] for _, request in requests[2:]] == [[5]]
+
+
+@pytest.mark.asyncio
+async def test_pending_response_keeps_batch_in_flight(client, websocket):
+    await client.get_apps_info([1, 2, 3, 4, 5, 6])
+    await settle()
+    job_id = sent_requests(websocket)[0][0]
+
+    await client._process_packet(response(job_id, response_pending=True))
+    await settle()
+    assert len(sent_requests(websocket)) == 2
+
+    await client._process_packet(response(job_id))
+    await settle()
+    assert len(sent_requests(websocket)) == 3
+
+
+@pytest.mark.asyncio
+async def test_timed_out_batch_is_retried_then_given_up(client, websocket, mocker):
+    mocker.patch.object(protobuf_client, "PICS_REQUEST_TIMEOUT", 0.01)
+    mocker.patch.object(protobuf_client, "PICS_REQUEST_MAX_RETRIES", 2)
+    await client.get_apps_info([7])
+    await asyncio.sleep(0.1)
+
+    requests = sent_requests(websocket)
+    assert [[app.appid for app in request.apps] for _, request in requests] == [[7], [7]]
+    assert requests[0][0] != requests[1][0]
+    client.product_info_handler.assert_not_called()
+    client.product_info_failed_handler.assert_called_once_with([], [7])
+    assert not client._pics_batches
+    assert not client._apps_in_flight
+
+
+@pytest.mark.asyncio
+async def test_unknown_and_unanswered_ids_are_resolved(client, websocket):
+    await client.get_apps_info([1, 2])
+    await settle()
+    job_id = sent_requests(websocket)[0][0]
+
+    await client._process_packet(response(job_id, response_pending=True, unknown_appids=[1]))
+    client.product_info_handler.assert_called_once_with([], [(1, UNKNOWN_TYPE, UNKNOWN_TYPE, None, 0)])
+
+    await client._process_packet(response(job_id))
+    client.product_info_handler.assert_called_with([], [(2, UNKNOWN_TYPE, UNKNOWN_TYPE, None, 0)])
+    assert client.product_info_handler.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_missing_token_is_requested_once(client, websocket):
+    await client.get_apps_info([1, 2])
+    await settle()
+    job_id = sent_requests(websocket)[0][0]
+
+    apps = [CMsgClientPICSProductInfoResponse.AppInfo(appid=appid, missing_token=True) for appid in (1, 2)]
+    await client._process_packet(response(job_id, apps=apps))
+    await settle()
+    client.product_info_handler.assert_not_called()
+
+    token_job_id, token_request = sent_requests(websocket, EMsg.ClientPICSAccessTokenRequest, CMsgClientPICSAccessTokenRequest)[0]
+    assert list(token_request.appids) == [1, 2]
+    token_response = CMsgClientPICSAccessTokenResponse(app_denied_tokens=[2])
+    token_response.app_access_tokens.add(appid=1, access_token=123)
+    await client._process_packet(reply(EMsg.ClientPICSAccessTokenResponse, token_job_id, token_response))
+    await settle()
+    client.product_info_handler.assert_called_once_with([], [(2, UNKNOWN_TYPE, UNKNOWN_TYPE, None, 0)])
+
+    job_id, request = sent_requests(websocket)[-1]
+    assert [(app.appid, app.access_token) for app in request.apps] == [(1, 123)]
+    await client._process_packet(response(job_id, apps=apps[:1]))
+    await settle()
+    client.product_info_handler.assert_called_with([], [(1, UNKNOWN_TYPE, UNKNOWN_TYPE, None, 0)])
+    assert len(sent_requests(websocket, EMsg.ClientPICSAccessTokenRequest, CMsgClientPICSAccessTokenRequest)) == 1
+
+
+@pytest.mark.asyncio
+async def test_stored_apps_are_not_requested(client, websocket):
+    client.stored_apps_handler = AsyncMock(return_value={1, 3})
+    await client.get_apps_info([1, 2, 3])
+    await settle()
+    client.stored_apps_handler.assert_called_once_with([1, 2, 3])
+    assert [[app.appid for app in request.apps] for _, request in sent_requests(websocket)] == [[2]]
+
+    await client.get_apps_info([1], refresh=True)
+    await settle()
+    assert [[app.appid for app in request.apps] for _, request in sent_requests(websocket)][1:] == [[1]]
+
+
+@pytest.mark.asyncio
+async def test_apps_are_asked_for_once_until_they_come(client, websocket):
+    await client.get_apps_info([1, 1, 2])
+    await client.get_apps_info([2, 1])
+    await settle()
+    requests = sent_requests(websocket)
+    assert [[app.appid for app in request.apps] for _, request in requests] == [[1, 2]]
+
+    await client._process_packet(response(requests[0][0], unknown_appids=[1, 2]))
+    await client.get_apps_info([2])
+    await settle()
+    assert [[app.appid for app in request.apps] for _, request in sent_requests(websocket)][1:] == [[2]]
@@ -1,3 +1,4 @@
+import asyncio
 from unittest.mock import MagicMock
 
 import pytest
@@ -5,7 +6,16 @@ import websockets
 from galaxy.unittest.mock import AsyncMock
 from websockets.protocol import State
 
+from steam_network.protocol import protobuf_client as protobuf_client_module
+from steam_network.protocol.consts import EMsg
 from steam_network.protocol.protobuf_client import ProtobufClient
+from steam_network.protocol.messages.steammessages_base_pb2 import CMsgProtoBufHeader
+from steam_network.protocol.messages.steammessages_clientserver_pb2 import CMsgClientLicenseList
+from steam_network.protocol.messages.steammessages_clientserver_userstats_pb2 import (
+    CMsgClientGetUserStats,
+    CMsgClientGetUserStatsResponse,
+)
+from tests.tests_steam_network.packets import packet
 
 
 ACCOUNT_NAME = "john"
@@ -22,6 +32,7 @@ PROTOCOL_VERSION = ProtobufClient._MSG_PROTOCOL_VERSION
 CLIENT_PACKAGE_VERSION = ProtobufClient._MSG_CLIENT_PACKAGE_VERSION
 CLIENT_LANGUAGE = "english"
 TWO_FACTOR_TYPE = 'email'
+STEAM_ID = 76561198000000000
 
 
 @pytest.fixture
@@ -83,3 +94,50 @@ async def test_ensure_open_exception(client, socket_state, monkeypatch, mocker):
 
     with pytest.raises((websockets.ConnectionClosedError, websockets.InvalidState)):
         await client._get_obfuscated_private_ip()
+
+
+def license_list_packet(package_ids) -> bytes:
+    message = CMsgClientLicenseList()
+    for package_id in package_ids:
+        message.licenses.add(package_id=package_id, owner_id=STEAM_ID - ProtobufClient._ACCOUNT_ID_MASK)
+    return packet(EMsg.ClientLicenseList, message.SerializeToString())
+
+
+@pytest.mark.asyncio
+async def test_license_packs_are_imported_as_one_list(client, mocker):
+    mocker.patch.object(protobuf_client_module, "LICENSE_PACK_QUIET_PERIOD", 0.05)
+    client.confirmed_steam_id = STEAM_ID
+    client.license_import_handler = AsyncMock()
+
+    await client._process_packet(license_list_packet([1, 2]))
+    await asyncio.sleep(0.01)
+    await client._process_packet(license_list_packet([3]))
+    await asyncio.sleep(0.01)
+    client.license_import_handler.assert_not_called()
+
+    await asyncio.sleep(0.1)
+    client.license_import_handler.assert_called_once()
+    steam_licenses = client.license_import_handler.call_args[0][0]
+    assert [steam_license.license.package_id for steam_license in steam_licenses] == [1, 2, 3]
+    assert not any(steam_license.shared for steam_license in steam_licenses)
+    await client.close(send_log_off=False)
+
+
+@pytest.mark.asyncio
+async def test_game_stats_request_carries_known_schema_version(client):
+    requests = []
+
+    async def send_job(emsg, message, timeout):
+        requests.append(CMsgClientGetUserStats.FromString(message.SerializeToString()))
+        response = CMsgClientGetUserStatsResponse(game_id=message.game_id, eresult=1, crc_stats=message.crc_stats)
+        return CMsgProtoBufHeader(), response.SerializeToString()
+
+    client._send_job = send_job
+    client.stats_handler = MagicMock()
+
+    await client._import_game_stats("10", schema_version=(3, 1234))
+    await client._import_game_stats("20")
+
+    assert [(r.game_id, r.schema_local_version, r.crc_stats) for r in requests] == [(10, 3, 1234), (20, 0, 0)]
+    #no schema in the response, the one we have is current
+    assert client.stats_handler.call_args_list[0][0][3:] == (None, 1234)
@@ -11,7 +11,9 @@ from galaxy.api.errors import AccessDenied, Banned, BackendNotAvailable
 from steam_network.protocol.protobuf_client import SteamLicense
 from steam_network.protocol.consts import EFriendRelationship, STEAM_CLIENT_APP_ID, EResult
 from steam_network.protocol_client import ProtocolClient
+from steam_network.stats_cache import AchievementSchema
 from steam_network.protocol.steam_types import ProtoUserInfo
+from steam_network.protocol.messages.steammessages_clientserver_appinfo_pb2 import CMsgClientPICSChangesSinceResponse
 
 
 class ProtoResponse(NamedTuple):
@@ -41,7 +43,10 @@ def friends_cache():
 
 @pytest.fixture()
 def games_cache():
-    return MagicMock()
+    games_cache_ = MagicMock()
+    games_cache_.wait_loaded = AsyncMock()
+    games_cache_.stored_apps_change_number = AsyncMock(return_value=None)
+    return games_cache_
 
 @pytest.fixture()
 def stats_cache():
@@ -193,12 +198,116 @@ async def test_license_import(client):
     licenses_to_check = [SteamLicense(ProtoResponse(123), False),
                         SteamLicense(ProtoResponse(321), True)]
     client._protobuf_client.get_packages_info = AsyncMock()
+    client._protobuf_client.get_product_changes = AsyncMock(return_value=(EResult.OK, CMsgClientPICSChangesSinceResponse(current_change_number=5)))
+    client._games_cache.change_number = 0
+    client._games_cache.reconcile_licenses.return_value = (licenses_to_check[1:], set())
+    await client._license_import_handler(licenses_to_check)
+
+    client._games_cache.reset_storing_map.assert_not_called()
+    client._games_cache.reconcile_licenses.assert_called_once_with(licenses_to_check, {}, {})
+    client._protobuf_client.get_packages_info.assert_called_once_with(licenses_to_check[1:])
+    client._games_cache.set_change_number_when_ready.assert_called_once_with(5)
+
+
+@pytest.mark.asyncio
+async def test_license_import_refreshes_changed_products(client):
+    licenses_to_check = [SteamLicense(ProtoResponse(123), False),
+                        SteamLicense(ProtoResponse(321), True)]
+    changes = CMsgClientPICSChangesSinceResponse(since_change_number=5, current_change_number=9)
+    changes.package_changes.add(packageid=321, change_number=7)
+    changes.app_changes.add(appid=10, change_number=8)
+    client._protobuf_client.get_packages_info = AsyncMock()
+    client._protobuf_client.get_apps_info = AsyncMock()
+    client._protobuf_client.get_product_changes = AsyncMock(return_value=(EResult.OK, changes))
+    client._games_cache.change_number = 5
+    client._games_cache.reconcile_licenses.return_value = (licenses_to_check[1:], {10})
+    await client._license_import_handler(licenses_to_check)
+
+    client._games_cache.reset_storing_map.assert_not_called()
+    client._games_cache.reconcile_licenses.assert_called_once_with(licenses_to_check, {321: 7}, {10: 8})
+    client._protobuf_client.get_packages_info.assert_called_once_with(licenses_to_check[1:])
+    client._protobuf_client.get_apps_info.assert_called_once_with([10], refresh=True)
+    client._games_cache.set_change_number_when_ready.assert_called_once_with(9)
+
+
+@pytest.mark.asyncio
+async def test_license_import_resets_when_changes_are_too_old(client):
+    licenses_to_check = [SteamLicense(ProtoResponse(123), False)]
+    client._protobuf_client.get_packages_info = AsyncMock()
+    client._protobuf_client.get_product_changes = AsyncMock(
+        return_value=(EResult.OK, CMsgClientPICSChangesSinceResponse(current_change_number=9, force_full_update=True))
+    )
+    client._games_cache.change_number = 5
+    client._games_cache.reconcile_licenses.return_value = (licenses_to_check, set())
     await client._license_import_handler(licenses_to_check)
 
     client._games_cache.reset_storing_map.assert_called_once()
     client._protobuf_client.get_packages_info.assert_called_once_with(licenses_to_check)
 
 
+@pytest.mark.asyncio
+async def test_license_import_expires_stored_apps_first(client):
+    changes = CMsgClientPICSChangesSinceResponse(since_change_number=5, current_change_number=9)
+    changes.app_changes.add(appid=10, change_number=8)
+    client._protobuf_client.get_packages_info = AsyncMock(
+        side_effect=lambda _: client._games_cache.expire_stored_apps.assert_called_once_with({10: 8}, 9, False)
+    )
+    client._protobuf_client.get_product_changes = AsyncMock(return_value=(EResult.OK, changes))
+    client._games_cache.change_number = 5
+    client._games_cache.stored_apps_change_number.return_value = 5
+    client._games_cache.reconcile_licenses.return_value = ([], set())
+    await client._license_import_handler([])
+
+    client._protobuf_client.get_product_changes.assert_called_once()
+    client._protobuf_client.get_packages_info.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_new_account_expires_stored_apps_since_the_store_change_number(client):
+    changes = CMsgClientPICSChangesSinceResponse(since_change_number=5, current_change_number=9)
+    changes.app_changes.add(appid=10, change_number=8)
+    client._protobuf_client.get_packages_info = AsyncMock()
+    client._protobuf_client.get_product_changes = AsyncMock(side_effect=[
+        (EResult.OK, CMsgClientPICSChangesSinceResponse(current_change_number=9, force_full_update=True)),
+        (EResult.OK, changes),
+    ])
+    client._games_cache.change_number = 0
+    client._games_cache.stored_apps_change_number.return_value = 5
+    client._games_cache.reconcile_licenses.return_value = ([], set())
+    await client._license_import_handler([])
+
+    assert [call.args[0] for call in client._protobuf_client.get_product_changes.call_args_list] == [0, 5]
+    client._games_cache.expire_stored_apps.assert_called_once_with({10: 8}, 9, False)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("store_change_number, changes", [
+    (0, CMsgClientPICSChangesSinceResponse(since_change_number=5, current_change_number=9)),
+    (5, CMsgClientPICSChangesSinceResponse(current_change_number=9, force_full_app_update=True)),
+])
+async def test_stored_apps_all_expire_when_their_changes_are_unknown(client, store_change_number, changes):
+    client._protobuf_client.get_packages_info = AsyncMock()
+    client._protobuf_client.get_product_changes = AsyncMock(return_value=(EResult.OK, changes))
+    client._games_cache.change_number = 5
+    client._games_cache.stored_apps_change_number.return_value = store_change_number
+    client._games_cache.reconcile_licenses.return_value = ([], set())
+    await client._license_import_handler([])
+
+    client._games_cache.expire_stored_apps.assert_called_once_with({}, 9, True)
+
+
+@pytest.mark.asyncio
+async def test_stored_apps_stay_unused_without_changes(client):
+    client._protobuf_client.get_packages_info = AsyncMock()
+    client._protobuf_client.get_product_changes = AsyncMock(return_value=(EResult.Timeout, None))
+    client._games_cache.change_number = 5
+    client._games_cache.stored_apps_change_number.return_value = 5
+    client._games_cache.reconcile_licenses.return_value = ([], set())
+    await client._license_import_handler([])
+
+    client._games_cache.expire_stored_apps.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_register_cm_token(client, ownership_ticket_cache):
     ticket = 'ticket_mock'
@@ -356,3 +465,35 @@ async def test_stats_handler_for_not_matching_schema(client, stats_cache):
             "unlock_time": 1569999999,
         }
     ])
+
+
+@pytest.mark.asyncio
+async def test_stats_handler_keeps_schema_steam_sent(client, stats_cache):
+    game_id = "1072390"
+    schema = {game_id: {"stats": {"1": {"bits": {"0": {"display": {"name": "Get Eaten"}}}}}, "version": "3"}}
+
+    client._stats_handler(game_id, Mock(), [], schema, 1234)
+    stats_cache.set_schema.assert_called_once_with(game_id, AchievementSchema(3, 1234, {"1": {"0": "Get Eaten"}}))
+
+
+@pytest.mark.asyncio
+async def test_stats_handler_uses_known_schema_when_steam_sends_none(client, stats_cache):
+    stats = Mock()
+    game_id = "1072390"
+    stats_cache.get_schema.return_value = AchievementSchema(3, 1234, {"1": {"0": "Get Eaten"}})
+    achievement_blocks = [AchievementBlock(achievement_id=1, unlock_time=[1511111111])]
+
+    client._stats_handler(game_id, stats, achievement_blocks, None, 1234)
+    stats_cache.get_schema.assert_called_once_with(game_id)
+    stats_cache.set_schema.assert_not_called()
+    stats_cache.update_stats.assert_called_once_with(game_id, stats, [
+        {'id': 0, 'unlock_time': 1511111111, 'name': "Get Eaten"},
+    ])
+
+
+@pytest.mark.asyncio
+async def test_import_game_stats_sends_known_schema_versions(client, protobuf_client, stats_cache):
+    stats_cache.load_schemas = AsyncMock(return_value={"10": AchievementSchema(3, 1234, {})})
+
+    await client.import_game_stats(["10", "20"])
+    protobuf_client.import_game_stats.assert_called_once_with(["10", "20"], {"10": (3, 1234)})
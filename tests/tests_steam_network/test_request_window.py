@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from steam_network.protocol.consts import EResult
+from steam_network.protocol.request_window import RequestWindow
+
+
+def request(result=EResult.OK, started=None, release: asyncio.Event = None):
+    async def function():
+        if started is not None:
+            started.append(function)
+        if release is not None:
+            await release.wait()
+        return result
+    return function
+
+
+@pytest.mark.asyncio
+async def test_window_limits_requests_in_flight():
+    window = RequestWindow(initial_size=2)
+    release = asyncio.Event()
+    started = []
+    for _ in range(5):
+        window.submit(request(started=started, release=release))
+    await asyncio.sleep(0)
+
+    assert len(started) == 2
+    assert window.in_flight == 2
+    assert window.queue_depth == 3
+
+    release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert len(started) == 5
+    assert window.in_flight == 0
+    assert window.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_window_grows_on_fast_replies():
+    window = RequestWindow(initial_size=2, max_size=3)
+    for _ in range(20):
+        window.submit(request())
+    for _ in range(50):
+        await asyncio.sleep(0)
+    assert window.window_size == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("result", [EResult.RateLimitExceeded, EResult.LimitExceeded])
+async def test_window_shrinks_on_rate_limit(result):
+    window = RequestWindow(initial_size=8)
+    window.submit(request(result))
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert window.window_size == 4
+
+
+@pytest.mark.asyncio
+async def test_window_shrinks_on_timeout():
+    async def timing_out():
+        raise asyncio.TimeoutError()
+
+    window = RequestWindow(initial_size=8)
+    window.submit(timing_out)
+    for _ in range(3):
+        await asyncio.sleep(0)
+    assert window.window_size == 4
+
+
+@pytest.mark.asyncio
+async def test_window_shrinks_once_per_burst():
+    window = RequestWindow(initial_size=8, min_size=1)
+    release = asyncio.Event()
+    for _ in range(4):
+        window.submit(request(EResult.RateLimitExceeded, release=release))
+    await asyncio.sleep(0)
+    release.set()
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert window.window_size == 4
+
+
+@pytest.mark.asyncio
+async def test_window_shrinks_on_slow_replies():
+    window = RequestWindow(initial_size=4, target_latency=0)
+    window.submit(request(release=asyncio.Event()))
+    window.submit(request())
+    for _ in range(3):
+        await asyncio.sleep(0.01)
+    assert window.window_size == 2
+
+
+@pytest.mark.asyncio
+async def test_close_drops_queue_and_cancels_requests():
+    window = RequestWindow(initial_size=1)
+    window.submit(request(release=asyncio.Event()))
+    window.submit(request())
+    await asyncio.sleep(0)
+    window.close()
+    assert window.in_flight == 0
+    assert window.queue_depth == 0
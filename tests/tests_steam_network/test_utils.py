@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from steam_network.utils import time_sliced
+
+
+async def count_loop_turns(turns: list):
+    while True:
+        await asyncio.sleep(0)
+        turns[0] += 1
+
+
+async def consume_while_counting(items):
+    turns = [0]
+    counter = asyncio.ensure_future(count_loop_turns(turns))
+    await asyncio.sleep(0)
+    turns[0] = 0
+    consumed = [item async for item in items]
+    counter.cancel()
+    return consumed, turns[0]
+
+
+@pytest.mark.asyncio
+async def test_time_sliced_keeps_the_loop_within_budget():
+    consumed, turns = await consume_while_counting(time_sliced(range(1000), budget=60))
+    assert consumed == list(range(1000))
+    assert turns == 0
+
+
+@pytest.mark.asyncio
+async def test_time_sliced_gives_way_once_budget_is_spent():
+    consumed, turns = await consume_while_counting(time_sliced(range(10), budget=0))
+    assert consumed == list(range(10))
+    assert turns >= 9